@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from gazetteer import normalizar_texto
+
+# Caché en memoria de respuestas humanizadas de /ask, por pregunta normalizada
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+# Cada cuánto (segundos) se consulta la versión de los datos para invalidar la caché
+ANSWER_CACHE_VERSION_CHECK = int(os.environ.get("ANSWER_CACHE_VERSION_CHECK", "60"))
+
+
+class CacheRespuestas:
+    """
+    Caché LRU con TTL. Se vacía completa cuando cambia la versión de los datos
+    (obtener_version es una función que regresa cualquier valor comparable).
+    """
+
+    def __init__(self, obtener_version=None, ttl=ANSWER_CACHE_TTL,
+                 max_entradas=ANSWER_CACHE_MAX_ENTRIES, intervalo_version=ANSWER_CACHE_VERSION_CHECK):
+        self.obtener_version = obtener_version
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.intervalo_version = intervalo_version
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._ultima_verificacion = 0.0
+
+    def llave(self, pregunta, coordenadas=None):
+        llave = normalizar_texto(pregunta)
+        if coordenadas:
+            # ~100 m: la misma dirección escrita distinto resuelve a casi el mismo punto
+            lat, lon = coordenadas
+            llave += f"@{round(lat, 3)},{round(lon, 3)}"
+        return llave
+
+    def _verificar_version(self):
+        # La consulta a la base va fuera del lock: las demás preguntas siguen leyendo la caché
+        # mientras tanto, y solo el hilo que aparta la verificación la hace
+        ahora = time.time()
+        with self._lock:
+            if self.obtener_version is None or ahora - self._ultima_verificacion < self.intervalo_version:
+                return
+            self._ultima_verificacion = ahora
+        try:
+            version = self.obtener_version()
+        except Exception as e:
+            print(f"⚠️  No se pudo obtener la versión de los datos: {e}")
+            return
+        with self._lock:
+            if self._version is not None and version != self._version:
+                print("🔄 Datos actualizados, vaciando caché de respuestas")
+                self._entradas.clear()
+                self.invalidaciones += 1
+            self._version = version
+
+    def obtener(self, llave):
+        self._verificar_version()
+        with self._lock:
+            entrada = self._entradas.get(llave)
+            if entrada is None or time.time() - entrada[1] > self.ttl:
+                if entrada is not None:
+                    del self._entradas[llave]
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(llave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, llave, respuesta):
+        with self._lock:
+            self._entradas[llave] = (respuesta, time.time())
+            self._entradas.move_to_end(llave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            'hits': self.aciertos,
+            'misses': self.fallos,
+            'hit_ratio': round(self.aciertos / consultas, 4) if consultas else 0.0,
+            'entries': len(self._entradas),
+            'invalidations': self.invalidaciones,
+            'ttl_seconds': self.ttl
+        }
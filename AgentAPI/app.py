@@ -1,60 +1,84 @@
 import json
-import re
-import os
-from flask import Flask, render_template, request, jsonify
-from sqlalchemy import create_engine, text
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits import create_sql_agent
-from langchain_openai import ChatOpenAI
-from geopy.geocoders import Nominatim
-
-AURORA_HOST = "amg-traffic-cluster.cluster-clss68yoix1c.us-east-2.rds.amazonaws.com"
-AURORA_DB = "postgres"
-DB_USER = "root"
-DB_PASS = "rootroot"
-DB_PORT = 5432
-OPENAI_API_KEY = "<INSERT_KEY>"
-
-app = Flask(__name__)
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Blueprint, Flask, Response, render_template, request, jsonify
+from sqlalchemy import text
+from recursos import Recursos, MAX_CONCURRENT_QUESTIONS, QUEUE_WAIT, BATCH_CONCURRENCY, BATCH_MAX_QUESTIONS
+from geocodificacion import (LimitadorTasa, ResolutorDirecciones, BusquedasCompartidas, BusquedasPendientes,
+                             GEOCODE_FORWARD_WAIT)
+from gazetteer import normalizar_texto
+from metricas import registro, Medidor, Traza, CONSULTAS_SQL, GEOCODIFICACION, contar_filas
+from rejilla import celdas_vecinas
+from humanizador import tokenizar, coordenadas_en, reescribir
+from router import responder_con_plantilla
+from guardia_sql import fuera_del_bucle
 
 print("🚀 Initializing AMG Traffic Data Assistant...")
 
-print(f"📊 Connecting to database: {AURORA_HOST}")
-engine = create_engine(
-    f"postgresql://{DB_USER}:{DB_PASS}@{AURORA_HOST}:{DB_PORT}/{AURORA_DB}?sslmode=require",
-    pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10
-)
-print("✅ Database engine created")
-
-db = SQLDatabase(engine)
-print("✅ SQL Database wrapper initialized")
-
-print("🤖 Setting up LLM agent with OpenAI...")
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0,
-    openai_api_key=OPENAI_API_KEY
-)
-
-agent_executor = create_sql_agent(
-    llm=llm,
-    db=db,
-    agent_type="openai-tools",
-    verbose=True,
-    max_iterations=10,
-    handle_parsing_errors=True
-)
-print("✅ LLM agent ready")
-
-print("🗺️  Setting up geocoding service...")
-geolocator = Nominatim(user_agent="amg_traffic_app")
-print("✅ Geocoder ready")
-
-def obtener_direccion_desde_coordenadas(lat, lon):
+# La base, el agente y el geocodificador se crean con la primera pregunta (ver recursos.py)
+recursos = Recursos()
+limitador_nominatim = LimitadorTasa()
+busquedas_inversas = BusquedasCompartidas()
+busquedas_directas = BusquedasCompartidas()
+rutas = Blueprint('asistente', __name__)
+
+INSTRUCCIONES_RESUMEN = """
+        VISTAS RESUMEN (USA ESTAS PRIMERO - son cientos de filas en lugar de millones):
+        - traffic_por_color (predominant_color, cantidad, avg_exponential_color_weighting, avg_linear_color_weighting): totales por color de todo el histórico
+        - traffic_por_sensor (id, predominant_color, coordx, coordy, grid_cell, cantidad, avg_exponential_color_weighting, avg_linear_color_weighting): totales por ubicación y color
+        - traffic_por_celda (grid_cell, predominant_color, coordx, coordy, cantidad, avg_exponential_color_weighting, avg_linear_color_weighting): totales por celda de 0.01° (coordx/coordy es el centro de la celda)
+        - traffic_por_hora (bucket, hora, dia_semana, predominant_color, cantidad, avg_exponential_color_weighting, avg_linear_color_weighting): totales por hora; dia_semana 1=lunes ... 7=domingo
+        - Ejemplos con vistas:
+          * "¿Distribución del tráfico?" -> SELECT predominant_color, cantidad FROM traffic_por_color ORDER BY cantidad DESC
+          * "¿Cuántos puntos con tráfico pesado?" -> SELECT SUM(cantidad) FROM traffic_por_color WHERE predominant_color IN ('red', 'red_wine')
+          * "¿Promedio de congestión por color?" -> SELECT predominant_color, avg_exponential_color_weighting FROM traffic_por_color
+          * "¿Dónde está el PEOR tráfico?" -> SELECT coordx, coordy, SUM(cantidad) AS veces FROM traffic_por_sensor WHERE predominant_color IN ('red_wine', 'red') GROUP BY coordx, coordy ORDER BY veces DESC LIMIT 20
+          * "¿Cómo está el tráfico en hora pico?" -> SELECT predominant_color, SUM(cantidad) FROM traffic_por_hora WHERE hora BETWEEN 7 AND 9 GROUP BY predominant_color
+          * "¿Tráfico cerca de un punto?" -> SELECT predominant_color, SUM(cantidad) FROM traffic_por_celda WHERE grid_cell IN (...) GROUP BY predominant_color
+        - Usa traffic_data solo cuando necesites un rango de fechas específico o un detalle que las vistas no tengan
+"""
+
+def instrucciones_resumen():
+    return INSTRUCCIONES_RESUMEN if recursos.vistas_disponibles else ""
+
+def obtener_direccion_desde_coordenadas(lat, lon, limite=None):
+    """
+    Gazetteer local, luego caché y al final Nominatim (respetando su límite de tasa).
+    Si no hay turno para Nominatim antes de `limite` (time.monotonic()) regresa None y
+    el punto se resuelve después en segundo plano.
+    """
+    if recursos.gazetteer is not None:
+        direccion_local = recursos.gazetteer.direccion_cercana(lat, lon)
+        if direccion_local:
+            GEOCODIFICACION.incrementar(direction='reverse', source='gazetteer')
+            return direccion_local
+    
+    encontrada, direccion_cache = recursos.cache_geocodificacion.obtener(lat, lon)
+    if encontrada:
+        GEOCODIFICACION.incrementar(direction='reverse', source='cache')
+        return direccion_cache
+    
+    # Si otra pregunta ya está buscando la misma celda, se espera su resultado
+    direccion, compartida = busquedas_inversas.ejecutar(
+        recursos.cache_geocodificacion.llave(lat, lon),
+        lambda: direccion_nominatim(lat, lon, limite),
+        limite
+    )
+    if compartida:
+        GEOCODIFICACION.incrementar(direction='reverse', source='shared')
+    return direccion
+
+def direccion_nominatim(lat, lon, limite=None):
+    if not limitador_nominatim.adquirir(limite):
+        GEOCODIFICACION.incrementar(direction='reverse', source='rate_limited')
+        busquedas_pendientes.agregar(recursos.cache_geocodificacion.llave(lat, lon), lat, lon)
+        return None
+    GEOCODIFICACION.incrementar(direction='reverse', source='nominatim')
+    
     try:
-        ubicacion = geolocator.reverse(f"{lat}, {lon}", language="es", timeout=10)
+        ubicacion = recursos.geolocator.reverse(f"{lat}, {lon}", language="es", timeout=10)
+        resultado = None
         if ubicacion:
             direccion = ubicacion.raw.get('address', {})
             
@@ -70,23 +94,60 @@ def obtener_direccion_desde_coordenadas(lat, lon):
             elif 'town' in direccion:
                 partes.append(direccion['town'])
             
-            return ', '.join(partes) if partes else ubicacion.address
-        return None
+            resultado = ', '.join(partes) if partes else ubicacion.address
+        
+        # Los errores de red no se guardan, solo las respuestas reales de Nominatim
+        recursos.cache_geocodificacion.guardar(lat, lon, resultado)
+        return resultado
     except Exception as e:
         print(f"Error de geocodificación: {e}")
+        GEOCODIFICACION.incrementar(direction='reverse', source='error')
         return None
 
+resolutor_direcciones = ResolutorDirecciones(obtener_direccion_desde_coordenadas)
+# Sin `limite`: la búsqueda espera su turno en limitador_nominatim y guarda el resultado en la caché
+busquedas_pendientes = BusquedasPendientes(obtener_direccion_desde_coordenadas)
+
 def obtener_coordenadas_desde_direccion(consulta_direccion):
-    try:
-        ubicacion = geolocator.geocode(consulta_direccion, timeout=10)
-        if ubicacion:
-            return (ubicacion.latitude, ubicacion.longitude)
+    if recursos.gazetteer is not None:
+        coordenadas_locales = recursos.gazetteer.buscar_direccion(consulta_direccion)
+        if coordenadas_locales:
+            GEOCODIFICACION.incrementar(direction='forward', source='gazetteer')
+            return coordenadas_locales
+    
+    llave = normalizar_texto(consulta_direccion)
+    encontrada, coordenadas_cache = recursos.cache_geocodificacion.obtener_directa(llave)
+    if encontrada:
+        GEOCODIFICACION.incrementar(direction='forward', source='cache')
+        return coordenadas_cache
+    
+    limite = time.monotonic() + GEOCODE_FORWARD_WAIT
+    coordenadas, compartida = busquedas_directas.ejecutar(
+        llave,
+        lambda: coordenadas_nominatim(consulta_direccion, llave, limite),
+        limite
+    )
+    if compartida:
+        GEOCODIFICACION.incrementar(direction='forward', source='shared')
+    return coordenadas
+
+def coordenadas_nominatim(consulta_direccion, llave, limite=None):
+    if not limitador_nominatim.adquirir(limite):
+        GEOCODIFICACION.incrementar(direction='forward', source='rate_limited')
         return None
+    GEOCODIFICACION.incrementar(direction='forward', source='nominatim')
+    try:
+        ubicacion = recursos.geolocator.geocode(consulta_direccion, timeout=10)
+        coordenadas = (ubicacion.latitude, ubicacion.longitude) if ubicacion else None
+        # Como en la inversa, solo se guardan respuestas reales de Nominatim
+        recursos.cache_geocodificacion.guardar_directa(llave, coordenadas)
+        return coordenadas
     except Exception as e:
         print(f"Error de geocodificación directa: {e}")
+        GEOCODIFICACION.incrementar(direction='forward', source='error')
         return None
 
-def detectar_y_convertir_direccion_en_pregunta(pregunta):
+def detectar_coordenadas_en_pregunta(pregunta):
     palabras_clave_direccion = [
         'calle', 'avenida', 'en ', 'bulevar', 'boulevard',
         'callejón', 'callejuela', 'paseo', 'plaza', 'plazuela',
@@ -103,13 +164,24 @@ def detectar_y_convertir_direccion_en_pregunta(pregunta):
     tiene_palabra_clave_direccion = any(palabra_clave in pregunta_minusculas for palabra_clave in palabras_clave_direccion)
     
     if tiene_palabra_clave_direccion:
-        coordenadas = obtener_coordenadas_desde_direccion(pregunta)
-        
-        if coordenadas:
-            lat, lon = coordenadas
-            return f"{pregunta}\n\nNOTA: La dirección corresponde aproximadamente a latitud {lat} y longitud {lon}. Busca datos de tráfico con coordx cerca de {lat} y coordy cerca de {lon} (dentro de un radio de 0.01 grados)."
+        return obtener_coordenadas_desde_direccion(pregunta)
+    
+    return None
+
+def agregar_nota_coordenadas(pregunta, coordenadas):
+    if not coordenadas:
+        return pregunta
     
-    return pregunta
+    lat, lon = coordenadas
+    celdas = ', '.join(str(c) for c in celdas_vecinas(lat, lon))
+    return (
+        f"{pregunta}\n\nNOTA: La dirección corresponde aproximadamente a latitud {lat} y longitud {lon}. "
+        f"Busca datos de tráfico con coordx cerca de {lon} y coordy cerca de {lat} (dentro de un radio de 0.01 grados). "
+        f"Para que la consulta use el índice espacial, agrega también: grid_cell IN ({celdas})"
+    )
+
+def detectar_y_convertir_direccion_en_pregunta(pregunta):
+    return agregar_nota_coordenadas(pregunta, detectar_coordenadas_en_pregunta(pregunta))
 
 def enriquecer_resultados_con_direcciones(resultado_consulta):
     try:
@@ -128,108 +200,69 @@ def enriquecer_resultados_con_direcciones(resultado_consulta):
         print(f"Error enriqueciendo resultados: {e}")
         return resultado_consulta
 
-def humanizar_respuesta_agente(respuesta_agente):
+def humanizar_por_partes(respuesta_agente):
     """
-    Post-procesa la respuesta del agente para convertir coordenadas e IDs técnicos
-    a nombres de zonas y direcciones legibles.
+    Generador: emite ('direccion', {...}) por cada dirección en cuanto se resuelve
+    y al final ('humanizada', texto) con la respuesta completa.
     """
     print("🗺️  Humanizando respuesta con nombres de zonas...")
     
     try:
-        humanizada = respuesta_agente
+        piezas = tokenizar(respuesta_agente)
+        coordenadas_encontradas = coordenadas_en(piezas)
         
-        # Patrón para detectar coordenadas en varios formatos
-        # Formato: "coordx: -103.xxx, coordy: 20.xxx" o "(-103.xxx, 20.xxx)" o "longitud: -103.xxx, latitud: 20.xxx"
-        patrones_coordenadas = [
-            r'coordx[:\s]+([-\d.]+)[,\s]+coordy[:\s]+([-\d.]+)',
-            r'\(([-\d.]+)[,\s]+([-\d.]+)\)',
-            r'longitud[:\s]+([-\d.]+)[,\s]+latitud[:\s]+([-\d.]+)',
-            r'lon[:\s]+([-\d.]+)[,\s]+lat[:\s]+([-\d.]+)'
-        ]
-        
-        coordenadas_encontradas = set()
-        for patron in patrones_coordenadas:
-            coincidencias = re.finditer(patron, humanizada, re.IGNORECASE)
-            for coincidencia in coincidencias:
-                lon = float(coincidencia.group(1))
-                lat = float(coincidencia.group(2))
-                # Asegurarse de que sean coordenadas válidas para Guadalajara
-                if -103.6 < lon < -103.0 and 20.4 < lat < 20.9:
-                    coordenadas_encontradas.add((lon, lat, coincidencia.group(0)))
-        
-        # Convertir cada par de coordenadas a dirección
+        # Convertir las coordenadas a direcciones en paralelo (puntos casi iguales se buscan una vez)
         reemplazos = {}
-        for lon, lat, texto_original in coordenadas_encontradas:
-            direccion = obtener_direccion_desde_coordenadas(lat, lon)
+        for (lat, lon), direccion in resolutor_direcciones.resolver_a_medida(coordenadas_encontradas):
             if direccion:
                 # Crear una versión humanizada
                 texto_zona = f"📍 {direccion}"
-                reemplazos[texto_original] = texto_zona
                 print(f"   ✅ Traducido: ({lon}, {lat}) -> {direccion}")
+                for texto_original in coordenadas_encontradas[(lat, lon)]:
+                    reemplazos[texto_original] = texto_zona
+                    yield 'direccion', {'original': texto_original, 'direccion': texto_zona}
         
-        # Aplicar reemplazos
-        for original, reemplazo in reemplazos.items():
-            humanizada = humanizada.replace(original, reemplazo)
-        
-        # Remover o humanizar IDs técnicos si aparecen explícitamente
-        # Patrón para "id: abc123" o "ID: abc123"
-        patron_id = r'id[:\s]+[\w-]+'
-        coincidencias_id = re.finditer(patron_id, humanizada, re.IGNORECASE)
-        for coincidencia in coincidencias_id:
-            # Los IDs no son útiles para humanos, intentar removerlos o contextualizarlos
-            if "id:" in coincidencia.group(0).lower():
-                humanizada = humanizada.replace(coincidencia.group(0), "(ubicación)")
-        
-        # Mejorar términos técnicos
-        reemplazos_tecnicos = {
-            'exponential_color_weighting': 'nivel de congestión',
-            'linear_color_weighting': 'índice de tráfico',
-            'predominant_color': 'estado del tráfico',
-            'coordx': 'longitud',
-            'coordy': 'latitud',
-            'red_wine': '🍷 MUY PESADO (congestión crítica)',
-            'green': '🟢 LIGERO (fluido)',
-            'yellow': '🟡 MEDIO (moderado)',
-            'orange': '🟠 MEDIO-ALTO (algo congestionado)',
-            'red': '🔴 PESADO (muy congestionado)'
-        }
-        
-        for termino_tecnico, termino_humano in reemplazos_tecnicos.items():
-            humanizada = re.sub(r'\b' + termino_tecnico + r'\b', termino_humano, humanizada, flags=re.IGNORECASE)
+        # Aplicar reemplazos, ids y términos técnicos en una sola pasada
+        humanizada = reescribir(piezas, reemplazos)
         
         print(f"   ✅ Respuesta humanizada completada")
-        return humanizada
+        yield 'humanizada', humanizada
         
     except Exception as e:
         print(f"   ⚠️  Error al humanizar respuesta: {e}")
-        return respuesta_agente
+        yield 'humanizada', respuesta_agente
+
+def humanizar_respuesta_agente(respuesta_agente):
+    """
+    Post-procesa la respuesta del agente para convertir coordenadas e IDs técnicos
+    a nombres de zonas y direcciones legibles.
+    """
+    for evento, datos in humanizar_por_partes(respuesta_agente):
+        if evento == 'humanizada':
+            return datos
+    return respuesta_agente
 
-@app.route('/')
+@rutas.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/ask', methods=['POST'])
-def preguntar():
-    try:
-        datos = request.get_json()
-        pregunta = datos.get('question', '').strip()
-        
-        print(f"\n{'='*60}")
-        print(f"📥 Nueva pregunta recibida: '{pregunta}'")
-        print(f"{'='*60}")
-        
-        if not pregunta:
-            print("❌ Pregunta vacía recibida")
-            return jsonify({'error': 'No se proporcionó ninguna pregunta'}), 400
-        
-        print("🔍 Verificando si hay dirección en la pregunta...")
-        pregunta_con_coordenadas = detectar_y_convertir_direccion_en_pregunta(pregunta)
-        if pregunta_con_coordenadas != pregunta:
-            print("✅ Dirección detectada y convertida a coordenadas")
-        else:
-            print("ℹ️  No se detectó dirección, procediendo con la pregunta original")
-        
-        pregunta_mejorada = f"""
+def responder_plantilla(pregunta, coordenadas):
+    # Primero la base local (si está vigente) y, si falla, Aurora
+    motor = recursos.motor_lectura()
+    if motor is not recursos.engine:
+        try:
+            # DuckDB no cede el control a gevent: se consulta desde un hilo del sistema
+            plantilla = fuera_del_bucle(responder_con_plantilla, motor, pregunta, coordenadas)
+            CONSULTAS_SQL.incrementar(backend='local')
+            return plantilla
+        except Exception as e:
+            print(f"   ↩️  La base local no pudo responder la plantilla, se usa Aurora: {e}")
+            CONSULTAS_SQL.incrementar(backend='local_fallback')
+    CONSULTAS_SQL.incrementar(backend='aurora')
+    return responder_con_plantilla(recursos.engine, pregunta, coordenadas)
+
+def construir_prompt(pregunta_con_coordenadas):
+    return f"""
         Estás analizando datos de tráfico del Área Metropolitana de Guadalajara (AMG), México.
         
         Tienes acceso a una tabla llamada 'traffic_data' con estas columnas:
@@ -246,10 +279,13 @@ def preguntar():
         - diffuse_logic_traffic (FLOAT): valor difuso (NO es relevante, ignóralo)
         - coordx (FLOAT): coordenada de LONGITUD (aproximadamente -103.2 a -103.5 para Guadalajara)
         - coordy (FLOAT): coordenada de LATITUD (aproximadamente 20.5 a 20.8 para Guadalajara)
+        - captured_at (TIMESTAMP): fecha y hora local (Guadalajara) en que se tomó la medición. La tabla está particionada por mes sobre esta columna.
+        - grid_cell (INTEGER): celda precalculada de 0.01° (indexada) que contiene el punto; úsala junto con el rango de coordenadas cuando se te indique
         
         IMPORTANTE: 
         - Las coordenadas están en formato (longitud, latitud). Coordx es longitud (oeste de Greenwich, valores negativos) y Coordy es latitud.
         - Al buscar por coordenadas, usa una consulta de rango como: WHERE coordx BETWEEN (lon-0.01) AND (lon+0.01) AND coordy BETWEEN (lat-0.01) AND (lat+0.01)
+        - Si la pregunta trae una lista de celdas grid_cell, agrégala al WHERE (grid_cell IN (...)) además del rango de coordenadas
         - SIEMPRE incluye las coordenadas (coordx y coordy) en tu respuesta cuando devuelvas datos de ubicaciones.
         - NO incluyas IDs en tu respuesta, no son útiles para humanos.
         
@@ -269,10 +305,14 @@ def preguntar():
           * "¿Dónde está el MEJOR tráfico?" -> SELECT coordx, coordy FROM traffic_data WHERE predominant_color = 'green' LIMIT 20
           * "¿Promedio de congestión en esta zona?" -> SELECT AVG(exponential_color_weighting), predominant_color FROM traffic_data WHERE ... GROUP BY predominant_color
           * "¿Distribución del tráfico?" -> SELECT predominant_color, COUNT(*) as cantidad FROM traffic_data GROUP BY predominant_color ORDER BY cantidad DESC
+          * "¿Cómo está el tráfico en hora pico?" -> SELECT predominant_color, COUNT(*) as cantidad FROM traffic_data WHERE EXTRACT(HOUR FROM captured_at) BETWEEN 7 AND 9 GROUP BY predominant_color
+          * "¿Tráfico de esta semana / de enero?" -> filtra SIEMPRE con un rango explícito: WHERE captured_at >= '2025-01-01' AND captured_at < '2025-02-01'
+        - Cuando la pregunta mencione fechas, meses o semanas, usa un rango sobre captured_at (>= inicio AND < fin) para que solo se lean las particiones necesarias; no apliques funciones a captured_at en ese filtro
         - Solo trae filas individuales cuando el usuario pida ubicaciones específicas o "dónde está..."
         - Si el usuario pregunta "cómo está el tráfico en X", usa agregaciones para dar un resumen general, no listados completos
         - Entre traer 50 filas o hacer un GROUP BY que devuelva 3 filas, SIEMPRE elige el GROUP BY
         
+        {instrucciones_resumen()}
         Pregunta del usuario: {pregunta_con_coordenadas}
         
         Por favor proporciona una respuesta clara y concisa en español. 
@@ -285,22 +325,175 @@ def preguntar():
         - tráfico muy pesado/crítico (red_wine - EL PEOR)
         Recuerda: Prefiere agregaciones y GROUP BY sobre listados completos. LIMIT 50 (o menos) en todas las consultas SQL.
         """
+
+# Salidas del agente que no son una respuesta: AgentExecutor las regresa como "output" al
+# llegar a max_iterations o max_execution_time. Se muestran pero no se guardan en caché
+SIN_RESPUESTA = 'No se generó respuesta'
+RESPUESTAS_INCOMPLETAS = ('Agent stopped due to', SIN_RESPUESTA)
+
+def respuesta_completa(respuesta):
+    return bool(respuesta.strip()) and not respuesta.startswith(RESPUESTAS_INCOMPLETAS)
+
+def eventos_agente(pregunta_mejorada, traza):
+    """
+    Ejecuta el agente paso a paso. Emite ('sql', ...) por cada consulta generada,
+    ('resultado_sql', ...) con su número de filas y ('respuesta', texto) al terminar.
+    Cada llamada al LLM y a una herramienta queda como span en la traza.
+    """
+    respuesta = SIN_RESPUESTA
+    configuracion = {'callbacks': [traza.manejador()]}
+    for paso in recursos.agente.stream({"input": pregunta_mejorada}, config=configuracion):
+        for accion in paso.get('actions', []):
+            if accion.tool == 'sql_db_query':
+                consulta = accion.tool_input.get('query') if isinstance(accion.tool_input, dict) else accion.tool_input
+                print(f"   🧾 SQL: {consulta}")
+                yield 'sql', {'consulta': consulta}
+            else:
+                yield 'paso', {'herramienta': accion.tool}
+        for paso_agente in paso.get('steps', []):
+            if paso_agente.action.tool == 'sql_db_query':
+                observacion = str(paso_agente.observation)
+                yield 'resultado_sql', {'filas': contar_filas(observacion), 'vista_previa': observacion[:300]}
+        if 'output' in paso:
+            respuesta = paso['output']
+    print("✅ Ejecución del agente completada")
+    yield 'respuesta', respuesta
+
+def eventos_respuesta(pregunta, endpoint='/ask'):
+    """
+    Responde una pregunta completa (detección de dirección, agente SQL y humanización)
+    emitiendo (evento, datos) a medida que avanza; el último es ('final', {...}).
+    Usa la caché de respuestas cuando es posible y mide cada etapa.
+    """
+    traza = Traza(endpoint, pregunta)
+    try:
+        yield from etapas_respuesta(pregunta, traza)
+    except GeneratorExit:
+        traza.resultado = 'cancelada'
+        raise
+    except Exception:
+        traza.resultado = 'error'
+        raise
+    finally:
+        traza.terminar()
+
+def etapas_respuesta(pregunta, traza):
+    yield 'estado', {'etapa': 'direccion'}
+    print("🔍 Verificando si hay dirección en la pregunta...")
+    with traza.etapa('direccion') as span:
+        coordenadas = detectar_coordenadas_en_pregunta(pregunta)
+        span['encontrada'] = coordenadas is not None
+    if coordenadas:
+        print("✅ Dirección detectada y convertida a coordenadas")
+        yield 'coordenadas', {'lat': coordenadas[0], 'lon': coordenadas[1]}
+    else:
+        print("ℹ️  No se detectó dirección, procediendo con la pregunta original")
+    
+    with traza.etapa('cache_respuestas') as span:
+        llave_cache = recursos.cache_respuestas.llave(pregunta, coordenadas)
+        respuesta_cache = recursos.cache_respuestas.obtener(llave_cache)
+        span['acierto'] = respuesta_cache is not None
+    if respuesta_cache is not None:
+        print("⚡ Respuesta servida desde caché")
+        traza.resultado = 'cache'
+        yield 'final', {'answer': respuesta_cache, 'cached': True}
+        return
+    
+    # Las preguntas comunes se responden con SQL fijo sobre las vistas resumen, sin LLM
+    plantilla = None
+    if recursos.vistas_disponibles:
+        with traza.etapa('plantilla') as span:
+            plantilla = responder_plantilla(pregunta, coordenadas)
+            span['intencion'] = plantilla[0] if plantilla else None
+    if plantilla:
+        intencion, respuesta = plantilla
+        print(f"⚡ Respondida con plantilla '{intencion}' (sin agente)")
+        traza.resultado = 'plantilla'
+        yield 'plantilla', {'intencion': intencion}
+    else:
+        pregunta_mejorada = construir_prompt(agregar_nota_coordenadas(pregunta, coordenadas))
         
         print("🤖 Ejecutando agente SQL...")
-        resultado = agent_executor.invoke({"input": pregunta_mejorada})
-        print("✅ Ejecución del agente completada")
+        traza.resultado = 'agente'
+        yield 'estado', {'etapa': 'agente'}
+        with traza.etapa('agente') as span:
+            for evento, datos in eventos_agente(pregunta_mejorada, traza):
+                if evento == 'respuesta':
+                    respuesta = datos
+                else:
+                    yield evento, datos
+            span['completa'] = respuesta_completa(respuesta)
+        if not span['completa']:
+            traza.resultado = 'agente_incompleto'
+    print(f"📝 Respuesta sin procesar: {respuesta[:100]}..." if len(respuesta) > 100 else f"📝 Respuesta sin procesar: {respuesta}")
+    yield 'respuesta', {'texto': respuesta}
+    
+    # Post-procesar para humanizar la respuesta con nombres de zonas
+    with traza.etapa('humanizar') as span:
+        span['direcciones'] = 0
+        for evento, datos in humanizar_por_partes(respuesta):
+            if evento == 'humanizada':
+                respuesta_humanizada = datos
+            else:
+                span['direcciones'] += 1
+                yield evento, datos
+    print(f"📝 Respuesta humanizada: {respuesta_humanizada[:100]}..." if len(respuesta_humanizada) > 100 else f"📝 Respuesta humanizada: {respuesta_humanizada}")
+    
+    if plantilla or respuesta_completa(respuesta):
+        recursos.cache_respuestas.guardar(llave_cache, respuesta_humanizada)
+    else:
+        print("⚠️  El agente no terminó la respuesta, no se guarda en caché")
+    yield 'final', {'answer': respuesta_humanizada, 'cached': False}
+
+def responder_pregunta(pregunta, endpoint='/ask'):
+    """
+    Versión sin streaming de eventos_respuesta. Regresa (respuesta, desde_cache).
+    """
+    final = None
+    # Se consume el generador completo para que la traza se cierre normalmente
+    for evento, datos in eventos_respuesta(pregunta, endpoint=endpoint):
+        if evento == 'final':
+            final = datos
+    return final['answer'], final['cached']
+
+turnos_preguntas = threading.BoundedSemaphore(MAX_CONCURRENT_QUESTIONS)
+
+def servidor_saturado():
+    print("🚦 Demasiadas preguntas en curso, respondiendo 429")
+    return jsonify({
+        'error': 'El servidor está ocupado, intenta de nuevo en unos segundos',
+        'success': False
+    }), 429, {'Retry-After': '5'}
+
+def formato_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
+@rutas.route('/ask', methods=['POST'])
+def preguntar():
+    try:
+        datos = request.get_json()
+        pregunta = datos.get('question', '').strip()
+        
+        print(f"\n{'='*60}")
+        print(f"📥 Nueva pregunta recibida: '{pregunta}'")
+        print(f"{'='*60}")
         
-        respuesta = resultado.get('output', 'No se generó respuesta')
-        print(f"📝 Respuesta sin procesar: {respuesta[:100]}..." if len(respuesta) > 100 else f"📝 Respuesta sin procesar: {respuesta}")
+        if not pregunta:
+            print("❌ Pregunta vacía recibida")
+            return jsonify({'error': 'No se proporcionó ninguna pregunta'}), 400
         
-        # Post-procesar para humanizar la respuesta con nombres de zonas
-        respuesta_humanizada = humanizar_respuesta_agente(respuesta)
-        print(f"📝 Respuesta humanizada: {respuesta_humanizada[:100]}..." if len(respuesta_humanizada) > 100 else f"📝 Respuesta humanizada: {respuesta_humanizada}")
+        if not turnos_preguntas.acquire(timeout=QUEUE_WAIT):
+            return servidor_saturado()
+        try:
+            respuesta_humanizada, desde_cache = responder_pregunta(pregunta)
+        finally:
+            turnos_preguntas.release()
         
         print(f"✅ Solicitud procesada exitosamente")
         print(f"{'='*60}\n")
         return jsonify({
             'answer': respuesta_humanizada,
+            'cached': desde_cache,
             'success': True
         })
         
@@ -312,46 +505,193 @@ def preguntar():
             'success': False
         }), 500
 
-@app.route('/health', methods=['GET'])
+@rutas.route('/ask/stream', methods=['POST'])
+def preguntar_stream():
+    """
+    Igual que /ask pero como Server-Sent Events: el SQL generado, el número de filas,
+    la respuesta en crudo y cada dirección se envían en cuanto están listos.
+    Si el cliente cierra la conexión, el agente se detiene en el siguiente paso.
+    """
+    datos = request.get_json(silent=True) or {}
+    pregunta = datos.get('question', '').strip()
+    if not pregunta:
+        return jsonify({'error': 'No se proporcionó ninguna pregunta'}), 400
+    
+    if not turnos_preguntas.acquire(timeout=QUEUE_WAIT):
+        return servidor_saturado()
+    
+    print(f"\n{'='*60}")
+    print(f"📥 Nueva pregunta recibida (stream): '{pregunta}'")
+    print(f"{'='*60}")
+    
+    def generar():
+        try:
+            for evento, datos_evento in eventos_respuesta(pregunta, endpoint='/ask/stream'):
+                yield formato_sse(evento, datos_evento)
+            print(f"✅ Solicitud procesada exitosamente")
+        except GeneratorExit:
+            print("🛑 El cliente canceló la solicitud")
+            raise
+        except Exception as e:
+            print(f"\n❌ ERROR procesando pregunta: {e}")
+            yield formato_sse('error', {'error': f'Error al procesar tu pregunta: {str(e)}'})
+        print(f"{'='*60}\n")
+    
+    respuesta = Response(generar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Evita que nginx acumule el stream antes de enviarlo
+        'X-Accel-Buffering': 'no'
+    })
+    # El turno se libera cuando termina el stream (o el cliente se desconecta), no al regresar
+    respuesta.call_on_close(turnos_preguntas.release)
+    return respuesta
+
+def responder_lote(preguntas, paralelas):
+    """
+    Generador: responde una lista de preguntas con a lo más `paralelas` a la vez y emite un
+    diccionario por pregunta en cuanto termina (con su índice en la lista) y al final el resumen.
+    Las preguntas repetidas (misma pregunta normalizada) se responden una sola vez.
+    """
+    inicio = time.perf_counter()
+    grupos = {}
+    errores = 0
+    for indice, pregunta in enumerate(preguntas):
+        if not pregunta:
+            errores += 1
+            yield {'index': indice, 'question': pregunta, 'error': 'No se proporcionó ninguna pregunta', 'success': False}
+            continue
+        grupos.setdefault(normalizar_texto(pregunta), []).append(indice)
+    
+    def responder(pregunta):
+        # Cada pregunta ocupa un turno como en /ask, pero espera a que se libere en lugar de recibir 429
+        inicio_pregunta = time.perf_counter()
+        with turnos_preguntas:
+            respuesta, desde_cache = responder_pregunta(pregunta, endpoint='/ask/batch')
+        return respuesta, desde_cache, time.perf_counter() - inicio_pregunta
+    
+    pool = ThreadPoolExecutor(max_workers=paralelas, thread_name_prefix="lote")
+    try:
+        futuros = {pool.submit(responder, preguntas[indices[0]]): indices for indices in grupos.values()}
+        for futuro in as_completed(futuros):
+            indices = futuros[futuro]
+            try:
+                respuesta, desde_cache, segundos = futuro.result()
+                resultado = {'answer': respuesta, 'cached': desde_cache, 'seconds': round(segundos, 3), 'success': True}
+            except Exception as e:
+                print(f"\n❌ ERROR procesando pregunta del lote: {e}")
+                errores += len(indices)
+                resultado = {'error': f'Error al procesar tu pregunta: {str(e)}', 'success': False}
+            for indice in indices:
+                linea = {'index': indice, 'question': preguntas[indice], **resultado}
+                if indice != indices[0]:
+                    linea['duplicate_of'] = indices[0]
+                yield linea
+    finally:
+        # Si el cliente se desconecta, las preguntas que no han empezado se cancelan
+        pool.shutdown(wait=False, cancel_futures=True)
+    
+    yield {'summary': {
+        'questions': len(preguntas),
+        'unique': len(grupos),
+        'errors': errores,
+        'seconds': round(time.perf_counter() - inicio, 3)
+    }}
+
+@rutas.route('/ask/batch', methods=['POST'])
+def preguntar_lote():
+    """
+    Varias preguntas en una solicitud: {"questions": [...], "concurrency": n}.
+    Responde JSON lines (una por pregunta, en el orden en que terminan) y una línea final con el resumen.
+    """
+    datos = request.get_json(silent=True) or {}
+    preguntas = datos.get('questions')
+    if not isinstance(preguntas, list) or not preguntas:
+        return jsonify({'error': 'Envía una lista de preguntas en "questions"', 'success': False}), 400
+    if len(preguntas) > BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'Máximo {BATCH_MAX_QUESTIONS} preguntas por lote', 'success': False}), 400
+    try:
+        paralelas = min(int(datos.get('concurrency', BATCH_CONCURRENCY)), BATCH_CONCURRENCY)
+    except (TypeError, ValueError):
+        return jsonify({'error': '"concurrency" debe ser un número entero', 'success': False}), 400
+    paralelas = max(1, paralelas)
+    preguntas = [p.strip() if isinstance(p, str) else '' for p in preguntas]
+    
+    print(f"\n{'='*60}")
+    print(f"📥 Lote recibido: {len(preguntas)} preguntas, {paralelas} a la vez")
+    print(f"{'='*60}")
+    
+    def generar():
+        for linea in responder_lote(preguntas, paralelas):
+            if 'summary' in linea:
+                print(f"✅ Lote terminado: {linea['summary']}")
+            yield json.dumps(linea, ensure_ascii=False, default=str) + "\n"
+    
+    return Response(generar(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+registro.agregar(Medidor('traffic_answer_cache_hit_ratio', 'Hit ratio de la caché de respuestas',
+                         lambda: recursos.cache_respuestas.estadisticas()['hit_ratio']))
+registro.agregar(Medidor('traffic_geocache_hit_ratio', 'Hit ratio de la caché de geocodificación',
+                         lambda: recursos.cache_geocodificacion.estadisticas()['hit_ratio']))
+registro.agregar(Medidor('traffic_geocode_pending', 'Puntos sin turno de Nominatim en espera de geocodificarse',
+                         busquedas_pendientes.pendientes))
+
+@rutas.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registro.exportar(), mimetype='text/plain; version=0.0.4')
+
+@rutas.route('/health', methods=['GET'])
 def health_check():
+    # Responde con la última verificación del hilo de estadísticas; ?deep=1 fuerza una consulta
     try:
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        
-        return jsonify({
-            'status': 'healthy',
-            'database': 'connected'
-        })
+        estado_base = recursos.estadisticas_tabla.salud()
     except Exception as e:
+        # Sin esquema.json las estadísticas necesitan la base para arrancar
+        estado_base = {'database': 'unknown', 'last_check_seconds': None, 'error': str(e)}
+    if request.args.get('deep') == '1' or estado_base['database'] == 'unknown':
+        try:
+            with recursos.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            estado_base = {'database': 'connected', 'last_check_seconds': 0.0, 'error': None}
+        except Exception as e:
+            estado_base = {'database': 'disconnected', 'last_check_seconds': 0.0, 'error': str(e)}
+    
+    if estado_base['database'] != 'connected':
         return jsonify({
             'status': 'unhealthy',
-            'error': str(e)
+            'error': estado_base['error'] or 'Sin verificación reciente de la base de datos',
+            'last_check_seconds': estado_base['last_check_seconds']
         }), 500
+    
+    return jsonify({
+        'status': 'healthy',
+        'database': 'connected',
+        'last_check_seconds': estado_base['last_check_seconds'],
+        'consecutive_failures': estado_base.get('consecutive_failures', 0),
+        'geocache': recursos.cache_geocodificacion.estadisticas(),
+        'answer_cache': recursos.cache_respuestas.estadisticas()
+    })
 
-@app.route('/table-info', methods=['GET'])
+@rutas.route('/table-info', methods=['GET'])
 def table_info():
     try:
-        with engine.connect() as conn:
-            count_result = conn.execute(text("SELECT COUNT(*) FROM traffic_data")).fetchone()
-            
-            sample_result = conn.execute(text(
-                "SELECT * FROM traffic_data LIMIT 5"
-            )).fetchall()
-            
-            columns_result = conn.execute(text("""
-                SELECT column_name, data_type 
-                FROM information_schema.columns 
-                WHERE table_name = 'traffic_data'
-            """)).fetchall()
-            
-            return jsonify({
-                'total_records': count_result[0],
-                'columns': [{'name': col[0], 'type': col[1]} for col in columns_result],
-                'sample_data': [dict(row._mapping) for row in sample_result]
-            })
+        return jsonify(recursos.estadisticas_tabla.obtener())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def crear_app():
+    """
+    Crea la aplicación Flask. No abre conexiones: los recursos se construyen con la primera solicitud
+    y gunicorn (gunicorn.conf.py) los precalienta en el proceso maestro antes de crear los workers.
+    """
+    aplicacion = Flask(__name__)
+    aplicacion.register_blueprint(rutas)
+    return aplicacion
+
+app = crear_app()
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("🚦 AMG Traffic Data Assistant is ready!")
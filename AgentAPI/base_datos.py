@@ -0,0 +1,115 @@
+import json
+import time
+
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import text
+
+import recursos as configuracion
+from guardia_sql import preparar, verificar_costo, recortar_resultado, vigilante, fuera_del_bucle
+from metricas import CONSULTAS_SQL
+
+
+def _filas(cursor, fetch):
+    if not cursor.returns_rows:
+        return []
+    filas = cursor.fetchall() if fetch == "all" else cursor.fetchmany(1)
+    return [fila._asdict() for fila in filas]
+
+
+class SQLDatabaseLocal(SQLDatabase):
+    """
+    SQLDatabase sobre traffic.duckdb: las consultas corren fuera del bucle de gevent y las que
+    pasen de AGENT_STATEMENT_TIMEOUT_MS se interrumpen (y SQLDatabaseEnrutada las repite en
+    Aurora, donde las revisa EXPLAIN).
+    """
+
+    def _execute(self, command, fetch="all", *, parameters=None, execution_options=None):
+        if not isinstance(command, str) or fetch == "cursor":
+            return super()._execute(command, fetch, parameters=parameters, execution_options=execution_options)
+
+        def ejecutar(conexion):
+            cursor = conexion.execute(text(command), parameters or {}, execution_options=execution_options or {})
+            return _filas(cursor, fetch)
+
+        # La conexión se toma del pool en el greenlet; en el hilo solo corre la consulta
+        with self._engine.begin() as conexion, vigilante.vigilar(conexion.connection.driver_connection):
+            return fuera_del_bucle(ejecutar, conexion)
+
+
+class SQLDatabaseInstantanea(SQLDatabase):
+    """
+    SQLDatabase que responde la descripción de las tablas (sql_db_schema) desde
+    esquema.json en lugar de reflejarlas y consultar filas de ejemplo en cada pregunta.
+    Las tablas que no estén en la instantánea se describen como siempre.
+    """
+
+    def get_table_info(self, table_names=None):
+        nombres = table_names if table_names is not None else self.get_usable_table_names()
+        instantanea = self._custom_table_info or {}
+        if set(nombres) <= set(self.get_usable_table_names()) and all(n in instantanea for n in nombres):
+            return "\n\n".join(instantanea[n] for n in sorted(nombres))
+        return super().get_table_info(table_names)
+
+
+class SQLDatabaseEnrutada(SQLDatabaseInstantanea):
+    """
+    Ejecuta las consultas del agente en la base local (traffic.duckdb) mientras esté vigente;
+    si falla (por ejemplo, SQL que solo entiende Postgres) se repite en Aurora.
+    Para el agente sigue siendo una base Postgres: mismo dialecto y misma descripción de tablas.
+    Cada consulta pasa antes por guardia_sql.py y su resultado se recorta antes de llegar al modelo.
+    """
+
+    def __init__(self, engine, local=None, usar_local=None, **kwargs):
+        super().__init__(engine, **kwargs)
+        self.local = SQLDatabaseLocal(local, lazy_table_reflection=True) if local is not None else None
+        self.usar_local = usar_local or (lambda: True)
+
+    def run(self, command, fetch="all", include_columns=False, **kwargs):
+        if not isinstance(command, str):
+            return super().run(command, fetch=fetch, include_columns=include_columns, **kwargs)
+        command = preparar(command)
+        if self.local is not None and self.usar_local():
+            try:
+                resultado = self.local.run(command, fetch=fetch, include_columns=include_columns, **kwargs)
+                CONSULTAS_SQL.incrementar(backend='local')
+                return recortar_resultado(resultado)
+            except Exception as e:
+                print(f"   ↩️  La base local no pudo ejecutar la consulta, se repite en Aurora: {e}")
+                CONSULTAS_SQL.incrementar(backend='local_fallback')
+        CONSULTAS_SQL.incrementar(backend='aurora')
+        return recortar_resultado(super().run(command, fetch=fetch, include_columns=include_columns, **kwargs))
+
+    def _execute(self, command, fetch="all", *, parameters=None, execution_options=None):
+        # En Aurora cada consulta corre en su propia transacción con un statement_timeout más corto
+        # que el de la conexión, y pasa antes por EXPLAIN: si es demasiado costosa no se ejecuta
+        if not isinstance(command, str) or fetch == "cursor" or self.dialect != "postgresql":
+            return super()._execute(command, fetch, parameters=parameters, execution_options=execution_options)
+        with self._engine.begin() as conexion:
+            conexion.exec_driver_sql(f"SET LOCAL statement_timeout = {configuracion.AGENT_STATEMENT_TIMEOUT_MS}")
+            verificar_costo(conexion, command)
+            cursor = conexion.execute(text(command), parameters or {}, execution_options=execution_options or {})
+            return _filas(cursor, fetch)
+
+
+def generar_instantanea(engine, ruta=configuracion.ESQUEMA_PATH):
+    """
+    Describe traffic_data y las vistas resumen (CREATE TABLE y filas de ejemplo) y lo guarda en `ruta`.
+    """
+    from sqlalchemy import inspect
+
+    vistas = [v for v in configuracion.VISTAS_RESUMEN if v in inspect(engine).get_view_names()]
+    db = SQLDatabase(engine, include_tables=['traffic_data'] + vistas, view_support=True)
+    esquema = {
+        'generado': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'tablas': {tabla: db.get_table_info([tabla]) for tabla in ['traffic_data'] + vistas}
+    }
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(esquema, f, ensure_ascii=False, indent=2, default=str)
+    return esquema
+
+
+if __name__ == "__main__":
+    print("Leyendo el esquema de la base de datos...")
+    esquema = generar_instantanea(configuracion.Recursos().engine)
+    print(f"✓ {len(esquema['tablas'])} tablas guardadas en {configuracion.ESQUEMA_PATH}")
+    print("Vuelve a generarlo si cambian las columnas o las vistas resumen.")
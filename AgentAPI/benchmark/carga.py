@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Generador de carga: lanza preguntas a /ask (o /ask/stream), /table-info y /health con
+# N clientes concurrentes y reporta throughput y percentiles, más el desglose por etapa
+# que la app publica en /metrics.
+#
+#   python benchmark/carga.py --concurrencia 16 --solicitudes 400
+#       levanta la app con los falsos en este proceso (requiere DATABASE_URL)
+#   python benchmark/carga.py --url http://127.0.0.1:5000 ...
+#       mide un servidor ya levantado (por ejemplo gunicorn con benchmark.servidor:app)
+
+PREGUNTAS = [
+    # Plantillas sobre las vistas resumen
+    "¿Distribución del tráfico?",
+    "Muéstrame las 5 zonas con peor tráfico",
+    "¿Cuántas áreas tienen tráfico ligero (verde)?",
+    "¿Qué zonas tienen semáforo rojo (tráfico alto)?",
+    "promedio de congestión por color",
+    # Direcciones (geocodificación directa + tráfico alrededor)
+    "¿Cómo está el tráfico en avenida Vallarta?",
+    "¿Cómo está el tráfico cerca de la glorieta Minerva?",
+    "¿Cómo está el tráfico en calle Hidalgo?",
+    # Agente (fechas u horas)
+    "¿Cómo está el tráfico en hora pico?",
+    "¿Dónde hubo más congestión esta semana?",
+    "¿Qué tan pesado estuvo el tráfico ayer?",
+    "¿Cómo está el tráfico en avenida Chapultepec en hora pico?",
+]
+
+MEZCLA = {"ask": 8, "table-info": 1, "health": 1}
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def solicitar(url, ruta, pregunta=None, stream=False, timeout=120):
+    """
+    Regresa (estado, segundos hasta el primer byte, segundos totales).
+    """
+    datos = json.dumps({"question": pregunta}).encode("utf-8") if pregunta is not None else None
+    encabezados = {"Content-Type": "application/json"} if datos else {}
+    solicitud = urllib.request.Request(url + ruta, data=datos, headers=encabezados)
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(solicitud, timeout=timeout) as respuesta:
+            primer_byte = None
+            if stream:
+                for _ in respuesta:
+                    if primer_byte is None:
+                        primer_byte = time.perf_counter() - inicio
+            else:
+                respuesta.read()
+            total = time.perf_counter() - inicio
+            return respuesta.status, primer_byte if primer_byte is not None else total, total
+    except urllib.error.HTTPError as e:
+        total = time.perf_counter() - inicio
+        return e.code, total, total
+    except Exception:
+        total = time.perf_counter() - inicio
+        return 0, total, total
+
+
+def leer_histogramas(url):
+    """
+    {(métrica, etiquetas): {le: conteo}} de los histogramas de /metrics.
+    """
+    try:
+        with urllib.request.urlopen(url + "/metrics", timeout=10) as respuesta:
+            texto = respuesta.read().decode("utf-8")
+    except Exception:
+        return {}
+    histogramas = defaultdict(dict)
+    for linea in texto.splitlines():
+        coincidencia = re.match(r'(\w+)_bucket\{(.*)le="([^"]+)"\} (\d+)', linea)
+        if coincidencia:
+            nombre, etiquetas, limite, conteo = coincidencia.groups()
+            histogramas[(nombre, etiquetas.rstrip(","))][float(limite)] = int(conteo)
+    return histogramas
+
+
+def cuantil_histograma(buckets, q):
+    # Interpolación lineal dentro del bucket, como histogram_quantile de Prometheus
+    limites = sorted(buckets)
+    total = buckets[limites[-1]]
+    if total == 0:
+        return 0.0
+    objetivo = q * total
+    anterior_limite, anterior_conteo = 0.0, 0
+    for limite in limites:
+        conteo = buckets[limite]
+        if conteo >= objetivo:
+            if limite == float("inf"):
+                return anterior_limite
+            fraccion = (objetivo - anterior_conteo) / max(conteo - anterior_conteo, 1)
+            return anterior_limite + (limite - anterior_limite) * fraccion
+        anterior_limite, anterior_conteo = limite, conteo
+    return anterior_limite
+
+
+def reporte_etapas(antes, despues):
+    print("\n--- Etapas (desde /metrics) ---")
+    print(f"{'métrica':<28} {'etiquetas':<44} {'n':>6} {'p50 ms':>9} {'p95 ms':>9}")
+    for (nombre, etiquetas), buckets in sorted(despues.items()):
+        if nombre == "traffic_sql_rows":
+            continue
+        previos = antes.get((nombre, etiquetas), {})
+        delta = {limite: conteo - previos.get(limite, 0) for limite, conteo in buckets.items()}
+        n = delta.get(float("inf"), 0)
+        if n == 0:
+            continue
+        p50 = cuantil_histograma(delta, 0.5) * 1000
+        p95 = cuantil_histograma(delta, 0.95) * 1000
+        print(f"{nombre:<28} {etiquetas:<44} {n:>6} {p50:>9.1f} {p95:>9.1f}")
+
+
+def levantar_servidor_local(args):
+    os.environ["BENCH_LLM_LATENCY"] = str(args.latencia_llm)
+    os.environ["BENCH_GEO_LATENCY"] = str(args.latencia_geo)
+    if args.sin_cache:
+        os.environ["ANSWER_CACHE_MAX_ENTRIES"] = "0"
+    from werkzeug.serving import make_server
+    import servidor
+
+    servidor_http = make_server("127.0.0.1", 0, servidor.app, threaded=True)
+    threading.Thread(target=servidor_http.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{servidor_http.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga de AgentAPI")
+    parser.add_argument("--url", help="Servidor ya levantado; sin esto se levanta uno local con los falsos")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--solicitudes", type=int, default=200)
+    parser.add_argument("--stream", action="store_true", help="Usa /ask/stream y mide el primer byte")
+    parser.add_argument("--sin-cache", action="store_true", help="Desactiva la caché de respuestas (solo local)")
+    parser.add_argument("--latencia-llm", type=float, default=0.8, help="Segundos por llamada al LLM falso (solo local)")
+    parser.add_argument("--latencia-geo", type=float, default=0.3, help="Segundos por búsqueda en el geocodificador falso (solo local)")
+    parser.add_argument("--semilla", type=int, default=7)
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/") if args.url else levantar_servidor_local(args)
+    ruta_pregunta = "/ask/stream" if args.stream else "/ask"
+
+    aleatorio = random.Random(args.semilla)
+    tipos = [t for t, peso in MEZCLA.items() for _ in range(peso)]
+    plan = []
+    for _ in range(args.solicitudes):
+        tipo = aleatorio.choice(tipos)
+        plan.append((tipo, aleatorio.choice(PREGUNTAS) if tipo == "ask" else None))
+
+    resultados = defaultdict(list)
+    lock = threading.Lock()
+
+    def ejecutar(paso):
+        tipo, pregunta = paso
+        if tipo == "ask":
+            medicion = solicitar(url, ruta_pregunta, pregunta, stream=args.stream)
+        else:
+            medicion = solicitar(url, "/" + tipo)
+        with lock:
+            resultados[tipo].append(medicion)
+
+    antes = leer_histogramas(url)
+    print(f"Enviando {args.solicitudes} solicitudes a {url} con {args.concurrencia} clientes...")
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrencia) as pool:
+        list(pool.map(ejecutar, plan))
+    duracion = time.perf_counter() - inicio
+    despues = leer_histogramas(url)
+
+    print(f"\n========== RESULTADOS ({duracion:.1f} s, {args.solicitudes / duracion:.1f} solicitudes/s) ==========")
+    print(f"{'endpoint':<12} {'n':>5} {'ok':>5} {'429':>5} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'1er byte p50':>13}")
+    for tipo, mediciones in sorted(resultados.items()):
+        totales = [m[2] * 1000 for m in mediciones]
+        primeros = [m[1] * 1000 for m in mediciones]
+        ok = sum(1 for m in mediciones if m[0] == 200)
+        saturado = sum(1 for m in mediciones if m[0] == 429)
+        print(
+            f"{tipo:<12} {len(mediciones):>5} {ok:>5} {saturado:>5} {len(mediciones) - ok - saturado:>5} "
+            f"{statistics.median(totales):>9.1f} {percentil(totales, 0.95):>9.1f} {percentil(totales, 0.99):>9.1f} "
+            f"{statistics.median(primeros):>13.1f}"
+        )
+    if despues:
+        reporte_etapas(antes, despues)
+        if args.url:
+            print("(con varios workers de gunicorn, /metrics refleja solo el worker que respondió)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import os
+import sys
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+from tqdm import tqdm
+
+# Usa el mismo esquema (particiones, grid_cell, índices y tablas resumen) que los scripts de setup/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "setup"))
+import rollups  # noqa: E402
+import upload_s3_to_aurora as loader  # noqa: E402
+
+# Genera un traffic_data sintético en un Postgres local: sensores fijos en el AMG y una
+# medición por sensor cada --intervalo minutos, con más congestión en horas pico.
+# 2,000 sensores x 2,000 momentos = 4 millones de filas.
+
+CREATE_SENSORES_SQL = """
+CREATE TEMP TABLE sensores_sinteticos AS
+SELECT 'S' || lpad(s::text, 5, '0') AS id,
+       -103.50 + random() * 0.30 AS coordx,
+       20.55 + random() * 0.25 AS coordy,
+       random() * 0.3 AS propension
+FROM generate_series(1, :sensores) s
+"""
+
+INSERT_SQL = f"""
+INSERT INTO traffic_data ({", ".join(loader.COLUMNS)})
+SELECT id, color,
+       CASE color WHEN 'green' THEN 0.05 WHEN 'yellow' THEN 0.2 WHEN 'orange' THEN 0.45
+                  WHEN 'red' THEN 0.75 ELSE 1.0 END + random() * 0.05,
+       CASE color WHEN 'green' THEN 0.1 WHEN 'yellow' THEN 0.3 WHEN 'orange' THEN 0.5
+                  WHEN 'red' THEN 0.7 ELSE 0.9 END + random() * 0.05,
+       random(),
+       coordx, coordy, captured_at,
+       {loader.GRID_CELL_SQL}
+FROM (
+    SELECT s.id, s.coordx, s.coordy, m.captured_at,
+           CASE WHEN r < 0.55 THEN 'green' WHEN r < 0.75 THEN 'yellow' WHEN r < 0.87 THEN 'orange'
+                WHEN r < 0.96 THEN 'red' ELSE 'red_wine' END AS color
+    FROM (
+        SELECT CAST(:inicio AS timestamp) + n * :intervalo * INTERVAL '1 minute' AS captured_at
+        FROM generate_series(:desde, :hasta - 1) n
+    ) m
+    CROSS JOIN sensores_sinteticos s
+    CROSS JOIN LATERAL (
+        SELECT LEAST(0.999, random() * 0.85 + s.propension * 0.5
+            + CASE WHEN EXTRACT(HOUR FROM m.captured_at) IN (7, 8, 9, 18, 19, 20) THEN 0.15 ELSE 0 END) AS r
+    ) azar
+) filas
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crea un traffic_data sintético para benchmark/carga.py")
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument("--sensores", type=int, default=2000)
+    parser.add_argument("--momentos", type=int, default=2000, help="Mediciones por sensor")
+    parser.add_argument("--intervalo", type=int, default=30, help="Minutos entre mediciones")
+    parser.add_argument("--inicio", default="2025-01-01")
+    parser.add_argument("--reemplazar", action="store_true", help="Borra traffic_data si ya tiene filas")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("indica --database-url o DATABASE_URL (un Postgres local, nunca Aurora)")
+    if "rds.amazonaws.com" in args.database_url:
+        parser.error("este script borra y llena traffic_data; úsalo solo contra un Postgres local")
+
+    engine = create_engine(args.database_url)
+    loader.create_tables(engine)
+    with engine.connect() as conn:
+        tiene_filas = conn.execute(text("SELECT EXISTS (SELECT 1 FROM traffic_data)")).scalar()
+        if tiene_filas and not args.reemplazar:
+            print("traffic_data ya tiene filas; usa --reemplazar para generarla de nuevo")
+            return
+        conn.execute(text("TRUNCATE traffic_data"))
+        conn.commit()
+
+    fin = pd.Timestamp(args.inicio) + pd.Timedelta(minutes=args.intervalo * args.momentos)
+    meses = pd.DataFrame({"captured_at": pd.date_range(args.inicio, fin, freq="D")})
+    loader.ensure_partitions(engine, meses)
+
+    total = args.sensores * args.momentos
+    print(f"Generando {total:,} filas ({args.sensores:,} sensores x {args.momentos:,} mediciones)...")
+    por_lote = max(1, 200_000 // args.sensores)
+    with engine.connect() as conn:
+        conn.execute(text(CREATE_SENSORES_SQL), {"sensores": args.sensores})
+        with tqdm(total=total, unit="filas") as progreso:
+            for desde in range(0, args.momentos, por_lote):
+                hasta = min(desde + por_lote, args.momentos)
+                conn.execute(text(INSERT_SQL), {
+                    "inicio": args.inicio, "intervalo": args.intervalo, "desde": desde, "hasta": hasta
+                })
+                conn.commit()
+                progreso.update((hasta - desde) * args.sensores)
+
+    print("Creando índices y tablas resumen...")
+    loader.create_indexes(engine)
+    rollups.rebuild_rollups(engine)
+    print("✓ Datos sintéticos listos")
+
+
+if __name__ == "__main__":
+    main()
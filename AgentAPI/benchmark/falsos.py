@@ -0,0 +1,179 @@
+import hashlib
+import json
+import re
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Reemplazos locales de OpenAI y Nominatim para medir la app sin costo ni límites externos.
+# Las latencias imitan las del servicio real; se ajustan con --latencia-llm / --latencia-geo.
+
+# Área del AMG donde caen las coordenadas inventadas
+LON_MIN, LON_MAX = -103.50, -103.20
+LAT_MIN, LAT_MAX = 20.55, 20.80
+
+
+def _fraccion(texto, sal=""):
+    # Número estable en [0, 1) a partir de un texto
+    digest = hashlib.md5((sal + texto).encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) / 0x100000000
+
+
+def extraer_pregunta(prompt):
+    coincidencia = re.search(r"Pregunta del usuario:\s*(.*?)\n\s*\n\s*Por favor", prompt, re.DOTALL)
+    return coincidencia.group(1) if coincidencia else prompt
+
+
+def consulta_para(pregunta):
+    """
+    SQL que escribiría el agente para la pregunta (las que llegan al agente suelen
+    llevar fechas u horas, o una dirección con su lista de celdas).
+    """
+    texto = pregunta.lower()
+    celdas = re.search(r"grid_cell IN \(([\d,\s]+)\)", pregunta)
+    coordenadas = re.search(r"coordx cerca de ([-\d.]+) y coordy cerca de ([-\d.]+)", pregunta)
+    if celdas and coordenadas:
+        lon, lat = float(coordenadas.group(1)), float(coordenadas.group(2))
+        return (
+            "SELECT predominant_color, COUNT(*) AS cantidad, AVG(exponential_color_weighting) AS promedio "
+            f"FROM traffic_data WHERE grid_cell IN ({celdas.group(1)}) "
+            f"AND coordx BETWEEN {lon - 0.01} AND {lon + 0.01} AND coordy BETWEEN {lat - 0.01} AND {lat + 0.01} "
+            "GROUP BY predominant_color ORDER BY cantidad DESC LIMIT 50"
+        )
+    if "pico" in texto or "hora" in texto:
+        return (
+            "SELECT predominant_color, COUNT(*) AS cantidad FROM traffic_data "
+            "WHERE EXTRACT(HOUR FROM captured_at) BETWEEN 7 AND 9 "
+            "GROUP BY predominant_color ORDER BY cantidad DESC LIMIT 50"
+        )
+    if "semana" in texto or "ayer" in texto or "hoy" in texto:
+        return (
+            "SELECT coordx, coordy, COUNT(*) AS veces FROM traffic_data "
+            "WHERE predominant_color IN ('red_wine', 'red') "
+            "AND captured_at >= (SELECT MAX(captured_at) FROM traffic_data) - INTERVAL '7 days' "
+            "GROUP BY coordx, coordy ORDER BY veces DESC LIMIT 10"
+        )
+    return (
+        "SELECT predominant_color, COUNT(*) AS cantidad, AVG(linear_color_weighting) AS promedio "
+        "FROM traffic_data WHERE captured_at >= (SELECT MAX(captured_at) FROM traffic_data) - INTERVAL '1 month' "
+        "GROUP BY predominant_color ORDER BY cantidad DESC LIMIT 50"
+    )
+
+
+def respuesta_final(resultado):
+    # Convierte el resultado de sql_db_query en una respuesta con el formato que pide el prompt
+    pares = re.findall(r"\((-103\.\d+), (20\.\d+), (\d+)\)", resultado)
+    if pares:
+        lineas = ["Las ubicaciones con más congestión son:"]
+        for i, (lon, lat, veces) in enumerate(pares, start=1):
+            lineas.append(f"{i}. coordx: {lon}, coordy: {lat} - {veces} mediciones con tráfico red o red_wine")
+        return "\n".join(lineas)
+    colores = re.findall(r"\('(\w+)', (\d+)", resultado)
+    if colores:
+        lineas = ["Así se distribuye el tráfico:"]
+        for color, cantidad in colores:
+            lineas.append(f"- {color}: {cantidad} mediciones")
+        return "\n".join(lineas)
+    return "No encontré datos para esa consulta."
+
+
+class ModeloFalso(BaseChatModel):
+    """
+    Modelo de chat con guion fijo para create_sql_agent (openai-tools): lista tablas,
+    pide el esquema, ejecuta una consulta y responde con su resultado, como lo haría gpt-4o-mini.
+    """
+
+    latencia: float = 0.8
+    modelo: str = "modelo-falso"
+
+    @property
+    def _llm_type(self):
+        return "modelo-falso"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _responder(self, messages):
+        time.sleep(self.latencia)
+        prompt = next((m.content for m in messages if m.type == "human"), "")
+        resultados = [m.content for m in messages if isinstance(m, ToolMessage)]
+        paso = len(resultados)
+
+        if paso == 0:
+            llamada = ("sql_db_list_tables", {})
+        elif paso == 1:
+            llamada = ("sql_db_schema", {"table_names": "traffic_data"})
+        elif paso == 2:
+            llamada = ("sql_db_query", {"query": consulta_para(extraer_pregunta(prompt))})
+        else:
+            llamada = None
+
+        contenido = "" if llamada else respuesta_final(resultados[-1])
+        # Tokens aproximados (~4 caracteres por token) para que /metrics tenga valores realistas
+        tokens_entrada = sum(len(str(m.content)) for m in messages) // 4
+        tokens_salida = max(len(contenido) // 4, 20)
+        # Igual que ChatOpenAI: uso en usage_metadata y modelo en response_metadata del mensaje
+        metadatos = {
+            "usage_metadata": {"input_tokens": tokens_entrada, "output_tokens": tokens_salida,
+                               "total_tokens": tokens_entrada + tokens_salida},
+            "response_metadata": {"model_name": self.modelo}
+        }
+        return contenido, llamada, paso, metadatos
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        contenido, llamada, paso, metadatos = self._responder(messages)
+        llamadas = []
+        if llamada:
+            nombre, argumentos = llamada
+            llamadas = [{"name": nombre, "args": argumentos, "id": f"call_{paso}_{nombre}"}]
+        mensaje = AIMessage(content=contenido, tool_calls=llamadas, **metadatos)
+        return ChatResult(generations=[ChatGeneration(message=mensaje)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # El agente llama al modelo en modo streaming; se emite todo en un solo fragmento
+        contenido, llamada, paso, metadatos = self._responder(messages)
+        fragmentos = []
+        if llamada:
+            nombre, argumentos = llamada
+            fragmentos = [{"name": nombre, "args": json.dumps(argumentos),
+                           "id": f"call_{paso}_{nombre}", "index": 0}]
+        yield ChatGenerationChunk(message=AIMessageChunk(content=contenido, tool_call_chunks=fragmentos, **metadatos))
+
+
+class UbicacionFalsa:
+    def __init__(self, latitud, longitud, direccion):
+        self.latitude = latitud
+        self.longitude = longitud
+        self.address = direccion
+        calle, colonia, ciudad = direccion.split(", ")
+        self.raw = {"address": {"road": calle, "suburb": colonia, "city": ciudad}}
+
+
+class GeocodificadorFalso:
+    """
+    Misma interfaz que geopy Nominatim (reverse y geocode) con latencia fija y resultados estables.
+    """
+
+    def __init__(self, latencia=0.3):
+        self.latencia = latencia
+        self.solicitudes = 0
+
+    def _direccion(self, texto):
+        calle = int(_fraccion(texto, "calle") * 500)
+        colonia = int(_fraccion(texto, "colonia") * 80)
+        return f"Calle {calle}, Colonia {colonia}, Guadalajara"
+
+    def reverse(self, consulta, language=None, timeout=None):
+        time.sleep(self.latencia)
+        self.solicitudes += 1
+        lat, lon = (float(v) for v in consulta.split(","))
+        return UbicacionFalsa(lat, lon, self._direccion(f"{round(lat, 4)},{round(lon, 4)}"))
+
+    def geocode(self, consulta, timeout=None):
+        time.sleep(self.latencia)
+        self.solicitudes += 1
+        lat = LAT_MIN + _fraccion(consulta, "lat") * (LAT_MAX - LAT_MIN)
+        lon = LON_MIN + _fraccion(consulta, "lon") * (LON_MAX - LON_MIN)
+        return UbicacionFalsa(lat, lon, self._direccion(consulta))
@@ -0,0 +1,117 @@
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+# Micro-benchmark del post-proceso de respuestas (humanizador.py) con respuestas sintéticas
+# del agente de distintos tamaños. Compara contra el algoritmo anterior (un re.finditer por
+# patrón, un str.replace por coordenada y un re.sub por término) y verifica que ambos den
+# el mismo texto. La geocodificación no se mide: las direcciones ya vienen resueltas.
+#
+#   python benchmark/micro_humanizador.py --lineas 10 100 1000 10000
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from humanizador import (  # noqa: E402
+    PATRONES_COORDENADAS, TERMINOS_HUMANOS, TEXTO_ID, tokenizar, coordenadas_en, extraer_coordenadas, reescribir
+)
+
+COLORES = ['green', 'yellow', 'orange', 'red', 'red_wine']
+PLANTILLAS_LINEA = [
+    "{i}. coordx: {lon}, coordy: {lat} - {n:,} mediciones {color}",
+    "- Zona ({lon}, {lat}): predominant_color {color}, exponential_color_weighting {p:.3f}",
+    "- longitud: {lon}, latitud: {lat} con tráfico {color} (linear_color_weighting {p:.2f})",
+    "- Sensor id: {sensor} en lon: {lon}, lat: {lat}, estado {color}",
+    "- En general el tráfico fue {color} durante la mañana ({n:,} mediciones)",
+]
+
+
+def respuesta_sintetica(lineas, aleatorio, puntos=200):
+    # Las respuestas reales repiten ubicaciones: se sortean de un conjunto fijo de puntos
+    ubicaciones = [
+        (round(-103.45 + aleatorio.random() * 0.25, 6), round(20.55 + aleatorio.random() * 0.2, 6))
+        for _ in range(puntos)
+    ]
+    texto = ["Estas son las ubicaciones con más congestión según traffic_data:"]
+    for i in range(1, lineas + 1):
+        lon, lat = aleatorio.choice(ubicaciones)
+        texto.append(aleatorio.choice(PLANTILLAS_LINEA).format(
+            i=i, lon=lon, lat=lat, n=aleatorio.randint(10, 50000), color=aleatorio.choice(COLORES),
+            p=aleatorio.random() * 10, sensor=f"s{aleatorio.randint(1, 9999):04d}"
+        ))
+    return '\n'.join(texto)
+
+
+def humanizar_anterior(texto, direccion_de):
+    """
+    El algoritmo anterior, tal cual, para comparar tiempos y resultados. Con ids de distinto
+    largo daba otro texto: su str.replace de "id: s23" también cortaba "id: s2399".
+    """
+    encontradas = {}
+    for patron in PATRONES_COORDENADAS:
+        for coincidencia in re.finditer(patron, texto, re.IGNORECASE):
+            try:
+                lon = float(coincidencia.group(1))
+                lat = float(coincidencia.group(2))
+            except ValueError:
+                continue
+            if -103.6 < lon < -103.0 and 20.4 < lat < 20.9:
+                originales = encontradas.setdefault((lat, lon), [])
+                if coincidencia.group(0) not in originales:
+                    originales.append(coincidencia.group(0))
+    for punto, originales in encontradas.items():
+        for original in originales:
+            texto = texto.replace(original, direccion_de(punto))
+    for coincidencia in re.finditer(r'id[:\s]+[\w-]+', texto, re.IGNORECASE):
+        if "id:" in coincidencia.group(0).lower():
+            texto = texto.replace(coincidencia.group(0), TEXTO_ID)
+    for termino_tecnico, termino_humano in TERMINOS_HUMANOS.items():
+        texto = re.sub(r'\b' + termino_tecnico + r'\b', termino_humano, texto, flags=re.IGNORECASE)
+    return texto
+
+
+def humanizar_actual(texto, direccion_de):
+    piezas = tokenizar(texto)
+    direcciones = {
+        original: direccion_de(punto)
+        for punto, originales in coordenadas_en(piezas).items()
+        for original in originales
+    }
+    return reescribir(piezas, direcciones)
+
+
+def medir(funcion, texto, direccion_de, repeticiones):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(texto, direccion_de)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark del humanizador de respuestas")
+    parser.add_argument("--lineas", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=7)
+    args = parser.parse_args()
+
+    def direccion_de(punto):
+        return f"📍 Calle {abs(hash(punto)) % 500}, Colonia Centro, Guadalajara"
+
+    print(f"{'líneas':>7} {'KB':>8} {'coords':>7} {'anterior ms':>12} {'actual ms':>10} {'µs/KB':>8} {'x':>6}  igual")
+    for lineas in args.lineas:
+        texto = respuesta_sintetica(lineas, random.Random(args.semilla))
+        kb = len(texto.encode('utf-8')) / 1024
+        anterior, esperado = medir(humanizar_anterior, texto, direccion_de, args.repeticiones)
+        actual, obtenido = medir(humanizar_actual, texto, direccion_de, args.repeticiones)
+        print(
+            f"{lineas:>7} {kb:>8.1f} {len(extraer_coordenadas(texto)):>7} {anterior * 1000:>12.2f} {actual * 1000:>10.2f} "
+            f"{actual * 1e6 / kb:>8.1f} {anterior / actual:>6.1f}  {'sí' if obtenido == esperado else 'NO'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
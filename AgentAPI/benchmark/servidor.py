@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+
+# La app de app.py con OpenAI y Nominatim reemplazados por los falsos de falsos.py.
+# Requiere DATABASE_URL apuntando a un Postgres local con datos de datos_sinteticos.py.
+#   gunicorn -c gunicorn.conf.py benchmark.servidor:app      (desde AgentAPI/)
+BENCH_LLM_LATENCY = float(os.environ.get("BENCH_LLM_LATENCY", "0.8"))
+BENCH_GEO_LATENCY = float(os.environ.get("BENCH_GEO_LATENCY", "0.3"))
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, DIRECTORIO)
+sys.path.insert(0, os.path.dirname(DIRECTORIO))
+
+if not os.environ.get("DATABASE_URL"):
+    raise SystemExit("Define DATABASE_URL con un Postgres local (ver benchmark/datos_sinteticos.py)")
+# Caché de geocodificación propia para no mezclar direcciones falsas con las reales
+os.environ.setdefault("GEOCACHE_PATH", os.path.join(tempfile.gettempdir(), "geocache_benchmark.sqlite3"))
+
+from langchain_community.agent_toolkits import create_sql_agent  # noqa: E402
+
+import app as aplicacion  # noqa: E402
+from recursos import AGENT_TIMEOUT  # noqa: E402
+from falsos import GeocodificadorFalso, ModeloFalso  # noqa: E402
+
+recursos = aplicacion.recursos
+recursos.llm = ModeloFalso(latencia=BENCH_LLM_LATENCY)
+recursos.agente = create_sql_agent(
+    llm=recursos.llm,
+    db=recursos.db,
+    agent_type="openai-tools",
+    verbose=False,
+    max_iterations=10,
+    max_execution_time=AGENT_TIMEOUT,
+    handle_parsing_errors=True
+)
+recursos.geolocator = GeocodificadorFalso(latencia=BENCH_GEO_LATENCY)
+
+app = aplicacion.app
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+# Estadísticas de traffic_data en memoria para /table-info y /health.
+# Un hilo las revisa cada TABLE_STATS_CHECK segundos (una consulta barata a la versión de los datos)
+# y las recalcula cuando un loader cargó filas nuevas o tienen más de TABLE_STATS_MAX_AGE segundos.
+TABLE_STATS_CHECK = int(os.environ.get("TABLE_STATS_CHECK", "60"))
+TABLE_STATS_MAX_AGE = int(os.environ.get("TABLE_STATS_MAX_AGE", "900"))
+# Verificaciones fallidas seguidas para que /health reporte la base desconectada
+FALLOS_DESCONEXION = 3
+
+# Conteo exacto desde la tabla resumen que mantienen los loaders (sin escanear traffic_data)
+CONTEO_RESUMEN_SQL = "SELECT predominant_color, cantidad FROM traffic_por_color ORDER BY cantidad DESC"
+
+# Estimación del planner: suma de reltuples de las particiones (la tabla padre no guarda filas)
+CONTEO_ESTIMADO_SQL = """
+SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'traffic_data'::regclass
+"""
+
+COLUMNAS_SQL = """
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_name = 'traffic_data'
+ORDER BY ordinal_position
+"""
+
+
+class EstadisticasTabla:
+    """
+    Conteo de filas, columnas, filas de ejemplo y conteo por color de traffic_data,
+    con la fecha en que se calcularon.
+    """
+
+    def __init__(self, engine, obtener_version=None, usar_resumen=True,
+                 intervalo=TABLE_STATS_CHECK, edad_maxima=TABLE_STATS_MAX_AGE):
+        self.engine = engine
+        self.obtener_version = obtener_version
+        self.usar_resumen = usar_resumen
+        self.intervalo = intervalo
+        self.edad_maxima = edad_maxima
+        self._datos = None
+        self._version = None
+        self._calculado = 0.0
+        self._ultima_verificacion = None
+        self._error = None
+        self._fallos = 0
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def refrescar(self):
+        with self.engine.connect() as conn:
+            colores = []
+            if self.usar_resumen:
+                colores = [
+                    {'color': fila[0], 'count': int(fila[1])}
+                    for fila in conn.execute(text(CONTEO_RESUMEN_SQL)).fetchall()
+                ]
+            if colores:
+                total = sum(c['count'] for c in colores)
+                origen = 'traffic_por_color'
+            else:
+                total = conn.execute(text(CONTEO_ESTIMADO_SQL)).scalar()
+                origen = 'pg_class.reltuples'
+            columnas = conn.execute(text(COLUMNAS_SQL)).fetchall()
+            muestra = conn.execute(text("SELECT * FROM traffic_data LIMIT 5")).fetchall()
+        datos = {
+            'total_records': int(total),
+            'total_records_source': origen,
+            'columns': [{'name': col[0], 'type': col[1]} for col in columnas],
+            'sample_data': [dict(fila._mapping) for fila in muestra],
+            'color_counts': colores
+        }
+        with self._lock:
+            self._datos = datos
+            self._calculado = time.time()
+        print(f"📈 Estadísticas de traffic_data actualizadas ({datos['total_records']:,} filas, {origen})")
+
+    def _verificar(self):
+        # La verificación cuenta como exitosa solo si la versión y, cuando toca, el refresco funcionaron.
+        # El candado no se retiene durante las consultas: refrescar lo toma al guardar los datos
+        try:
+            version = self.obtener_version() if self.obtener_version else None
+            with self._lock:
+                vencidas = (self._datos is None or version != self._version
+                            or time.time() - self._calculado > self.edad_maxima)
+            if vencidas:
+                self.refrescar()
+                with self._lock:
+                    self._version = version
+        except Exception as e:
+            with self._lock:
+                self._error = str(e)
+                self._fallos += 1
+            raise
+        with self._lock:
+            self._ultima_verificacion = time.time()
+            self._error = None
+            self._fallos = 0
+
+    def _ciclo(self):
+        while True:
+            try:
+                self._verificar()
+            except Exception as e:
+                print(f"⚠️  No se pudieron actualizar las estadísticas de la tabla: {e}")
+            time.sleep(self.intervalo)
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ciclo, name="estadisticas-tabla", daemon=True)
+            self._hilo.start()
+
+    def actuales(self):
+        """
+        Las últimas estadísticas calculadas, o None si aún no hay; nunca consulta la base.
+        """
+        with self._lock:
+            return self._datos
+
+    def obtener(self):
+        """
+        Regresa las estadísticas más recientes con su antigüedad. Si todavía no hay
+        ninguna (recién arrancó el proceso) las calcula en ese momento.
+        """
+        if self.actuales() is None:
+            self._verificar()
+        with self._lock:
+            datos = dict(self._datos)
+            calculado = self._calculado
+        datos['refreshed_at'] = datetime.fromtimestamp(calculado, timezone.utc).isoformat()
+        datos['stale_seconds'] = round(time.time() - calculado, 1)
+        return datos
+
+    def salud(self):
+        """
+        Estado de la base según las verificaciones del hilo, sin abrir una conexión. Un error
+        aislado no la marca desconectada: hacen falta FALLOS_DESCONEXION fallos seguidos o
+        tres ciclos sin una verificación exitosa.
+        """
+        with self._lock:
+            fallos = self._fallos
+            error = self._error
+            ultima_verificacion = self._ultima_verificacion
+        fallando = fallos >= FALLOS_DESCONEXION
+        if ultima_verificacion is None:
+            return {'database': 'disconnected' if fallando else 'unknown', 'last_check_seconds': None,
+                    'consecutive_failures': fallos, 'error': error}
+        antiguedad = time.time() - ultima_verificacion
+        conectada = not fallando and antiguedad < 3 * self.intervalo
+        return {
+            'database': 'connected' if conectada else 'disconnected',
+            'last_check_seconds': round(antiguedad, 1),
+            'consecutive_failures': fallos,
+            'error': error
+        }
@@ -0,0 +1,142 @@
+import os
+import re
+import unicodedata
+import numpy as np
+
+# Gazetteer local de sensores construido por setup/build_gazetteer.py a partir de
+# locationPoints.csv. Resuelve coordenadas <-> calles sin salir a la red.
+GAZETTEER_PATH = os.environ.get(
+    "GAZETTEER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.npz")
+)
+# Tamaño de celda (grados) del índice espacial y distancia máxima para considerar un sensor "el mismo punto"
+CELDA = 0.001
+TOLERANCIA = 0.0005
+
+# Prefijos genéricos que no distinguen una calle de otra
+PREFIJOS_VIALIDAD = {
+    'avenida', 'av', 'avda', 'calle', 'c', 'calzada', 'calz', 'boulevard',
+    'bulevar', 'blvd', 'prolongacion', 'prol', 'carretera', 'privada', 'colonia', 'col'
+}
+MAX_PALABRAS_NOMBRE = 6
+# Un nombre de una sola palabra ("centro", "juarez", "hidalgo") solo cuenta como lugar si va
+# después de una de estas palabras (o de "cerca de"), con un artículo opcional en medio
+INTRODUCTORES_LUGAR = PREFIJOS_VIALIDAD | {'en', 'sobre', 'por', 'rumbo', 'hacia'}
+ARTICULOS = {'el', 'la', 'los', 'las'}
+
+
+def normalizar_texto(texto):
+    texto = unicodedata.normalize('NFKD', texto.casefold())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r'[^\w\s]', ' ', texto)
+    return ' '.join(texto.split())
+
+
+def _variantes_nombre(nombre):
+    normalizado = normalizar_texto(nombre)
+    if not normalizado:
+        return []
+    variantes = [normalizado]
+    palabras = normalizado.split()
+    if len(palabras) > 1 and palabras[0] in PREFIJOS_VIALIDAD:
+        variantes.append(' '.join(palabras[1:]))
+    return variantes
+
+
+class Gazetteer:
+    def __init__(self, ruta=GAZETTEER_PATH):
+        datos = np.load(ruta)
+        self.ids = datos['ids']
+        self.lon = datos['lon']
+        self.lat = datos['lat']
+        self.calle = datos['calle']
+        self.colonia = datos['colonia']
+        self.ciudad = datos['ciudad']
+
+        # Índice espacial: celda de rejilla -> posiciones de sensores
+        self._celdas = {}
+        celdas_lat = np.floor(self.lat / CELDA).astype(np.int64)
+        celdas_lon = np.floor(self.lon / CELDA).astype(np.int64)
+        for i, llave in enumerate(zip(celdas_lat.tolist(), celdas_lon.tolist())):
+            self._celdas.setdefault(llave, []).append(i)
+
+        # Índice directo: nombre normalizado de calle/colonia -> posiciones de sensores
+        self._calles = {}
+        self._colonias = {}
+        for i in range(len(self.ids)):
+            for variante in _variantes_nombre(str(self.calle[i])):
+                self._calles.setdefault(variante, []).append(i)
+            for variante in _variantes_nombre(str(self.colonia[i])):
+                self._colonias.setdefault(variante, []).append(i)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def direccion_cercana(self, lat, lon, tolerancia=TOLERANCIA):
+        """
+        Regresa la dirección del sensor más cercano dentro de la tolerancia, o None.
+        """
+        celda_lat = int(np.floor(lat / CELDA))
+        celda_lon = int(np.floor(lon / CELDA))
+        mejor, mejor_distancia = None, tolerancia * tolerancia
+        for d_lat in (-1, 0, 1):
+            for d_lon in (-1, 0, 1):
+                for i in self._celdas.get((celda_lat + d_lat, celda_lon + d_lon), ()):
+                    distancia = (self.lat[i] - lat) ** 2 + (self.lon[i] - lon) ** 2
+                    if distancia <= mejor_distancia:
+                        mejor, mejor_distancia = i, distancia
+        if mejor is None:
+            return None
+        partes = [str(p) for p in (self.calle[mejor], self.colonia[mejor], self.ciudad[mejor]) if p]
+        return ', '.join(partes) if partes else None
+
+    @staticmethod
+    def _introducido(palabras, inicio):
+        anterior = inicio - 1
+        if anterior >= 0 and palabras[anterior] in ARTICULOS:
+            anterior -= 1
+        if anterior < 0:
+            return False
+        return palabras[anterior] in INTRODUCTORES_LUGAR or palabras[max(anterior - 1, 0):anterior + 1] == ['cerca', 'de']
+
+    def _buscar_nombres(self, palabras, indice):
+        # Recorre n-gramas de la pregunta, del más largo al más corto, buscando nombres conocidos
+        for n in range(min(MAX_PALABRAS_NOMBRE, len(palabras)), 0, -1):
+            for inicio in range(len(palabras) - n + 1):
+                candidato = ' '.join(palabras[inicio:inicio + n])
+                if candidato in PREFIJOS_VIALIDAD:
+                    continue
+                if candidato in indice and (n > 1 or self._introducido(palabras, inicio)):
+                    return indice[candidato]
+        return None
+
+    def buscar_direccion(self, texto):
+        """
+        Busca calles (y colonias) del gazetteer mencionadas en el texto: nombres de dos o
+        más palabras en cualquier parte, y de una sola palabra solo después de "en", "calle",
+        "colonia", "cerca de", etc. Regresa (lat, lon) del sensor encontrado más cercano al centro
+        de todos ellos, o None. En calles largas o de anillo (Periférico, López Mateos) el promedio
+        puede quedar a kilómetros de la calle; el sensor más cercano siempre está sobre ella.
+        """
+        palabras = normalizar_texto(texto).split()
+        sensores_calle = self._buscar_nombres(palabras, self._calles)
+        sensores_colonia = self._buscar_nombres(palabras, self._colonias)
+
+        sensores = sensores_calle or sensores_colonia
+        if sensores_calle and sensores_colonia:
+            # Si se mencionan ambas, quedarse con los tramos de la calle dentro de la colonia
+            interseccion = sorted(set(sensores_calle) & set(sensores_colonia))
+            sensores = interseccion or sensores_calle
+        if not sensores:
+            return None
+        sensores = np.asarray(sensores)
+        lat, lon = self.lat[sensores], self.lon[sensores]
+        distancias = (lat - lat.mean()) ** 2 + (lon - lon.mean()) ** 2
+        cercano = int(np.argmin(distancias))
+        return (float(lat[cercano]), float(lon[cercano]))
+
+
+def cargar_gazetteer(ruta=GAZETTEER_PATH):
+    if not os.path.exists(ruta):
+        return None
+    return Gazetteer(ruta)
@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Caché persistente de geocodificación inversa (coordenadas -> dirección).
+# Las coordenadas se ajustan a una rejilla para que puntos casi idénticos
+# compartan la misma entrada y no generen otra consulta a Nominatim.
+# También guarda la geocodificación directa (texto normalizado -> coordenadas).
+GEOCACHE_PATH = os.environ.get(
+    "GEOCACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "geocache.sqlite3")
+)
+GEOCACHE_GRID = float(os.environ.get("GEOCACHE_GRID", "0.0005"))  # ~50 m
+GEOCACHE_TTL = int(os.environ.get("GEOCACHE_TTL", str(30 * 24 * 3600)))  # 30 días
+GEOCACHE_MAX_ENTRIES = int(os.environ.get("GEOCACHE_MAX_ENTRIES", "100000"))
+
+
+class CacheGeocodificacion:
+    """
+    Caché SQLite con llaves ajustadas a rejilla, expiración por TTL y desalojo LRU.
+    Se comparte entre reinicios y entre los workers de gunicorn (modo WAL).
+    """
+
+    def __init__(self, ruta=GEOCACHE_PATH, rejilla=GEOCACHE_GRID,
+                 ttl=GEOCACHE_TTL, max_entradas=GEOCACHE_MAX_ENTRIES):
+        self.ruta = ruta
+        self.rejilla = rejilla
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocache (
+                llave TEXT PRIMARY KEY,
+                direccion TEXT,
+                creado REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_geocache_acceso ON geocache (ultimo_acceso)"
+        )
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocache_directa (
+                consulta TEXT PRIMARY KEY,
+                lat REAL,
+                lon REAL,
+                creado REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_geocache_directa_acceso ON geocache_directa (ultimo_acceso)"
+        )
+        self._conn.commit()
+
+    def llave(self, lat, lon):
+        # La rejilla forma parte de la llave: si cambia, las entradas viejas simplemente no coinciden
+        celda_lat = round(float(lat) / self.rejilla)
+        celda_lon = round(float(lon) / self.rejilla)
+        return f"{self.rejilla}:{celda_lat}:{celda_lon}"
+
+    def obtener(self, lat, lon):
+        """
+        Regresa (encontrado, direccion). Una dirección None en caché también
+        cuenta como acierto: Nominatim ya respondió que no hay nada ahí.
+        """
+        llave = self.llave(lat, lon)
+        ahora = time.time()
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT direccion, creado FROM geocache WHERE llave = ?", (llave,)
+            ).fetchone()
+            if fila is None:
+                self.fallos += 1
+                return False, None
+            direccion, creado = fila
+            if self.ttl and ahora - creado > self.ttl:
+                self._conn.execute("DELETE FROM geocache WHERE llave = ?", (llave,))
+                self._conn.commit()
+                self.fallos += 1
+                return False, None
+            self._conn.execute(
+                "UPDATE geocache SET ultimo_acceso = ? WHERE llave = ?", (ahora, llave)
+            )
+            self._conn.commit()
+            self.aciertos += 1
+            return True, direccion
+
+    def guardar(self, lat, lon, direccion):
+        llave = self.llave(lat, lon)
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocache (llave, direccion, creado, ultimo_acceso) "
+                "VALUES (?, ?, ?, ?)",
+                (llave, direccion, ahora, ahora)
+            )
+            self._desalojar()
+            self._conn.commit()
+
+    def obtener_directa(self, consulta):
+        """
+        Geocodificación directa de `consulta` (texto ya normalizado). Regresa (encontrado, (lat, lon) o None).
+        """
+        ahora = time.time()
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT lat, lon, creado FROM geocache_directa WHERE consulta = ?", (consulta,)
+            ).fetchone()
+            if fila is None:
+                self.fallos += 1
+                return False, None
+            lat, lon, creado = fila
+            if self.ttl and ahora - creado > self.ttl:
+                self._conn.execute("DELETE FROM geocache_directa WHERE consulta = ?", (consulta,))
+                self._conn.commit()
+                self.fallos += 1
+                return False, None
+            self._conn.execute(
+                "UPDATE geocache_directa SET ultimo_acceso = ? WHERE consulta = ?", (ahora, consulta)
+            )
+            self._conn.commit()
+            self.aciertos += 1
+            return True, (lat, lon) if lat is not None else None
+
+    def guardar_directa(self, consulta, coordenadas):
+        lat, lon = coordenadas if coordenadas else (None, None)
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocache_directa (consulta, lat, lon, creado, ultimo_acceso) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (consulta, lat, lon, ahora, ahora)
+            )
+            self._desalojar("geocache_directa", "consulta")
+            self._conn.commit()
+
+    def _desalojar(self, tabla="geocache", llave="llave"):
+        total = self._conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+        exceso = total - self.max_entradas
+        if exceso > 0:
+            self._conn.execute(
+                f"DELETE FROM {tabla} WHERE {llave} IN "
+                f"(SELECT {llave} FROM {tabla} ORDER BY ultimo_acceso ASC LIMIT ?)",
+                (exceso,)
+            )
+
+    def estadisticas(self):
+        with self._lock:
+            entradas = self._conn.execute("SELECT COUNT(*) FROM geocache").fetchone()[0]
+            entradas_directas = self._conn.execute("SELECT COUNT(*) FROM geocache_directa").fetchone()[0]
+        consultas = self.aciertos + self.fallos
+        return {
+            'hits': self.aciertos,
+            'misses': self.fallos,
+            'hit_ratio': round(self.aciertos / consultas, 4) if consultas else 0.0,
+            'entries': entradas,
+            'forward_entries': entradas_directas,
+            'grid': self.rejilla,
+            'ttl_seconds': self.ttl
+        }
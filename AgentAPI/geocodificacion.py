@@ -0,0 +1,186 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+
+# Geocodificación inversa concurrente para humanizar respuestas.
+# La latencia de una respuesta queda en la de la búsqueda más lenta (acotada por
+# GEOCODE_DEADLINE) en lugar de la suma de todas.
+GEOCODE_WORKERS = int(os.environ.get("GEOCODE_WORKERS", "8"))
+GEOCODE_DEADLINE = float(os.environ.get("GEOCODE_DEADLINE", "5"))  # segundos por respuesta
+# Puntos a menos de esta distancia (grados, ~11 m) se consideran el mismo
+GEOCODE_DEDUPE_TOLERANCE = float(os.environ.get("GEOCODE_DEDUPE_TOLERANCE", "0.0001"))
+# Política de uso de Nominatim: máximo 1 solicitud por segundo (subir con un servidor propio)
+NOMINATIM_RATE = float(os.environ.get("NOMINATIM_RATE", "1"))
+NOMINATIM_BURST = int(os.environ.get("NOMINATIM_BURST", "1"))
+# Geocodificación directa (dirección de la pregunta): espera máxima por un turno de Nominatim.
+# Alcanza para las preguntas simultáneas de un lote (BATCH_CONCURRENCY) a 1 solicitud por segundo
+GEOCODE_FORWARD_WAIT = float(os.environ.get("GEOCODE_FORWARD_WAIT", "10"))
+# Puntos sin turno de Nominatim que esperan a resolverse en segundo plano (los demás se descartan)
+GEOCODE_BACKGROUND_MAX = int(os.environ.get("GEOCODE_BACKGROUND_MAX", "1000"))
+
+
+class LimitadorTasa:
+    """
+    Token bucket compartido por todos los hilos: `tasa` solicitudes por segundo
+    con ráfagas de hasta `capacidad`.
+    """
+
+    def __init__(self, tasa=NOMINATIM_RATE, capacidad=NOMINATIM_BURST):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._fichas = float(capacidad)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self, limite=None):
+        """
+        Espera una ficha. Regresa False sin consumirla si no habrá una
+        disponible antes de `limite` (time.monotonic()).
+        """
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultimo) * self.tasa)
+                self._ultimo = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return True
+                espera = (1 - self._fichas) / self.tasa
+            if limite is not None and ahora + espera > limite:
+                return False
+            time.sleep(espera)
+
+
+class BusquedasCompartidas:
+    """
+    Agrupa búsquedas simultáneas con la misma llave: la primera consulta el servicio y las
+    demás esperan su resultado (hasta `limite`) en lugar de repetirla. Sirve para que las
+    preguntas de un lote que mencionan la misma zona gasten una sola solicitud a Nominatim.
+    """
+
+    def __init__(self):
+        self._en_curso = {}
+        self._lock = threading.Lock()
+
+    def ejecutar(self, llave, buscar, limite=None):
+        """
+        Regresa (resultado, compartida). `compartida` es True si el resultado vino de la
+        búsqueda de otro hilo; si esa no termina antes de `limite` el resultado es None.
+        """
+        with self._lock:
+            busqueda = self._en_curso.get(llave)
+            propia = busqueda is None
+            if propia:
+                busqueda = self._en_curso[llave] = {'listo': threading.Event(), 'resultado': None}
+        if not propia:
+            espera = None if limite is None else max(0.0, limite - time.monotonic())
+            busqueda['listo'].wait(espera)
+            return busqueda['resultado'], True
+        try:
+            busqueda['resultado'] = buscar()
+            return busqueda['resultado'], False
+        finally:
+            with self._lock:
+                del self._en_curso[llave]
+            busqueda['listo'].set()
+
+
+class BusquedasPendientes:
+    """
+    Cola de puntos que se quedaron sin turno de Nominatim al responder una pregunta. Un hilo
+    los resuelve uno a uno con `geocodificar(lat, lon)` (sin plazo: espera su turno en el mismo
+    limitador) y así quedan en la caché para la próxima pregunta que los mencione.
+    """
+
+    def __init__(self, geocodificar, maximo=GEOCODE_BACKGROUND_MAX):
+        self.geocodificar = geocodificar
+        self.maximo = maximo
+        self.descartados = 0
+        self._cola = queue.Queue()
+        self._pendientes = set()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def agregar(self, llave, lat, lon):
+        with self._lock:
+            if llave in self._pendientes:
+                return
+            if len(self._pendientes) >= self.maximo:
+                self.descartados += 1
+                return
+            self._pendientes.add(llave)
+            # Un hilo por proceso: los workers de gunicorn no heredan el del maestro
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._ciclo, name="geocodificacion-pendiente", daemon=True).start()
+        self._cola.put((llave, lat, lon))
+
+    def pendientes(self):
+        return len(self._pendientes)
+
+    def _ciclo(self):
+        while True:
+            llave, lat, lon = self._cola.get()
+            try:
+                self.geocodificar(lat, lon)
+            except Exception as e:
+                print(f"Error de geocodificación en segundo plano: {e}")
+            finally:
+                with self._lock:
+                    self._pendientes.discard(llave)
+
+
+class ResolutorDirecciones:
+    """
+    Resuelve un conjunto de coordenadas en paralelo con un pool de hilos acotado.
+    `geocodificar(lat, lon, limite)` es la función de búsqueda individual.
+    """
+
+    def __init__(self, geocodificar, hilos=GEOCODE_WORKERS, plazo=GEOCODE_DEADLINE,
+                 tolerancia=GEOCODE_DEDUPE_TOLERANCE):
+        self.geocodificar = geocodificar
+        self.plazo = plazo
+        self.tolerancia = tolerancia
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="geocodificacion")
+
+    def llave(self, lat, lon):
+        return (round(lat / self.tolerancia), round(lon / self.tolerancia))
+
+    def resolver_a_medida(self, puntos):
+        """
+        Generador: emite (punto, dirección o None) para cada (lat, lon) en cuanto se resuelve.
+        Los puntos que no se resuelven antes del plazo no se emiten. Una búsqueda que ya
+        empezó termina en su hilo y guarda el resultado en la caché; los puntos que no
+        alcanzaron turno de Nominatim los encola `geocodificar` (ver BusquedasPendientes).
+        """
+        grupos = {}
+        for lat, lon in puntos:
+            grupos.setdefault(self.llave(lat, lon), []).append((lat, lon))
+
+        limite = time.monotonic() + self.plazo
+        futuros = {
+            self._pool.submit(self.geocodificar, *miembros[0], limite): llave
+            for llave, miembros in grupos.items()
+        }
+        try:
+            for futuro in as_completed(futuros, timeout=self.plazo):
+                direccion = None
+                try:
+                    direccion = futuro.result()
+                except Exception as e:
+                    print(f"Error de geocodificación: {e}")
+                for punto in grupos[futuros[futuro]]:
+                    yield punto, direccion
+        except TimeoutError:
+            pendientes = sum(1 for futuro in futuros if not futuro.done())
+            print(f"   ⏱️  {pendientes} direcciones sin resolver a tiempo, se dejan las coordenadas")
+
+    def resolver(self, puntos):
+        """
+        Recibe [(lat, lon), ...] y regresa {(lat, lon): dirección o None}.
+        """
+        direcciones = {punto: None for punto in puntos}
+        direcciones.update(self.resolver_a_medida(puntos))
+        return direcciones
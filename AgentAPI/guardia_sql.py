@@ -0,0 +1,227 @@
+import _thread
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+
+import sqlglot
+from sqlglot import exp
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from metricas import GUARDIA_SQL
+from recursos import AGENT_MAX_ROWS, AGENT_MAX_QUERY_COST, AGENT_MAX_RESULT_CHARS, AGENT_STATEMENT_TIMEOUT_MS
+
+# Límites que se aplican al SQL del agente antes de ejecutarlo y a su resultado antes de
+# regresarlo al modelo. El prompt pide LIMIT 50 y agregaciones; aquí se hace cumplir.
+
+# Una sola sentencia que empieza con SELECT o WITH; se usa solo si sqlglot no entiende la consulta
+SOLO_LECTURA = re.compile(r'^\s*(SELECT|WITH)\b[^;]*;?\s*$', re.IGNORECASE | re.DOTALL)
+ESCRITURA = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE|CREATE|ALTER|DROP|TRUNCATE|COPY|GRANT|CALL)\b', re.IGNORECASE)
+
+# Nodos que no pueden aparecer en una consulta de lectura (incluye CTEs que modifican datos,
+# SELECT ... INTO y SELECT ... FOR UPDATE)
+NODOS_ESCRITURA = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter,
+                   exp.TruncateTable, exp.Copy, exp.Command, exp.Set, exp.Into, exp.Lock)
+
+# Funciones que un SELECT no debe llamar (por prefijo): cambian la configuración de la sesión
+# (set_config quitaría el statement_timeout de SET LOCAL en la conexión del pool), duermen, cortan
+# otras sesiones, salen a otras bases o leen y escriben archivos del servidor
+FUNCIONES_PROHIBIDAS = (
+    'set_config', 'pg_sleep', 'pg_terminate_backend', 'pg_cancel_backend', 'pg_reload_conf',
+    'pg_rotate_logfile', 'pg_advisory', 'pg_try_advisory', 'pg_notify', 'pg_read_file',
+    'pg_read_binary_file', 'pg_ls_', 'pg_stat_file', 'pg_file_', 'pg_logdir_ls', 'dblink', 'lo_',
+)
+PATRON_FUNCIONES = re.compile(
+    r'\b(' + '|'.join(re.escape(f) + r'\w*' for f in FUNCIONES_PROHIBIDAS) + r')\s*\(', re.IGNORECASE
+)
+
+
+class ConsultaRechazada(SQLAlchemyError):
+    """
+    Consulta del agente que no se ejecuta. Es un SQLAlchemyError para que sql_db_query le
+    regrese el mensaje al agente como cualquier error de SQL y pueda corregir la consulta.
+    """
+
+
+def es_solo_lectura(consulta):
+    return (bool(SOLO_LECTURA.match(consulta)) and not ESCRITURA.search(consulta)
+            and not PATRON_FUNCIONES.search(consulta))
+
+
+def _funcion_prohibida(sentencia):
+    for funcion in sentencia.find_all(exp.Func):
+        nombre = (funcion.name if isinstance(funcion, exp.Anonymous) else funcion.sql_name()).lower()
+        if nombre.startswith(FUNCIONES_PROHIBIDAS):
+            return nombre
+    return None
+
+
+def _valor_limite(limite):
+    # LIMIT n o FETCH FIRST n ROWS; None si no hay límite o no es un número fijo (LIMIT ALL, expresiones)
+    if limite is None:
+        return None
+    valor = limite.args.get('count') if isinstance(limite, exp.Fetch) else limite.expression
+    if isinstance(valor, exp.Literal) and valor.is_int:
+        return int(valor.name)
+    return None
+
+
+def preparar(consulta):
+    """
+    Revisa el SQL del agente: una sola sentencia de lectura con a lo más AGENT_MAX_ROWS filas.
+    Regresa el SQL a ejecutar (con el LIMIT agregado o reducido si hacía falta) o lanza ConsultaRechazada.
+    """
+    try:
+        sentencias = [s for s in sqlglot.parse(consulta, read='postgres') if s is not None]
+    except sqlglot.errors.SqlglotError:
+        # SQL que sqlglot no entiende: pasa tal cual si parece de lectura; en Aurora la acotan
+        # EXPLAIN y statement_timeout, y el resultado se recorta igual que los demás
+        if not es_solo_lectura(consulta):
+            GUARDIA_SQL.incrementar(action='rejected_statement')
+            raise ConsultaRechazada("Solo se permiten consultas de lectura (SELECT o WITH ... SELECT)")
+        GUARDIA_SQL.incrementar(action='unparsed')
+        return consulta
+
+    if len(sentencias) != 1:
+        GUARDIA_SQL.incrementar(action='rejected_statement')
+        raise ConsultaRechazada("Ejecuta una sola sentencia SQL por consulta")
+    sentencia = sentencias[0]
+    if not isinstance(sentencia, exp.Query) or sentencia.find(*NODOS_ESCRITURA):
+        GUARDIA_SQL.incrementar(action='rejected_statement')
+        raise ConsultaRechazada("Solo se permiten consultas de lectura (SELECT o WITH ... SELECT)")
+    funcion = _funcion_prohibida(sentencia)
+    if funcion:
+        GUARDIA_SQL.incrementar(action='rejected_function')
+        raise ConsultaRechazada(f"La función {funcion} no está permitida en las consultas del agente")
+
+    limite = sentencia.args.get('limit')
+    valor = _valor_limite(limite)
+    if valor is not None and valor <= AGENT_MAX_ROWS:
+        # Se ejecuta el texto original: solo se regenera el SQL cuando hay que cambiar el LIMIT
+        return consulta
+    GUARDIA_SQL.incrementar(action='limit_added' if limite is None else 'limit_lowered')
+    reescrita = sentencia.limit(AGENT_MAX_ROWS).sql(dialect='postgres')
+    print(f"   ✂️  LIMIT {AGENT_MAX_ROWS} aplicado a la consulta del agente")
+    return reescrita
+
+
+def verificar_costo(conexion, consulta):
+    """
+    Pide a Postgres el plan de la consulta (sin ejecutarla) y la rechaza si su costo
+    estimado pasa de AGENT_MAX_QUERY_COST.
+    """
+    if AGENT_MAX_QUERY_COST <= 0:
+        return
+    plan = conexion.execute(text(f"EXPLAIN (FORMAT JSON) {consulta}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    costo = plan[0]['Plan']['Total Cost']
+    if costo > AGENT_MAX_QUERY_COST:
+        GUARDIA_SQL.incrementar(action='rejected_cost')
+        print(f"   🚫 Consulta rechazada por costo estimado: {costo:,.0f}")
+        raise ConsultaRechazada(
+            f"Consulta demasiado costosa (costo estimado {costo:,.0f}, máximo {AGENT_MAX_QUERY_COST:,.0f}). "
+            "Usa las vistas resumen traffic_por_*, filtra por captured_at o grid_cell, o agrega con GROUP BY "
+            "antes de ordenar."
+        )
+
+
+def recortar_resultado(resultado):
+    """
+    Recorta el resultado de sql_db_query a AGENT_MAX_RESULT_CHARS caracteres, en el límite de
+    una fila, y avisa al modelo que está incompleto.
+    """
+    if not isinstance(resultado, str) or len(resultado) <= AGENT_MAX_RESULT_CHARS:
+        return resultado
+    # Tuplas "[(...), (...)]" o, con include_columns, diccionarios "[{...}, {...}]"
+    corte = max(resultado.rfind('), (', 0, AGENT_MAX_RESULT_CHARS), resultado.rfind('}, {', 0, AGENT_MAX_RESULT_CHARS))
+    recortado = resultado[:corte + 1] + ']' if corte > 0 else resultado[:AGENT_MAX_RESULT_CHARS]
+    GUARDIA_SQL.incrementar(action='truncated')
+    # Sin paréntesis ni corchetes en el aviso: contar_filas sigue contando solo las filas mostradas
+    return (f"{recortado}\n-- Resultado recortado: {len(resultado):,} caracteres, se muestran {len(recortado):,}. "
+            "Usa agregaciones con GROUP BY o un LIMIT menor.")
+
+
+def _hilos_del_sistema():
+    # Con gevent (gunicorn.conf.py) threading y time.sleep son de gevent: el vigilante necesita un
+    # hilo y un lock del sistema para revisar los plazos sin depender del bucle del worker
+    try:
+        from gevent.monkey import get_original
+        return (get_original('_thread', 'start_new_thread'), get_original('time', 'sleep'),
+                get_original('_thread', 'allocate_lock'))
+    except ImportError:
+        return _thread.start_new_thread, time.sleep, _thread.allocate_lock
+
+
+def fuera_del_bucle(funcion, *args, **kwargs):
+    """
+    Con gevent corre `funcion` en el threadpool del hub (un hilo del sistema): solo espera el
+    greenlet que la llama y las demás solicitudes del worker siguen atendiéndose. DuckDB no cede
+    el control como psycopg2 con psycogreen, así que sus consultas se ejecutan por aquí.
+    Sin gevent la llama directamente.
+    """
+    try:
+        from gevent import get_hub, monkey
+    except ImportError:
+        return funcion(*args, **kwargs)
+    if not monkey.is_module_patched('threading'):
+        return funcion(*args, **kwargs)
+    return get_hub().threadpool.apply(funcion, args, kwargs)
+
+
+class Vigilante:
+    """
+    statement_timeout para la base local: DuckDB no lo tiene, así que un hilo revisa los plazos
+    de las consultas en curso e interrumpe (connection.interrupt()) las que se pasen.
+    """
+
+    def __init__(self, segundos=AGENT_STATEMENT_TIMEOUT_MS / 1000, intervalo=0.1):
+        self.segundos = segundos
+        self.intervalo = intervalo
+        self.plazos = {}
+        self._pid = None
+        # Sacar el plazo e interrumpir van juntos: una consulta que termina mientras tanto no
+        # se cuenta como interrumpida ni la interrupción alcanza a la siguiente de la conexión
+        self._lock = _hilos_del_sistema()[2]()
+
+    @contextmanager
+    def vigilar(self, conexion):
+        llave = object()
+        with self._lock:
+            self.plazos[llave] = (time.monotonic() + self.segundos, conexion)
+        self._iniciar()
+        try:
+            yield
+        finally:
+            with self._lock:
+                interrumpida = self.plazos.pop(llave, None) is None
+            if interrumpida:
+                GUARDIA_SQL.incrementar(action='interrupted')
+                print(f"   ⏱️  Consulta local interrumpida a los {self.segundos:g}s")
+
+    def _iniciar(self):
+        # Un hilo por proceso: los workers de gunicorn no heredan el del maestro
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            iniciar_hilo, _, _ = _hilos_del_sistema()
+            iniciar_hilo(self._revisar, ())
+
+    def _revisar(self):
+        _, dormir, _ = _hilos_del_sistema()
+        while True:
+            dormir(self.intervalo)
+            ahora = time.monotonic()
+            with self._lock:
+                for llave, (plazo, conexion) in list(self.plazos.items()):
+                    if ahora < plazo:
+                        continue
+                    del self.plazos[llave]
+                    try:
+                        conexion.interrupt()
+                    except Exception as e:
+                        print(f"⚠️  No se pudo interrumpir la consulta local: {e}")
+
+
+vigilante = Vigilante()
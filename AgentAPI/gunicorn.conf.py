@@ -0,0 +1,50 @@
+import os
+
+# Parchear antes de cargar la app: con preload_app los locks y semáforos de app.py se crean
+# en el proceso maestro y deben ser los de gevent, no los del sistema
+from gevent import monkey
+monkey.patch_all()
+
+# psycopg2 es una extensión en C: sin esto cada consulta bloquea todo el worker
+from psycogreen.gevent import patch_psycopg  # noqa: E402
+patch_psycopg()
+
+# Servidor de producción: gunicorn -c gunicorn.conf.py app:app
+# Los workers gevent atienden cada solicitud en un greenlet: mientras una pregunta espera
+# a OpenAI, a Aurora o a Nominatim, el mismo proceso sigue atendiendo otras.
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+worker_class = "gevent"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+# Conexiones simultáneas por worker (el límite de preguntas en curso está en app.py)
+worker_connections = int(os.environ.get("WORKER_CONNECTIONS", "100"))
+# Con gevent es solo el latido del worker; el tiempo por pregunta lo limita AGENT_TIMEOUT
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+# La app se importa una vez en el maestro y los workers la heredan ya cargada (copy-on-write)
+preload_app = os.environ.get("PRELOAD_APP", "1") == "1"
+
+
+def when_ready(server):
+    # Módulos de LangChain, gazetteer y esquema.json: sin red, compartidos por todos los workers
+    if preload_app:
+        from app import recursos
+        recursos.precalentar()
+
+
+def post_fork(server, worker):
+    # Si algo abrió conexiones en el maestro (por ejemplo benchmark/servidor.py), el worker no debe reusarlas
+    from app import recursos
+    for motor in ('engine', 'engine_local'):
+        if recursos.__dict__.get(motor) is not None:
+            recursos.__dict__[motor].dispose(close=False)
+
+
+def post_worker_init(worker):
+    # Conexiones y sockets no se comparten entre procesos: cada worker arranca su hilo de estadísticas
+    from app import recursos
+    try:
+        recursos.estadisticas_tabla
+    except Exception as e:
+        print(f"⚠️  Estadísticas de la tabla pendientes: {e}")
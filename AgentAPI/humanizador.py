@@ -0,0 +1,127 @@
+import re
+
+# Post-proceso de las respuestas del agente: coordenadas -> direcciones, ids fuera y
+# términos técnicos -> términos para humanos. La respuesta se recorre una sola vez con un
+# patrón combinado y se reconstruye con tablas de búsqueda, así que el costo crece
+# linealmente con el largo de la respuesta (ver benchmark/micro_humanizador.py).
+
+# Patrón para detectar coordenadas en varios formatos
+# Formato: "coordx: -103.xxx, coordy: 20.xxx" o "(-103.xxx, 20.xxx)" o "longitud: -103.xxx, latitud: 20.xxx"
+PATRONES_COORDENADAS = [
+    r'coordx[:\s]+([-\d.]+)[,\s]+coordy[:\s]+([-\d.]+)',
+    r'\(([-\d.]+)[,\s]+([-\d.]+)\)',
+    r'longitud[:\s]+([-\d.]+)[,\s]+latitud[:\s]+([-\d.]+)',
+    r'lon[:\s]+([-\d.]+)[,\s]+lat[:\s]+([-\d.]+)'
+]
+
+# Los IDs no son útiles para humanos: "id: abc123" o "ID: abc123" se reemplaza por esto
+TEXTO_ID = "(ubicación)"
+
+TERMINOS_HUMANOS = {
+    'exponential_color_weighting': 'nivel de congestión',
+    'linear_color_weighting': 'índice de tráfico',
+    'predominant_color': 'estado del tráfico',
+    'coordx': 'longitud',
+    'coordy': 'latitud',
+    'red_wine': '🍷 MUY PESADO (congestión crítica)',
+    'green': '🟢 LIGERO (fluido)',
+    'yellow': '🟡 MEDIO (moderado)',
+    'orange': '🟠 MEDIO-ALTO (algo congestionado)',
+    'red': '🔴 PESADO (muy congestionado)'
+}
+
+_TERMINOS = '|'.join(sorted((re.escape(t) for t in TERMINOS_HUMANOS), key=len, reverse=True))
+PATRON_TERMINOS = re.compile(rf'\b(?:{_TERMINOS})\b', re.IGNORECASE)
+
+# Primeras letras posibles de una coincidencia: el lookahead descarta de inmediato las
+# posiciones que no pueden empezar ninguna alternativa (la mitad del tiempo del recorrido)
+_INICIALES = ''.join(sorted({t[0] for t in TERMINOS_HUMANOS} | {'c', '(', 'l', 'i'}))
+
+# Coordenadas primero: "coordx: -103.3, coordy: 20.6" es una coordenada antes que el término coordx
+PATRON_HUMANIZAR = re.compile(
+    f'(?=[{re.escape(_INICIALES)}])(?:'
+    '(?P<coordenadas>' + '|'.join(f'(?:{p})' for p in PATRONES_COORDENADAS) + ')'
+    r'|(?P<id>\bid:[:\s]*[\w-]+)'
+    rf'|(?P<termino>\b(?:{_TERMINOS})\b))',
+    re.IGNORECASE
+)
+
+
+def _termino_humano(coincidencia):
+    return TERMINOS_HUMANOS[coincidencia.group(0).lower()]
+
+
+def _coordenada_gdl(coincidencia):
+    # Los grupos de las cuatro variantes están en orden; solo un par (lon, lat) coincide
+    grupos = [g for g in coincidencia.groups()[1:9] if g is not None]
+    try:
+        lon, lat = float(grupos[0]), float(grupos[1])
+    except ValueError:
+        return None
+    # Asegurarse de que sean coordenadas válidas para Guadalajara
+    if -103.6 < lon < -103.0 and 20.4 < lat < 20.9:
+        return lat, lon
+    return None
+
+
+def tokenizar(texto):
+    """
+    Parte el texto en piezas con una sola pasada: cadenas sin cambios y tuplas
+    (tipo, original, coordenadas) para coordenadas, ids y términos técnicos.
+    """
+    piezas = []
+    inicio = 0
+    for coincidencia in PATRON_HUMANIZAR.finditer(texto):
+        if coincidencia.start() > inicio:
+            piezas.append(texto[inicio:coincidencia.start()])
+        tipo = coincidencia.lastgroup
+        punto = _coordenada_gdl(coincidencia) if tipo == 'coordenadas' else None
+        piezas.append((tipo, coincidencia.group(0), punto))
+        inicio = coincidencia.end()
+    if inicio < len(texto):
+        piezas.append(texto[inicio:])
+    return piezas
+
+
+def coordenadas_en(piezas):
+    """
+    {(lat, lon): [textos originales]} de las coordenadas de Guadalajara en las piezas.
+    """
+    coordenadas = {}
+    for pieza in piezas:
+        if isinstance(pieza, tuple) and pieza[2] is not None:
+            originales = coordenadas.setdefault(pieza[2], [])
+            if pieza[1] not in originales:
+                originales.append(pieza[1])
+    return coordenadas
+
+
+def extraer_coordenadas(texto):
+    """
+    Regresa {(lat, lon): [textos originales]} con las coordenadas de Guadalajara que aparecen en el texto.
+    """
+    return coordenadas_en(tokenizar(texto))
+
+
+def reescribir(piezas, direcciones):
+    """
+    Une las piezas reemplazando cada coordenada por su dirección (`direcciones`: original -> texto),
+    cada id por TEXTO_ID y cada término técnico por el de TERMINOS_HUMANOS.
+    Las direcciones no se vuelven a procesar.
+    """
+    partes = []
+    for pieza in piezas:
+        if not isinstance(pieza, tuple):
+            partes.append(pieza)
+            continue
+        tipo, original, _ = pieza
+        if tipo == 'termino':
+            partes.append(TERMINOS_HUMANOS[original.lower()])
+        elif tipo == 'id':
+            partes.append(TEXTO_ID)
+        elif original in direcciones:
+            partes.append(direcciones[original])
+        else:
+            # Coordenada sin dirección: se deja, pero con "longitud"/"latitud" en lugar de coordx/coordy
+            partes.append(PATRON_TERMINOS.sub(_termino_humano, original))
+    return ''.join(partes)
@@ -0,0 +1,57 @@
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from metricas import LLAMADAS_LLM, TOKENS_LLM, HERRAMIENTAS, FILAS_SQL, contar_filas, uso_de_tokens
+
+# Callback de LangChain para metricas.Traza. Está aparte para que importar metricas (y app.py)
+# no cargue LangChain; Traza.manejador() lo importa con la primera pregunta que usa el agente.
+
+
+class ManejadorMetricas(BaseCallbackHandler):
+    """
+    Callback de LangChain: un span por cada llamada al LLM (con tokens) y por cada
+    herramienta del agente (con el SQL y las filas que regresó).
+    """
+
+    def __init__(self, traza):
+        self.traza = traza
+        self._abiertos = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._abiertos[run_id] = (time.perf_counter(), None, None)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._abiertos[run_id] = (time.perf_counter(), None, None)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        inicio, _, _ = self._abiertos.pop(run_id, (time.perf_counter(), None, None))
+        duracion = time.perf_counter() - inicio
+        modelo, tokens_entrada, tokens_salida = uso_de_tokens(response)
+        LLAMADAS_LLM.observar(duracion, model=modelo)
+        TOKENS_LLM.incrementar(tokens_entrada, model=modelo, type="prompt")
+        TOKENS_LLM.incrementar(tokens_salida, model=modelo, type="completion")
+        self.traza.agregar_span("llm", inicio, duracion, modelo=modelo,
+                                tokens_entrada=tokens_entrada, tokens_salida=tokens_salida)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        inicio, _, _ = self._abiertos.pop(run_id, (time.perf_counter(), None, None))
+        self.traza.agregar_span("llm", inicio, time.perf_counter() - inicio, error=str(error))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._abiertos[run_id] = (time.perf_counter(), (serialized or {}).get("name", ""), input_str)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        inicio, herramienta, entrada = self._abiertos.pop(run_id, (time.perf_counter(), "", ""))
+        duracion = time.perf_counter() - inicio
+        HERRAMIENTAS.observar(duracion, tool=herramienta)
+        atributos = {"herramienta": herramienta, "entrada": str(entrada)[:1000]}
+        if herramienta == "sql_db_query":
+            atributos["filas"] = contar_filas(str(output))
+            FILAS_SQL.observar(atributos["filas"], tool=herramienta)
+        self.traza.agregar_span("herramienta", inicio, duracion, **atributos)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        inicio, herramienta, entrada = self._abiertos.pop(run_id, (time.perf_counter(), "", ""))
+        self.traza.agregar_span("herramienta", inicio, time.perf_counter() - inicio,
+                                herramienta=herramienta, entrada=str(entrada)[:1000], error=str(error))
@@ -0,0 +1,257 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Métricas por etapa de /ask en formato de texto de Prometheus (GET /metrics) y,
+# opcionalmente, una traza JSON por pregunta en Logs/.
+# Cada proceso de gunicorn lleva sus propios contadores.
+TRACE_LOG = os.environ.get("TRACE_LOG", "0") == "1"
+TRACE_LOG_PATH = os.environ.get(
+    "TRACE_LOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "Logs", "trazas.jsonl")
+)
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_FILAS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+def _etiquetas(nombres, valores):
+    if not nombres:
+        return ""
+    pares = ",".join(f'{n}="{str(v).replace(chr(34), chr(39))}"' for n, v in zip(nombres, valores))
+    return "{" + pares + "}"
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        llave = tuple(etiquetas.get(n, "") for n in self.etiquetas)
+        with self._lock:
+            serie = self._series.setdefault(llave, [[0] * len(self.buckets), 0, 0.0])
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+            serie[1] += 1
+            serie[2] += valor
+
+    def lineas(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            for llave, (conteos, total, suma) in sorted(self._series.items()):
+                for limite, conteo in zip(self.buckets, conteos):
+                    etiquetas = _etiquetas(self.etiquetas + ("le",), llave + (limite,))
+                    lineas.append(f"{self.nombre}_bucket{etiquetas} {conteo}")
+                etiquetas = _etiquetas(self.etiquetas + ("le",), llave + ("+Inf",))
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {total}")
+                lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, llave)} {suma}")
+                lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, llave)} {total}")
+        return lineas
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, valor=1, **etiquetas):
+        llave = tuple(etiquetas.get(n, "") for n in self.etiquetas)
+        with self._lock:
+            self._series[llave] = self._series.get(llave, 0) + valor
+
+    def lineas(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            for llave, valor in sorted(self._series.items()):
+                lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, llave)} {valor}")
+        return lineas
+
+
+class Medidor:
+    """
+    Valor que se calcula al momento de exportar (por ejemplo, el hit ratio de una caché).
+    """
+
+    def __init__(self, nombre, ayuda, funcion):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+
+    def lineas(self):
+        try:
+            valor = self.funcion()
+        except Exception:
+            return []
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} gauge", f"{self.nombre} {valor}"]
+
+
+class Registro:
+    def __init__(self):
+        self.metricas = []
+
+    def agregar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def exportar(self):
+        lineas = []
+        for metrica in self.metricas:
+            lineas.extend(metrica.lineas())
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+SOLICITUDES = registro.agregar(Histograma(
+    "traffic_request_seconds", "Duración total de una pregunta", ["endpoint", "result"]))
+ETAPAS = registro.agregar(Histograma(
+    "traffic_stage_seconds", "Duración de cada etapa de una pregunta", ["stage"]))
+LLAMADAS_LLM = registro.agregar(Histograma(
+    "traffic_llm_call_seconds", "Duración de cada llamada al LLM dentro del agente", ["model"]))
+TOKENS_LLM = registro.agregar(Contador(
+    "traffic_llm_tokens_total", "Tokens consumidos por el agente", ["model", "type"]))
+HERRAMIENTAS = registro.agregar(Histograma(
+    "traffic_agent_tool_seconds", "Duración de cada herramienta que usa el agente", ["tool"]))
+FILAS_SQL = registro.agregar(Histograma(
+    "traffic_sql_rows", "Filas regresadas por cada consulta del agente", ["tool"], BUCKETS_FILAS))
+CONSULTAS_SQL = registro.agregar(Contador(
+    "traffic_sql_queries_total", "Consultas del agente y de las plantillas por base que las respondió",
+    ["backend"]))
+GUARDIA_SQL = registro.agregar(Contador(
+    "traffic_sql_guardrail_total", "Consultas del agente reescritas, rechazadas o recortadas por guardia_sql.py",
+    ["action"]))
+GEOCODIFICACION = registro.agregar(Contador(
+    "traffic_geocode_lookups_total", "Búsquedas de geocodificación por origen de la respuesta",
+    ["direction", "source"]))
+
+_lock_archivo = threading.Lock()
+
+
+def contar_filas(observacion):
+    """
+    Cuenta las filas en el resultado de sql_db_query (el repr de una lista de tuplas).
+    """
+    filas = 0
+    profundidad = 0
+    comilla = None
+    for caracter in observacion:
+        if comilla:
+            if caracter == comilla:
+                comilla = None
+        elif caracter in "'\"":
+            comilla = caracter
+        elif caracter in '([':
+            profundidad += 1
+            if profundidad == 2 and caracter == '(':
+                filas += 1
+        elif caracter in ')]':
+            profundidad -= 1
+    return filas
+
+
+class Traza:
+    """
+    Spans de una pregunta. Cada etapa se registra en el histograma de etapas y,
+    si TRACE_LOG=1, la traza completa se agrega como una línea JSON a TRACE_LOG_PATH.
+    """
+
+    def __init__(self, endpoint, pregunta):
+        self.id = uuid.uuid4().hex[:12]
+        self.endpoint = endpoint
+        self.pregunta = pregunta
+        self.resultado = "desconocido"
+        self.inicio = time.time()
+        self._t0 = time.perf_counter()
+        self.spans = []
+
+    def agregar_span(self, nombre, inicio, duracion, **atributos):
+        self.spans.append({
+            "etapa": nombre,
+            "inicio_ms": round((inicio - self._t0) * 1000, 1),
+            "ms": round(duracion * 1000, 1),
+            **atributos
+        })
+
+    @contextmanager
+    def etapa(self, nombre, **atributos):
+        """
+        Mide el bloque; el dict que regresa se puede completar con atributos del span.
+        """
+        inicio = time.perf_counter()
+        try:
+            yield atributos
+        except GeneratorExit:
+            atributos["cancelada"] = True
+            raise
+        except Exception as e:
+            atributos["error"] = str(e)
+            raise
+        finally:
+            duracion = time.perf_counter() - inicio
+            ETAPAS.observar(duracion, stage=nombre)
+            self.agregar_span(nombre, inicio, duracion, **atributos)
+
+    def manejador(self):
+        # LangChain se importa aquí, con el primer agente, y no al importar app.py
+        from manejador_metricas import ManejadorMetricas
+        return ManejadorMetricas(self)
+
+    def terminar(self):
+        duracion = time.perf_counter() - self._t0
+        SOLICITUDES.observar(duracion, endpoint=self.endpoint, result=self.resultado)
+        if not TRACE_LOG:
+            return
+        linea = json.dumps({
+            "id": self.id,
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.inicio)),
+            "endpoint": self.endpoint,
+            "pregunta": self.pregunta,
+            "resultado": self.resultado,
+            "ms": round(duracion * 1000, 1),
+            "spans": self.spans
+        }, ensure_ascii=False, default=str)
+        try:
+            with _lock_archivo:
+                with open(TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+                    f.write(linea + "\n")
+        except OSError as e:
+            print(f"⚠️  No se pudo escribir la traza: {e}")
+
+
+def uso_de_tokens(response):
+    """
+    Regresa (modelo, tokens de entrada, tokens de salida) de un LLMResult.
+    El agente llama al modelo en modo streaming y ahí llm_output viene vacío: el uso
+    está en usage_metadata de cada mensaje (ChatOpenAI con stream_usage=True).
+    """
+    modelo = ""
+    tokens_entrada = tokens_salida = 0
+    for generaciones in response.generations:
+        for generacion in generaciones:
+            mensaje = getattr(generacion, "message", None)
+            if mensaje is None:
+                continue
+            modelo = (getattr(mensaje, "response_metadata", None) or {}).get("model_name") or modelo
+            uso = getattr(mensaje, "usage_metadata", None) or {}
+            tokens_entrada += uso.get("input_tokens", 0)
+            tokens_salida += uso.get("output_tokens", 0)
+    if not tokens_entrada and not tokens_salida:
+        # Llamadas sin streaming de modelos que solo reportan en llm_output
+        salida = response.llm_output or {}
+        uso = salida.get("token_usage") or {}
+        tokens_entrada = uso.get("prompt_tokens", 0)
+        tokens_salida = uso.get("completion_tokens", 0)
+        modelo = modelo or salida.get("model_name", "")
+    return modelo, tokens_entrada, tokens_salida
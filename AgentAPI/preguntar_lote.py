@@ -0,0 +1,116 @@
+import argparse
+import csv
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# Cliente de /ask/batch: envía un archivo de preguntas (una por línea) y escribe cada
+# respuesta en cuanto el servidor la termina, sin esperar al resto del lote.
+#
+#   python preguntar_lote.py preguntas.txt --salida respuestas.csv
+#   python preguntar_lote.py preguntas.txt --url http://mi-servidor --concurrencia 4 --salida respuestas.jsonl
+#   cat preguntas.txt | python preguntar_lote.py -            (JSON lines a la salida estándar)
+
+COLUMNAS = ['index', 'question', 'answer', 'cached', 'success', 'error', 'duplicate_of', 'seconds']
+
+
+def leer_preguntas(ruta):
+    archivo = sys.stdin if ruta == '-' else open(ruta, encoding='utf-8')
+    with archivo:
+        return [linea.strip() for linea in archivo if linea.strip() and not linea.startswith('#')]
+
+
+def enviar_lote(url, preguntas, concurrencia=None, timeout=300):
+    """
+    Generador: emite cada línea JSON de /ask/batch conforme llega.
+    `timeout` es el máximo de segundos sin recibir ninguna respuesta.
+    """
+    cuerpo = {'questions': preguntas}
+    if concurrencia:
+        cuerpo['concurrency'] = concurrencia
+    solicitud = urllib.request.Request(
+        url.rstrip('/') + '/ask/batch',
+        data=json.dumps(cuerpo, ensure_ascii=False).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}
+    )
+    with urllib.request.urlopen(solicitud, timeout=timeout) as respuesta:
+        for linea in respuesta:
+            if linea.strip():
+                yield json.loads(linea)
+
+
+class Escritor:
+    """
+    Escribe los resultados como JSON lines o, si la salida termina en .csv, como CSV.
+    """
+
+    def __init__(self, ruta):
+        self.archivo = sys.stdout if ruta is None else open(ruta, 'w', encoding='utf-8', newline='')
+        self.csv = None
+        if ruta is not None and ruta.endswith('.csv'):
+            self.csv = csv.DictWriter(self.archivo, fieldnames=COLUMNAS, extrasaction='ignore')
+            self.csv.writeheader()
+
+    def escribir(self, resultado):
+        if self.csv is not None:
+            self.csv.writerow(resultado)
+        else:
+            self.archivo.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+        self.archivo.flush()
+
+    def cerrar(self):
+        if self.archivo is not sys.stdout:
+            self.archivo.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Envía un lote de preguntas a /ask/batch")
+    parser.add_argument('preguntas', help="archivo con una pregunta por línea ('-' para la entrada estándar)")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--salida', help="archivo .csv o .jsonl (por omisión, JSON lines a la salida estándar)")
+    parser.add_argument('--concurrencia', type=int, help="preguntas a la vez (el servidor la limita a BATCH_CONCURRENCY)")
+    parser.add_argument('--por-solicitud', type=int, default=1000,
+                        help="preguntas por solicitud; no debe pasar de BATCH_MAX_QUESTIONS del servidor")
+    parser.add_argument('--timeout', type=float, default=300, help="segundos máximos sin recibir respuestas")
+    args = parser.parse_args()
+
+    preguntas = leer_preguntas(args.preguntas)
+    if not preguntas:
+        raise SystemExit("No hay preguntas en el archivo")
+
+    escritor = Escritor(args.salida)
+    inicio = time.perf_counter()
+    terminadas = 0
+    errores = 0
+    try:
+        for desde in range(0, len(preguntas), args.por_solicitud):
+            parte = preguntas[desde:desde + args.por_solicitud]
+            for resultado in enviar_lote(args.url, parte, args.concurrencia, args.timeout):
+                if 'summary' in resultado:
+                    continue
+                # Índices relativos al archivo completo, no a la solicitud
+                resultado['index'] += desde
+                if 'duplicate_of' in resultado:
+                    resultado['duplicate_of'] += desde
+                terminadas += 1
+                errores += not resultado['success']
+                escritor.escribir(resultado)
+                estado = '✅' if resultado['success'] else '❌'
+                print(f"[{terminadas}/{len(preguntas)}] {estado} {resultado['question'][:70]}", file=sys.stderr)
+    except urllib.error.HTTPError as e:
+        raise SystemExit(f"El servidor respondió {e.code}: {e.read().decode('utf-8', 'replace')}")
+    finally:
+        escritor.cerrar()
+
+    print("\n========== RESUMEN ==========", file=sys.stderr)
+    print(f"Preguntas: {len(preguntas):,} ({terminadas:,} respondidas, {errores:,} con error)", file=sys.stderr)
+    print(f"Tiempo: {time.perf_counter() - inicio:,.1f}s", file=sys.stderr)
+    print("=============================", file=sys.stderr)
+    if errores:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
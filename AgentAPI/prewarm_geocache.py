@@ -0,0 +1,43 @@
+from sqlalchemy import text
+from tqdm import tqdm
+
+from app import recursos, direccion_nominatim
+
+cache_geocodificacion = recursos.cache_geocodificacion
+
+print("Obteniendo ubicaciones distintas de sensores en traffic_data...")
+with recursos.engine.connect() as conn:
+    ubicaciones = conn.execute(text("""
+        SELECT DISTINCT coordx, coordy
+        FROM traffic_data
+        WHERE coordx IS NOT NULL AND coordy IS NOT NULL
+    """)).fetchall()
+print(f"✓ {len(ubicaciones):,} ubicaciones distintas")
+
+# El límite de 1 solicitud por segundo de Nominatim lo aplica direccion_nominatim, que también
+# guarda el resultado en la caché. Varias ubicaciones pueden caer en la misma celda de la rejilla
+pendientes = {}
+for coordx, coordy in ubicaciones:
+    llave = cache_geocodificacion.llave(coordy, coordx)
+    if llave not in pendientes:
+        pendientes[llave] = (coordy, coordx)
+
+nuevas = 0
+locales = 0
+for lat, lon in tqdm(pendientes.values()):
+    # Las que resuelve el gazetteer nunca llegan a la caché ni a Nominatim
+    if recursos.gazetteer is not None and recursos.gazetteer.direccion_cercana(lat, lon):
+        locales += 1
+        continue
+    encontrada, _ = cache_geocodificacion.obtener(lat, lon)
+    if encontrada:
+        continue
+    direccion_nominatim(lat, lon)
+    nuevas += 1
+
+print("\n========== RESUMEN ==========")
+print(f"Celdas de rejilla: {len(pendientes):,}")
+print(f"Resueltas por el gazetteer: {locales:,}")
+print(f"Nuevas direcciones geocodificadas: {nuevas:,}")
+print(f"Caché: {cache_geocodificacion.estadisticas()}")
+print("=============================")
@@ -0,0 +1,269 @@
+import json
+import os
+import threading
+
+from sqlalchemy import create_engine, inspect, text
+
+AURORA_HOST = "amg-traffic-cluster.cluster-clss68yoix1c.us-east-2.rds.amazonaws.com"
+AURORA_DB = "postgres"
+DB_USER = "root"
+DB_PASS = "rootroot"
+DB_PORT = 5432
+OPENAI_API_KEY = "<INSERT_KEY>"
+# Permite apuntar a otra base (por ejemplo, un Postgres local para benchmark/)
+DATABASE_URL = os.environ.get(
+    "DATABASE_URL",
+    f"postgresql://{DB_USER}:{DB_PASS}@{AURORA_HOST}:{DB_PORT}/{AURORA_DB}?sslmode=require"
+)
+
+# Límites por solicitud (segundos) para que una pregunta lenta no retenga recursos indefinidamente
+AGENT_TIMEOUT = float(os.environ.get("AGENT_TIMEOUT", "60"))
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "30"))
+STATEMENT_TIMEOUT_MS = int(os.environ.get("STATEMENT_TIMEOUT_MS", "20000"))
+# Preguntas en curso por proceso; las que no consiguen turno en QUEUE_WAIT segundos reciben 429
+MAX_CONCURRENT_QUESTIONS = int(os.environ.get("MAX_CONCURRENT_QUESTIONS", "32"))
+QUEUE_WAIT = float(os.environ.get("QUEUE_WAIT", "2"))
+# /ask/batch: preguntas por lote y cuántas de ellas se responden a la vez (cada una ocupa un turno)
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", "1000"))
+# Límites para el SQL que genera el agente (ver guardia_sql.py): filas por consulta, costo estimado
+# por EXPLAIN en Aurora (0 lo desactiva), tiempo por consulta y caracteres del resultado que ve el modelo
+AGENT_MAX_ROWS = int(os.environ.get("AGENT_MAX_ROWS", "50"))
+AGENT_MAX_QUERY_COST = float(os.environ.get("AGENT_MAX_QUERY_COST", "500000"))
+AGENT_STATEMENT_TIMEOUT_MS = int(os.environ.get("AGENT_STATEMENT_TIMEOUT_MS", "10000"))
+AGENT_MAX_RESULT_CHARS = int(os.environ.get("AGENT_MAX_RESULT_CHARS", "6000"))
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+
+# Descripción de las tablas para el agente, guardada con `python base_datos.py`
+# para no reflejar el esquema por red al arrancar
+ESQUEMA_PATH = os.environ.get(
+    "ESQUEMA_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "esquema.json")
+)
+
+# Copia local de solo lectura de traffic_data (setup/build_local_db.py). Si existe, las consultas
+# de lectura se responden ahí y Aurora queda como respaldo
+LOCAL_DB_PATH = os.environ.get(
+    "LOCAL_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "traffic.duckdb")
+)
+LOCAL_DB_THREADS = int(os.environ.get("LOCAL_DB_THREADS", "2"))
+
+# Vistas resumen mantenidas por setup/rollups.py durante la carga
+VISTAS_RESUMEN = ['traffic_por_color', 'traffic_por_sensor', 'traffic_por_celda', 'traffic_por_hora']
+
+
+class Perezoso:
+    """
+    Atributo que se construye la primera vez que se usa, una sola vez aunque lo pidan
+    varios hilos. Si la construcción falla (por ejemplo, Aurora no responde) se reintenta
+    en el siguiente uso. Se puede reemplazar asignando el atributo (benchmark/, pruebas).
+    """
+
+    def __init__(self, fabrica):
+        self.fabrica = fabrica
+        self.nombre = fabrica.__name__
+        self.__doc__ = fabrica.__doc__
+        self._lock = threading.RLock()
+
+    def __get__(self, instancia, dueno):
+        if instancia is None:
+            return self
+        with self._lock:
+            if self.nombre not in instancia.__dict__:
+                instancia.__dict__[self.nombre] = self.fabrica(instancia)
+        return instancia.__dict__[self.nombre]
+
+
+class Recursos:
+    """
+    Recursos compartidos de la app. Nada se conecta a la red al importar el módulo:
+    la base, el agente y el geocodificador se crean con la primera pregunta.
+    """
+
+    @Perezoso
+    def engine(self):
+        print(f"📊 Connecting to database: {DATABASE_URL.split('@')[-1].split('?')[0]}")
+        engine = create_engine(
+            DATABASE_URL,
+            pool_pre_ping=True,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=QUEUE_WAIT + AGENT_TIMEOUT,
+            connect_args={'options': f'-c statement_timeout={STATEMENT_TIMEOUT_MS}'}
+        )
+        print("✅ Database engine created")
+        return engine
+
+    @Perezoso
+    def engine_local(self):
+        if not os.path.exists(LOCAL_DB_PATH):
+            return None
+        try:
+            import duckdb_engine  # noqa: F401
+        except ImportError:
+            print("⚠️  Existe traffic.duckdb pero falta duckdb-engine, se usará solo Aurora")
+            return None
+        engine = create_engine(
+            f"duckdb:///{LOCAL_DB_PATH}",
+            connect_args={'read_only': True, 'config': {'threads': LOCAL_DB_THREADS}}
+        )
+        with engine.connect() as conn:
+            self.filas_locales = conn.execute(text("SELECT COUNT(*) FROM traffic_data")).scalar()
+        print(f"✅ Base local: {LOCAL_DB_PATH} ({self.filas_locales:,} filas)")
+        try:
+            # El hilo de estadísticas trae el conteo de Aurora que decide si la copia sigue vigente
+            self.estadisticas_tabla
+        except Exception as e:
+            print(f"⚠️  Sin estadísticas de Aurora, se usará la base local sin verificar: {e}")
+        return engine
+
+    def base_local_vigente(self):
+        """
+        La base local es una foto de traffic_data: se deja de usar en cuanto el conteo de Aurora
+        (el que ya calcula el hilo de estadísticas, sin consultas extra) deja de coincidir.
+        """
+        if self.engine_local is None:
+            return False
+        estadisticas = self.__dict__.get('estadisticas_tabla')
+        datos = estadisticas.actuales() if estadisticas else None
+        if datos is None or datos['total_records_source'] != 'traffic_por_color':
+            return True
+        vigente = datos['total_records'] == self.filas_locales
+        if not vigente and not self.__dict__.get('_aviso_local'):
+            print(f"⚠️  La base local tiene {self.filas_locales:,} filas y Aurora {datos['total_records']:,}: "
+                  "se consulta Aurora hasta regenerar traffic.duckdb")
+        self._aviso_local = not vigente
+        return vigente
+
+    def motor_lectura(self):
+        # Para las plantillas: la base local si está vigente, si no Aurora
+        return self.engine_local if self.base_local_vigente() else self.engine
+
+    @Perezoso
+    def esquema(self):
+        if not os.path.exists(ESQUEMA_PATH):
+            print("ℹ️  Sin esquema.json, el esquema se leerá de la base con la primera pregunta")
+            return None
+        with open(ESQUEMA_PATH, encoding="utf-8") as f:
+            esquema = json.load(f)
+        print(f"✅ Esquema cargado de {ESQUEMA_PATH} ({esquema.get('generado', '?')})")
+        return esquema
+
+    @Perezoso
+    def vistas_disponibles(self):
+        if self.esquema is not None:
+            return [v for v in VISTAS_RESUMEN if v in self.esquema['tablas']]
+        return [v for v in VISTAS_RESUMEN if v in inspect(self.engine).get_view_names()]
+
+    @Perezoso
+    def db(self):
+        from base_datos import SQLDatabaseEnrutada
+
+        # Solo la tabla principal y las vistas resumen: las particiones y tablas de control confunden al agente
+        db = SQLDatabaseEnrutada(
+            self.engine,
+            local=self.engine_local,
+            usar_local=self.base_local_vigente,
+            include_tables=['traffic_data'] + self.vistas_disponibles,
+            view_support=True,
+            custom_table_info=self.esquema['tablas'] if self.esquema else None,
+            lazy_table_reflection=True
+        )
+        print(f"✅ SQL Database wrapper initialized (vistas resumen: {len(self.vistas_disponibles)})")
+        return db
+
+    @Perezoso
+    def llm(self):
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=0,
+            openai_api_key=OPENAI_API_KEY,
+            request_timeout=OPENAI_TIMEOUT,
+            max_retries=1,
+            # El agente usa streaming: sin esto OpenAI no manda el uso de tokens que lee /metrics
+            stream_usage=True
+        )
+
+    @Perezoso
+    def agente(self):
+        from langchain_community.agent_toolkits import create_sql_agent
+
+        print("🤖 Setting up LLM agent...")
+        agente = create_sql_agent(
+            llm=self.llm,
+            db=self.db,
+            agent_type="openai-tools",
+            verbose=True,
+            max_iterations=10,
+            max_execution_time=AGENT_TIMEOUT,
+            handle_parsing_errors=True
+        )
+        print("✅ LLM agent ready")
+        return agente
+
+    @Perezoso
+    def geolocator(self):
+        from geopy.geocoders import Nominatim
+
+        return Nominatim(user_agent="amg_traffic_app")
+
+    @Perezoso
+    def cache_geocodificacion(self):
+        from geocache import CacheGeocodificacion
+
+        cache = CacheGeocodificacion()
+        print(f"✅ Caché de geocodificación: {cache.ruta}")
+        return cache
+
+    @Perezoso
+    def gazetteer(self):
+        from gazetteer import cargar_gazetteer
+
+        gazetteer = cargar_gazetteer()
+        if gazetteer is not None:
+            print(f"✅ Gazetteer local cargado ({len(gazetteer):,} sensores)")
+        else:
+            print("⚠️  Gazetteer local no encontrado, se usará solo Nominatim")
+        return gazetteer
+
+    @Perezoso
+    def cache_respuestas(self):
+        from answer_cache import CacheRespuestas
+
+        return CacheRespuestas(obtener_version=self.obtener_version_datos)
+
+    @Perezoso
+    def estadisticas_tabla(self):
+        from estadisticas_tabla import EstadisticasTabla
+
+        # /table-info y /health se sirven de memoria; un hilo las actualiza cuando cambian los datos
+        estadisticas = EstadisticasTabla(self.engine, obtener_version=self.obtener_version_datos,
+                                         usar_resumen='traffic_por_color' in self.vistas_disponibles)
+        estadisticas.iniciar()
+        return estadisticas
+
+    def obtener_version_datos(self):
+        # Cambia cada vez que un loader confirma filas nuevas (checkpoints de carga completa o manifiesto incremental)
+        version = []
+        with self.engine.connect() as conn:
+            for tabla in ('load_checkpoints', 'ingest_manifest'):
+                existe = conn.execute(text("SELECT to_regclass(:tabla)"), {'tabla': tabla}).scalar()
+                if existe:
+                    version.append(conn.execute(text(f"SELECT MAX(loaded_at) FROM {tabla}")).scalar())
+        return tuple(version)
+
+    def precalentar(self):
+        """
+        Carga lo que no necesita red (módulos de LangChain, gazetteer, esquema) para que
+        los workers de gunicorn lo hereden ya listo del proceso maestro.
+        """
+        import base_datos  # noqa: F401
+        import langchain_community.agent_toolkits  # noqa: F401
+        import langchain_openai  # noqa: F401
+        import geopy.geocoders  # noqa: F401
+        self.gazetteer
+        self.esquema
@@ -0,0 +1,17 @@
+import math
+
+# Rejilla de celdas de 0.01° precalculada por setup/upload_s3_to_aurora.py en la columna grid_cell:
+# grid_cell = fila * GRID_COLUMNS + columna, con origen al suroeste del AMG.
+# Es la única definición: los scripts de setup/ (carga, tablas resumen, base local) la importan de aquí
+# y este archivo no debe importar nada fuera de la biblioteca estándar.
+GRID_SIZE = 0.01
+GRID_ORIGIN_LON = -104.0
+GRID_ORIGIN_LAT = 20.0
+GRID_COLUMNS = 1000
+
+
+def celdas_vecinas(lat, lon):
+    fila = math.floor((lat - GRID_ORIGIN_LAT) / GRID_SIZE)
+    columna = math.floor((lon - GRID_ORIGIN_LON) / GRID_SIZE)
+    centro = fila * GRID_COLUMNS + columna
+    return [centro + d_fila * GRID_COLUMNS + d_columna for d_fila in (-1, 0, 1) for d_columna in (-1, 0, 1)]
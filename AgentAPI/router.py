@@ -0,0 +1,241 @@
+import re
+from sqlalchemy import text, bindparam
+
+from gazetteer import normalizar_texto
+from rejilla import celdas_vecinas
+
+# Enrutador por reglas: responde las preguntas más comunes con SQL fijo sobre las vistas
+# resumen, sin pasar por el agente LLM. Si ninguna plantilla aplica regresa None.
+# El texto generado usa los mismos términos técnicos que el agente ("coordx: ..., coordy: ...",
+# nombres de color) para que humanizar_respuesta_agente lo traduzca igual.
+
+PALABRAS_TIEMPO = {
+    'hoy', 'ayer', 'semana', 'semanas', 'mes', 'meses', 'hora', 'horas', 'pico', 'manana', 'tarde',
+    'noche', 'madrugada', 'lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo',
+    'enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio', 'agosto', 'septiembre',
+    'octubre', 'noviembre', 'diciembre', 'fecha', 'dia', 'dias', 'ano', '2024', '2025'
+}
+
+COLORES_POR_PALABRA = {
+    'green': ['green'], 'verde': ['green'], 'verdes': ['green'], 'ligero': ['green'], 'fluido': ['green'],
+    'yellow': ['yellow'], 'amarillo': ['yellow'], 'moderado': ['yellow'], 'medio': ['yellow'],
+    'orange': ['orange'], 'naranja': ['orange'],
+    'red': ['red'], 'rojo': ['red'], 'rojos': ['red'],
+    'red_wine': ['red_wine'], 'vino': ['red_wine'], 'critico': ['red_wine'],
+    'pesado': ['red', 'red_wine'], 'congestionado': ['red', 'red_wine'], 'congestion': ['red', 'red_wine'],
+}
+# Frases de dos palabras que se revisan antes que sus palabras sueltas ("medio-alto" no es yellow)
+COLORES_POR_FRASE = {
+    ('medio', 'alto'): ['orange'],
+    ('muy', 'pesado'): ['red_wine'],
+}
+
+PALABRAS_CONTEO = {'cuantos', 'cuantas', 'cantidad', 'numero', 'total'}
+PALABRAS_DISTRIBUCION = {'distribucion', 'porcentaje', 'porcentajes', 'proporcion', 'reparto'}
+PALABRAS_UBICACION = {'donde', 'zonas', 'zona', 'lugares', 'ubicaciones', 'puntos', 'calles', 'areas'}
+# "¿Cuántas zonas...?" cuenta ubicaciones distintas; "¿cuántos puntos...?" cuenta mediciones, como
+# el ejemplo del prompt del agente, para que las dos rutas den el mismo número
+PALABRAS_UBICACIONES_DISTINTAS = {'zonas', 'lugares', 'ubicaciones', 'sensores', 'calles', 'areas'}
+# Con una negación ("¿dónde NO hay tráfico pesado?") las plantillas responderían lo contrario
+PALABRAS_NEGACION = {'no', 'sin', 'excepto', 'menos', 'salvo'}
+PALABRAS_PEOR = {'peor', 'peores', 'pesado', 'congestionado', 'congestionadas', 'congestionados', 'rojo', 'critico'}
+PALABRAS_MEJOR = {'mejor', 'mejores', 'ligero', 'fluido', 'verde', 'verdes'}
+PALABRAS_PROMEDIO = {'promedio', 'media', 'nivel', 'indice'}
+PALABRAS_ESTADO = {'como', 'trafico', 'promedio', 'congestion', 'estado'}
+
+LIMITE_UBICACIONES = 10
+LIMITE_MAXIMO = 20
+
+
+def _colores_mencionados(palabras):
+    colores = []
+    i = 0
+    while i < len(palabras):
+        frase = COLORES_POR_FRASE.get(tuple(palabras[i:i + 2]))
+        encontrados = frase or COLORES_POR_PALABRA.get(palabras[i], [])
+        i += 2 if frase else 1
+        for color in encontrados:
+            if color not in colores:
+                colores.append(color)
+    return colores
+
+
+def _cerca(punto):
+    # Texto y filtro de celdas para una plantilla acotada a ~1 km de un punto (lat, lon)
+    lat, lon = punto
+    return f" alrededor de coordx: {lon}, coordy: {lat}", celdas_vecinas(lat, lon)
+
+
+def _limite(texto):
+    numero = re.search(r'\b(\d{1,2})\b', texto)
+    if numero:
+        return max(1, min(int(numero.group(1)), LIMITE_MAXIMO))
+    return LIMITE_UBICACIONES
+
+
+def _distribucion(conn):
+    filas = conn.execute(text(
+        "SELECT predominant_color, cantidad FROM traffic_por_color ORDER BY cantidad DESC"
+    )).fetchall()
+    total = sum(f[1] for f in filas) or 1
+    lineas = [f"Distribución del tráfico en {total:,} mediciones:"]
+    for color, cantidad in filas:
+        lineas.append(f"- {color}: {cantidad:,} ({cantidad * 100 / total:.1f}%)")
+    return '\n'.join(lineas)
+
+
+def _conteo(conn, colores, por_ubicacion, punto=None):
+    lugar, filtro, parametros = "", "", {'colores': colores}
+    if punto:
+        lugar, parametros['celdas'] = _cerca(punto)
+        filtro = " AND grid_cell IN :celdas"
+    if por_ubicacion:
+        # "¿Cuántas zonas...?" cuenta ubicaciones distintas, no mediciones
+        consulta = text(
+            f"SELECT COUNT(DISTINCT id) FROM traffic_por_sensor WHERE predominant_color IN :colores{filtro}"
+        )
+        plantilla = "Hay {:,} ubicaciones{} que han registrado tráfico {}."
+    else:
+        # traffic_por_color no tiene grid_cell; con punto se suma sobre las celdas
+        vista = 'traffic_por_celda' if punto else 'traffic_por_color'
+        consulta = text(
+            f"SELECT COALESCE(SUM(cantidad), 0) FROM {vista} WHERE predominant_color IN :colores{filtro}"
+        )
+        plantilla = "Hay {:,} mediciones{} con tráfico {}."
+    consulta = consulta.bindparams(bindparam('colores', expanding=True))
+    if punto:
+        consulta = consulta.bindparams(bindparam('celdas', expanding=True))
+    cantidad = conn.execute(consulta, parametros).scalar()
+    return plantilla.format(int(cantidad), lugar, ' o '.join(colores))
+
+
+def _promedio_por_color(conn, punto=None):
+    if punto:
+        lugar, celdas = _cerca(punto)
+        consulta = text("""
+            SELECT predominant_color,
+                   SUM(avg_exponential_color_weighting * cantidad) / NULLIF(SUM(cantidad), 0) AS promedio,
+                   SUM(cantidad) AS cantidad
+            FROM traffic_por_celda
+            WHERE grid_cell IN :celdas
+            GROUP BY predominant_color
+            ORDER BY promedio DESC
+        """).bindparams(bindparam('celdas', expanding=True))
+        filas = conn.execute(consulta, {'celdas': celdas}).fetchall()
+        if not filas:
+            return None
+    else:
+        lugar = ""
+        filas = conn.execute(text(
+            "SELECT predominant_color, avg_exponential_color_weighting, cantidad "
+            "FROM traffic_por_color ORDER BY avg_exponential_color_weighting DESC"
+        )).fetchall()
+    lineas = [f"exponential_color_weighting promedio por estado del tráfico{lugar}:"]
+    for color, promedio, cantidad in filas:
+        lineas.append(f"- {color}: {promedio or 0:.3f} ({cantidad:,} mediciones)")
+    return '\n'.join(lineas)
+
+
+def _ubicaciones(conn, peor, limite, punto=None):
+    lugar, filtro, parametros = "", "", {'limite': limite}
+    if punto:
+        lugar, parametros['celdas'] = _cerca(punto)
+        filtro = "AND grid_cell IN :celdas"
+    if peor:
+        consulta = text(f"""
+            SELECT coordx, coordy,
+                   SUM(cantidad) FILTER (WHERE predominant_color = 'red_wine') AS criticas,
+                   SUM(cantidad) AS total
+            FROM traffic_por_sensor
+            WHERE predominant_color IN ('red_wine', 'red') AND coordx IS NOT NULL AND coordy IS NOT NULL {filtro}
+            GROUP BY coordx, coordy
+            ORDER BY criticas DESC NULLS LAST, total DESC
+            LIMIT :limite
+        """)
+        encabezado = f"Ubicaciones{lugar} con el peor tráfico (más mediciones red_wine y red):"
+    else:
+        consulta = text(f"""
+            SELECT coordx, coordy, SUM(cantidad) AS criticas, SUM(cantidad) AS total
+            FROM traffic_por_sensor
+            WHERE predominant_color = 'green' AND coordx IS NOT NULL AND coordy IS NOT NULL {filtro}
+            GROUP BY coordx, coordy
+            ORDER BY total DESC
+            LIMIT :limite
+        """)
+        encabezado = f"Ubicaciones{lugar} con el mejor tráfico (más mediciones green):"
+    if punto:
+        consulta = consulta.bindparams(bindparam('celdas', expanding=True))
+    filas = conn.execute(consulta, parametros).fetchall()
+    if not filas:
+        return None
+    lineas = [encabezado]
+    for i, (coordx, coordy, _, total) in enumerate(filas, start=1):
+        lineas.append(f"{i}. coordx: {coordx}, coordy: {coordy} - {int(total):,} mediciones")
+    return '\n'.join(lineas)
+
+
+def _cerca_de_punto(conn, lat, lon):
+    consulta = text("""
+        SELECT predominant_color, SUM(cantidad) AS cantidad,
+               SUM(avg_exponential_color_weighting * cantidad) / NULLIF(SUM(cantidad), 0) AS promedio
+        FROM traffic_por_celda
+        WHERE grid_cell IN :celdas
+        GROUP BY predominant_color
+        ORDER BY cantidad DESC
+    """).bindparams(bindparam('celdas', expanding=True))
+    filas = conn.execute(consulta, {'celdas': celdas_vecinas(lat, lon)}).fetchall()
+    if not filas:
+        return None
+    total = sum(f[1] for f in filas)
+    lineas = [f"Tráfico alrededor de coordx: {lon}, coordy: {lat} ({int(total):,} mediciones en ~1 km):"]
+    for color, cantidad, promedio in filas:
+        lineas.append(f"- {color}: {cantidad * 100 / total:.1f}% (exponential_color_weighting promedio {promedio or 0:.3f})")
+    return '\n'.join(lineas)
+
+
+def responder_con_plantilla(engine, pregunta, coordenadas=None):
+    """
+    Regresa (intención, respuesta en crudo) si la pregunta coincide con una plantilla, o None.
+    """
+    normalizada = normalizar_texto(pregunta)
+    palabras = set(normalizada.split())
+
+    # Las vistas resumen no distinguen fechas ni horas: esas preguntas van al agente
+    if palabras & PALABRAS_TIEMPO:
+        return None
+    if palabras & PALABRAS_NEGACION:
+        return None
+
+    # Con coordenadas, las intenciones específicas se responden acotadas a ~1 km del punto;
+    # solo las preguntas generales ("¿cómo está el tráfico en ...?") caen en cerca_de_punto
+    with engine.connect() as conn:
+        if palabras & PALABRAS_DISTRIBUCION:
+            if coordenadas:
+                respuesta = _cerca_de_punto(conn, *coordenadas)
+                return ('cerca_de_punto', respuesta) if respuesta else None
+            return 'distribucion', _distribucion(conn)
+
+        colores = _colores_mencionados(normalizada.split())
+        if palabras & PALABRAS_CONTEO and colores:
+            return 'conteo', _conteo(conn, colores, bool(palabras & PALABRAS_UBICACIONES_DISTINTAS), coordenadas)
+
+        if (palabras & PALABRAS_PROMEDIO and palabras & {'color', 'colores', 'estado', 'congestion'}
+                and not palabras & PALABRAS_UBICACION):
+            respuesta = _promedio_por_color(conn, coordenadas)
+            return ('promedio_por_color', respuesta) if respuesta else None
+
+        if palabras & PALABRAS_UBICACION:
+            peor = bool(palabras & PALABRAS_PEOR)
+            mejor = bool(palabras & PALABRAS_MEJOR)
+            if peor != mejor:
+                respuesta = _ubicaciones(conn, peor, _limite(normalizada), coordenadas)
+                return ('peores_ubicaciones' if peor else 'mejores_ubicaciones', respuesta) if respuesta else None
+
+        if coordenadas and palabras & PALABRAS_ESTADO:
+            # Otra pregunta con intención no reconocida ("¿cuántos sensores hay en...?") va al agente
+            if palabras & (PALABRAS_CONTEO | PALABRAS_UBICACION | PALABRAS_PEOR | PALABRAS_MEJOR):
+                return None
+            respuesta = _cerca_de_punto(conn, *coordenadas)
+            return ('cerca_de_punto', respuesta) if respuesta else None
+
+    return None
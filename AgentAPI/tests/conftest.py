@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Las pruebas importan los módulos de AgentAPI/ como lo hace app.py (sin paquete)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
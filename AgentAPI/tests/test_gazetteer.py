@@ -0,0 +1,32 @@
+import math
+
+import numpy as np
+import pytest
+
+from gazetteer import Gazetteer
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    # Un anillo de 40 sensores de radio 0.1° (como el Periférico) y una calle corta en el centro
+    angulos = np.linspace(0, 2 * math.pi, 40, endpoint=False)
+    lon = np.append(-103.35 + 0.1 * np.cos(angulos), -103.35)
+    lat = np.append(20.67 + 0.1 * np.sin(angulos), 20.67)
+    calles = ['Periférico'] * len(angulos) + ['Av. Juárez']
+    ruta = tmp_path / "gazetteer.npz"
+    np.savez_compressed(
+        ruta, ids=np.array([str(i) for i in range(len(lon))]), lon=lon, lat=lat,
+        calle=np.array(calles), colonia=np.array(['Centro'] * len(lon)), ciudad=np.array(['Zapopan'] * len(lon))
+    )
+    return Gazetteer(str(ruta))
+
+
+def test_calle_de_anillo_regresa_un_punto_sobre_la_calle(gazetteer):
+    lat, lon = gazetteer.buscar_direccion("¿Cómo está el tráfico en Periférico?")
+    assert abs(math.hypot(lat - 20.67, lon + 103.35) - 0.1) < 1e-9
+
+
+def test_nombre_de_una_palabra_necesita_introductor(gazetteer):
+    assert gazetteer.buscar_direccion("juarez tiene tráfico?") is None
+    assert gazetteer.buscar_direccion("tráfico en Juárez") == (20.67, -103.35)
+    assert gazetteer.buscar_direccion("¿Cómo está la avenida Juárez?") == (20.67, -103.35)
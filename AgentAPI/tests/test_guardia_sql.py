@@ -0,0 +1,51 @@
+import threading
+import time
+
+import pytest
+
+from guardia_sql import ConsultaRechazada, Vigilante, preparar
+
+
+@pytest.mark.parametrize("consulta", [
+    "SELECT pg_sleep(100) LIMIT 50",
+    "SELECT pg_catalog.pg_sleep_for('1 minute')",
+    "SELECT set_config('statement_timeout', '0', false) LIMIT 50",
+    "SELECT pg_terminate_backend(pid) FROM pg_stat_activity",
+    "SELECT pg_cancel_backend(1)",
+    "SELECT * FROM dblink('host=otro', 'SELECT 1') AS t(a int)",
+    "SELECT lo_import('/etc/passwd')",
+    "SELECT pg_read_file('/etc/passwd')",
+])
+def test_rechaza_funciones_peligrosas(consulta):
+    with pytest.raises(ConsultaRechazada):
+        preparar(consulta)
+
+
+def test_permite_funciones_de_lectura():
+    consulta = "SELECT lower(predominant_color), COUNT(*) FROM traffic_data GROUP BY 1 LIMIT 10"
+    assert preparar(consulta) == consulta
+
+
+def test_agrega_limit():
+    assert "LIMIT 50" in preparar("SELECT * FROM traffic_data")
+
+
+class ConexionLenta:
+    def __init__(self):
+        self.interrumpida = threading.Event()
+
+    def interrupt(self):
+        self.interrumpida.set()
+
+
+def test_vigilante_interrumpe_solo_consultas_vencidas():
+    vigilante = Vigilante(segundos=0.2, intervalo=0.05)
+    rapida = ConexionLenta()
+    with vigilante.vigilar(rapida):
+        pass
+    lenta = ConexionLenta()
+    with vigilante.vigilar(lenta):
+        assert lenta.interrumpida.wait(2)
+    time.sleep(0.3)
+    assert not rapida.interrumpida.is_set()
+    assert not vigilante.plazos
@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importar_app_no_carga_langchain():
+    # En un proceso aparte: otras pruebas pueden haber importado LangChain en este
+    codigo = (
+        "import sys; import app; "
+        "cargados = [m for m in ('langchain_core', 'langchain_community', 'langchain_openai') if m in sys.modules]; "
+        "assert not cargados, cargados"
+    )
+    resultado = subprocess.run([sys.executable, "-c", codigo], cwd=DIRECTORIO, capture_output=True, text=True)
+    assert resultado.returncode == 0, resultado.stderr
@@ -0,0 +1,40 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from router import responder_con_plantilla
+
+# Vistas resumen mínimas: 3 mediciones rojas en 2 ubicaciones y 2 verdes en 1
+VISTAS_SQL = [
+    "CREATE TABLE traffic_por_color (predominant_color TEXT, cantidad INTEGER, avg_exponential_color_weighting REAL)",
+    "INSERT INTO traffic_por_color VALUES ('red', 3, 0.5), ('green', 2, 0.1)",
+    "CREATE TABLE traffic_por_sensor (id TEXT, predominant_color TEXT, coordx REAL, coordy REAL, grid_cell INTEGER, "
+    "cantidad INTEGER, avg_exponential_color_weighting REAL)",
+    "INSERT INTO traffic_por_sensor VALUES ('a', 'red', -103.35, 20.67, 1, 2, 0.5), "
+    "('b', 'red', -103.36, 20.68, 1, 1, 0.5), ('c', 'green', -103.37, 20.69, 1, 2, 0.1)",
+]
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        for sentencia in VISTAS_SQL:
+            conn.execute(text(sentencia))
+    return engine
+
+
+def test_negacion_va_al_agente(engine):
+    assert responder_con_plantilla(engine, "¿Dónde NO hay tráfico pesado?") is None
+    assert responder_con_plantilla(engine, "¿Dónde hay tráfico pesado?")[0] == 'peores_ubicaciones'
+
+
+def test_cuantos_puntos_cuenta_mediciones(engine):
+    intencion, respuesta = responder_con_plantilla(engine, "¿Cuántos puntos con tráfico pesado?")
+    assert intencion == 'conteo'
+    assert respuesta.startswith("Hay 3 mediciones")
+
+
+def test_cuantas_ubicaciones_cuenta_sensores(engine):
+    intencion, respuesta = responder_con_plantilla(engine, "¿Cuántas ubicaciones con tráfico rojo?")
+    assert intencion == 'conteo'
+    assert respuesta.startswith("Hay 2 ubicaciones")
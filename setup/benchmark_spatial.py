@@ -0,0 +1,79 @@
+import sys
+import time
+import statistics
+from sqlalchemy import text, bindparam
+
+import upload_s3_to_aurora as loader
+# upload_s3_to_aurora agrega AgentAPI/ al path; las celdas se calculan igual que en el agente
+from rejilla import celdas_vecinas
+
+# Latencia de la consulta por radio que genera el agente (±0.01° alrededor de un punto),
+# sin índices (escaneo secuencial), con el índice (coordx, coordy) y con grid_cell.
+SAMPLES = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+RADIUS = 0.01
+
+RADIUS_SQL = """
+SELECT predominant_color, COUNT(*)
+FROM traffic_data
+WHERE coordx BETWEEN :lon - :r AND :lon + :r
+  AND coordy BETWEEN :lat - :r AND :lat + :r
+GROUP BY predominant_color
+"""
+
+GRID_SQL = """
+SELECT predominant_color, COUNT(*)
+FROM traffic_data
+WHERE grid_cell IN :cells
+  AND coordx BETWEEN :lon - :r AND :lon + :r
+  AND coordy BETWEEN :lat - :r AND :lat + :r
+GROUP BY predominant_color
+"""
+
+NO_INDEX_SETTINGS = [
+    "SET LOCAL enable_indexscan = off",
+    "SET LOCAL enable_bitmapscan = off",
+    "SET LOCAL enable_indexonlyscan = off",
+]
+
+
+def run(engine, name, sql, points, settings=()):
+    statement = text(sql)
+    if ":cells" in sql:
+        statement = statement.bindparams(bindparam("cells", expanding=True))
+    timings = []
+    for lon, lat in points:
+        params = {"lon": lon, "lat": lat, "r": RADIUS}
+        if ":cells" in sql:
+            params["cells"] = celdas_vecinas(lat, lon)
+        with engine.begin() as conn:
+            for setting in settings:
+                conn.execute(text(setting))
+            start = time.perf_counter()
+            conn.execute(statement, params).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<28} p50={statistics.median(timings):9.1f} ms  p95={p95:9.1f} ms  media={statistics.mean(timings):9.1f} ms")
+
+
+def main():
+    engine = loader.get_engine(pool_size=1)
+
+    print(f"Eligiendo {SAMPLES} ubicaciones de sensores al azar...")
+    with engine.connect() as conn:
+        points = conn.execute(text("""
+            SELECT coordx, coordy FROM (
+                SELECT DISTINCT coordx, coordy FROM traffic_data
+                WHERE coordx IS NOT NULL AND coordy IS NOT NULL
+            ) t ORDER BY random() LIMIT :n
+        """), {"n": SAMPLES}).fetchall()
+
+    print("\n========== LATENCIA CONSULTA POR RADIO ==========")
+    run(engine, "Sin índice (antes)", RADIUS_SQL, points, NO_INDEX_SETTINGS)
+    run(engine, "Índice (coordx, coordy)", RADIUS_SQL, points)
+    run(engine, "grid_cell + (coordx, coordy)", GRID_SQL, points)
+    print("=================================================")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import os
+import json
+import pandas as pd
+import numpy as np
+from tqdm import tqdm
+from geopy.geocoders import Nominatim
+from geopy.extra.rate_limiter import RateLimiter
+
+LOCATIONS_FILE = "AMGtraffic2025/locationPoints.csv"
+OUT_FILE = "gazetteer.npz"
+# Avance parcial para poder reanudar si el proceso se interrumpe
+PROGRESS_FILE = "gazetteer_progreso.json"
+# Sensores más cercanos que esto (en grados) comparten una sola consulta a Nominatim
+SNAP = 0.0005
+
+if not os.path.exists("AMGtraffic2025"):
+    print("Falta AMGtraffic2025/, ejecuta primero load_traffic_data.py")
+    raise SystemExit(1)
+
+print("Leyendo locationPoints.csv...")
+loc = pd.read_csv(
+    LOCATIONS_FILE,
+    encoding="latin1",
+    on_bad_lines="skip",
+    engine="python"
+)
+loc["Coordx"] = pd.to_numeric(loc["Coordx"], errors="coerce")
+loc["Coordy"] = pd.to_numeric(loc["Coordy"], errors="coerce")
+loc = loc.dropna(subset=["id", "Coordx", "Coordy"]).drop_duplicates(subset="id")
+print(f"✓ {len(loc):,} sensores con coordenadas")
+
+progreso = {}
+if os.path.exists(PROGRESS_FILE):
+    with open(PROGRESS_FILE, encoding="utf-8") as f:
+        progreso = json.load(f)
+    print(f"✓ Reanudando con {len(progreso):,} celdas ya geocodificadas")
+
+geolocator = Nominatim(user_agent="amg_traffic_gazetteer")
+reverse = RateLimiter(geolocator.reverse, min_delay_seconds=1, max_retries=2)
+
+
+def celda(lat, lon):
+    return f"{round(lat / SNAP)}:{round(lon / SNAP)}"
+
+
+def partes_direccion(lat, lon):
+    ubicacion = reverse(f"{lat}, {lon}", language="es", timeout=10)
+    if not ubicacion:
+        return ["", "", ""]
+    direccion = ubicacion.raw.get("address", {})
+    calle = direccion.get("road", "")
+    colonia = direccion.get("suburb") or direccion.get("neighbourhood", "")
+    ciudad = direccion.get("city") or direccion.get("town", "")
+    return [calle, colonia, ciudad]
+
+
+print("Geocodificando sensores (1 solicitud/segundo)...")
+pendientes = 0
+for lon, lat in tqdm(zip(loc["Coordx"], loc["Coordy"]), total=len(loc)):
+    llave = celda(lat, lon)
+    if llave in progreso:
+        continue
+    try:
+        progreso[llave] = partes_direccion(lat, lon)
+    except Exception as e:
+        print(f"Error geocodificando ({lat}, {lon}): {e}")
+        continue
+    pendientes += 1
+    if pendientes % 100 == 0:
+        with open(PROGRESS_FILE, "w", encoding="utf-8") as f:
+            json.dump(progreso, f, ensure_ascii=False)
+
+with open(PROGRESS_FILE, "w", encoding="utf-8") as f:
+    json.dump(progreso, f, ensure_ascii=False)
+
+print("Construyendo gazetteer...")
+calles, colonias, ciudades = [], [], []
+for lon, lat in zip(loc["Coordx"], loc["Coordy"]):
+    calle, colonia, ciudad = progreso.get(celda(lat, lon), ["", "", ""])
+    calles.append(calle)
+    colonias.append(colonia)
+    ciudades.append(ciudad)
+
+np.savez_compressed(
+    OUT_FILE,
+    ids=loc["id"].astype(str).to_numpy(dtype=str),
+    lon=loc["Coordx"].to_numpy(dtype=np.float64),
+    lat=loc["Coordy"].to_numpy(dtype=np.float64),
+    calle=np.array(calles, dtype=str),
+    colonia=np.array(colonias, dtype=str),
+    ciudad=np.array(ciudades, dtype=str),
+)
+
+print(f"✓ Gazetteer generado: {OUT_FILE}")
+
+print("\n========== RESUMEN ==========")
+print(f"Sensores: {len(loc):,}")
+print(f"Sensores con calle: {sum(1 for c in calles if c):,}")
+print(f"Copia {OUT_FILE} a AgentAPI/ para usarlo en la aplicación")
+print("=============================")
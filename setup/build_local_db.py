@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+import duckdb
+import boto3
+
+import load_traffic_data as etl
+import rollups
+import upload_s3_to_aurora as loader
+
+# Construye traffic.duckdb, una copia local de solo lectura de traffic_data y sus tablas resumen
+# a partir del Parquet que genera load_traffic_data.py. La app la usa para las consultas de
+# lectura del agente y de las plantillas, y deja Aurora como respaldo (ver AgentAPI/base_datos.py).
+#
+#   python build_local_db.py [archivo.parquet]
+#       sin argumento usa amg_unificado.parquet o lo descarga de S3
+OUT_FILE = "traffic.duckdb"
+
+COLOR_SQL = f"COALESCE(predominant_color, '{rollups.UNKNOWN_COLOR}')"
+MEASURES_SQL = """
+    COUNT(*) AS cantidad,
+    AVG(exponential_color_weighting) AS avg_exponential_color_weighting,
+    AVG(linear_color_weighting) AS avg_linear_color_weighting
+"""
+
+# Mismas columnas que traffic_data en Aurora; ordenada por captured_at para que DuckDB
+# salte bloques completos al filtrar por fecha
+TRAFFIC_DATA_SQL = f"""
+CREATE TABLE traffic_data AS
+SELECT id, predominant_color, exponential_color_weighting, linear_color_weighting, diffuse_logic_traffic,
+       coordx, coordy, captured_at, {loader.GRID_CELL_SQL} AS grid_cell
+FROM (
+    SELECT CAST(id AS VARCHAR) AS id,
+           CAST(predominant_color AS VARCHAR) AS predominant_color,
+           exponential_color_weighting, linear_color_weighting, diffuse_logic_traffic,
+           "Coordx" AS coordx, "Coordy" AS coordy,
+           CAST(captured_at AS TIMESTAMP) AS captured_at
+    FROM read_parquet(?)
+)
+ORDER BY captured_at
+"""
+
+# Las vistas resumen de rollups.py, ya calculadas como tablas (mismas columnas y en el mismo orden)
+SUMMARY_TABLES_SQL = {
+    "traffic_por_color": f"""
+        SELECT {COLOR_SQL} AS predominant_color, {MEASURES_SQL}
+        FROM traffic_data GROUP BY 1
+    """,
+    "traffic_por_sensor": f"""
+        SELECT id, {COLOR_SQL} AS predominant_color, MAX(coordx) AS coordx, MAX(coordy) AS coordy,
+               MAX(grid_cell) AS grid_cell, {MEASURES_SQL}
+        FROM traffic_data WHERE id IS NOT NULL GROUP BY 1, 2
+    """,
+    "traffic_por_celda": f"""
+        SELECT grid_cell, {COLOR_SQL} AS predominant_color,
+               CAST({loader.GRID_ORIGIN_LON} + (grid_cell % {loader.GRID_COLUMNS} + 0.5) * {loader.GRID_SIZE} AS DOUBLE) AS coordx,
+               CAST({loader.GRID_ORIGIN_LAT} + (grid_cell // {loader.GRID_COLUMNS} + 0.5) * {loader.GRID_SIZE} AS DOUBLE) AS coordy,
+               {MEASURES_SQL}
+        FROM traffic_data WHERE grid_cell IS NOT NULL GROUP BY 1, 2
+    """,
+    "traffic_por_hora": f"""
+        SELECT date_trunc('hour', captured_at) AS bucket,
+               CAST(hour(date_trunc('hour', captured_at)) AS INTEGER) AS hora,
+               CAST(isodow(date_trunc('hour', captured_at)) AS INTEGER) AS dia_semana,
+               {COLOR_SQL} AS predominant_color, {MEASURES_SQL}
+        FROM traffic_data WHERE captured_at IS NOT NULL GROUP BY 1, 2, 3, 4
+    """,
+}
+
+BUILD_INFO_SQL = """
+CREATE TABLE local_build AS
+SELECT ? AS source, (SELECT COUNT(*) FROM traffic_data) AS rows, now()::TIMESTAMP AS built_at
+"""
+
+
+def source_file():
+    if len(sys.argv) > 1:
+        return sys.argv[1]
+    if os.path.exists(etl.OUT_FILE):
+        return etl.OUT_FILE
+    if not os.path.exists(loader.LOCAL_FILE):
+        print(f"Descargando archivo desde s3://{loader.BUCKET}/{loader.S3_KEY}...")
+        boto3.client("s3").download_file(loader.BUCKET, loader.S3_KEY, loader.LOCAL_FILE)
+    return loader.LOCAL_FILE
+
+
+def main():
+    source = source_file()
+    # Se construye aparte y se reemplaza al final: una app corriendo conserva el archivo anterior
+    building = OUT_FILE + ".tmp"
+    if os.path.exists(building):
+        os.remove(building)
+
+    start = time.time()
+    conn = duckdb.connect(building)
+    print(f"Creando traffic_data desde {source}...")
+    conn.execute(TRAFFIC_DATA_SQL, [source])
+    for table, query in SUMMARY_TABLES_SQL.items():
+        print(f"Creando {table}...")
+        conn.execute(f"CREATE TABLE {table} AS {query}")
+    conn.execute(BUILD_INFO_SQL, [os.path.abspath(source)])
+    rows = conn.execute("SELECT rows FROM local_build").fetchone()[0]
+    conn.execute("CHECKPOINT")
+    conn.close()
+    os.replace(building, OUT_FILE)
+
+    print("\n========== RESUMEN ==========")
+    print(f"Registros: {rows:,}")
+    print(f"Archivo: {OUT_FILE} ({os.path.getsize(OUT_FILE) / 1e6:,.1f} MB) en {time.time() - start:,.1f}s")
+    print("=============================")
+    print(f"Copia {OUT_FILE} a AgentAPI/ (o define LOCAL_DB_PATH) para que la app lo use")
+    print("Vuelve a generarlo después de cada carga: si el conteo no coincide con Aurora, la app no lo usa")
+
+
+if __name__ == "__main__":
+    main()
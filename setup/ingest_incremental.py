@@ -0,0 +1,198 @@
+import os
+import sys
+import hashlib
+import subprocess
+from multiprocessing import Pool
+from sqlalchemy import text
+from tqdm import tqdm
+
+import load_traffic_data as etl
+import upload_s3_to_aurora as loader
+
+# Un registro por archivo histórico ya cargado en traffic_data.
+# Se escribe en la misma transacción que el COPY de sus filas.
+# size y mtime_ns evitan volver a calcular el hash de archivos que no se tocaron
+# (vacíos en manifiestos anteriores: esos archivos se verifican una vez y se completan).
+CREATE_MANIFEST_SQL = """
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+    file TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    size BIGINT,
+    mtime_ns BIGINT,
+    loaded_at TIMESTAMP NOT NULL DEFAULT now()
+);
+ALTER TABLE ingest_manifest ADD COLUMN IF NOT EXISTS size BIGINT;
+ALTER TABLE ingest_manifest ADD COLUMN IF NOT EXISTS mtime_ns BIGINT;
+"""
+
+MANIFEST_INSERT_SQL = "INSERT INTO ingest_manifest (file, sha256, rows, size, mtime_ns) VALUES (%s, %s, %s, %s, %s)"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def count_rows(path):
+    with open(path, "rb") as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def prepare_file(path):
+    # stat antes de leer: si el archivo cambia durante la carga, la próxima ejecución lo verifica
+    size, mtime_ns = file_stat(path)
+    df = loader.normalize_chunk(etl.transform_file(path))
+    return path, file_sha256(path), size, mtime_ns, df
+
+
+def pull_repositories():
+    etl.clone_repositories()
+    print("Actualizando repositorios...")
+    for repo in ("AMGtraffic2025", "AMGTraffic2024"):
+        subprocess.run(["git", "-C", repo, "pull", "--ff-only"])
+
+
+def load_manifest(engine):
+    with engine.connect() as conn:
+        conn.execute(text(CREATE_MANIFEST_SQL))
+        conn.commit()
+        rows = conn.execute(text("SELECT file, sha256, size, mtime_ns FROM ingest_manifest")).fetchall()
+    return {r[0]: (r[1], r[2], r[3]) for r in rows}
+
+
+def changed_files(files, manifest, verify=False):
+    """
+    Archivos del manifiesto cuyo contenido cambió desde que se cargaron (otro SHA-256).
+    Solo se calcula el hash de los que cambiaron de tamaño o de fecha de modificación
+    (de todos con verify). Regresa (cambiados, tocados): tocados son los que tienen
+    el mismo contenido pero otro tamaño/fecha registrados, para actualizarlos en el manifiesto.
+    """
+    stats = {f: file_stat(f) for f in files if f in manifest}
+    suspects = [f for f, stat in stats.items() if verify or stat != manifest[f][1:]]
+    with Pool(etl.WORKERS) as pool:
+        hashes = pool.map(file_sha256, suspects, chunksize=64)
+    changed = [f for f, sha256 in zip(suspects, hashes) if sha256 != manifest[f][0]]
+    touched = [(f, *stats[f]) for f, sha256 in zip(suspects, hashes)
+               if sha256 == manifest[f][0] and stats[f] != manifest[f][1:]]
+    return changed, touched
+
+
+def update_stats(engine, touched):
+    with engine.begin() as conn:
+        for path, size, mtime_ns in touched:
+            conn.execute(
+                text("UPDATE ingest_manifest SET size = :size, mtime_ns = :mtime_ns WHERE file = :file"),
+                {"file": path, "size": size, "mtime_ns": mtime_ns}
+            )
+
+
+def report_changed(changed):
+    # traffic_data no guarda de qué archivo viene cada fila, así que no se pueden reemplazar
+    # solo las de un archivo: se reportan para recargarlos con una carga completa
+    print(f"⚠️  {len(changed):,} archivos ya cargados cambiaron de contenido y NO se recargaron:")
+    for path in changed[:20]:
+        print(f"   {path}")
+    if len(changed) > 20:
+        print(f"   ... y {len(changed) - 20:,} más")
+    print("   Para incluir los cambios, vuelve a hacer la carga completa (upload_s3_to_aurora.py) y --mark-loaded")
+
+
+def mark_loaded(engine, files, manifest):
+    """
+    Registra los archivos actuales como ya cargados sin insertar filas.
+    Se usa una vez después de una carga completa con upload_s3_to_aurora.py, sin actualizar
+    los repositorios antes: un archivo que llegue con git pull no está en esa carga.
+    """
+    pending = [f for f in files if f not in manifest]
+    with engine.begin() as conn:
+        for path in tqdm(pending):
+            size, mtime_ns = file_stat(path)
+            conn.execute(
+                text("""
+                    INSERT INTO ingest_manifest (file, sha256, rows, size, mtime_ns)
+                    VALUES (:file, :sha256, :rows, :size, :mtime_ns)
+                """),
+                {"file": path, "sha256": file_sha256(path), "rows": count_rows(path),
+                 "size": size, "mtime_ns": mtime_ns}
+            )
+    print(f"✓ {len(pending):,} archivos registrados en el manifiesto")
+
+
+def main():
+    mark_only = "--mark-loaded" in sys.argv
+    allow_undated = "--allow-undated" in sys.argv
+    verify = "--verify" in sys.argv
+    if not mark_only:
+        pull_repositories()
+    files = etl.historical_files()
+
+    print("Conectando a Aurora...")
+    engine = loader.get_engine()
+    loader.create_tables(engine)
+    manifest = load_manifest(engine)
+    print(f"✓ Manifiesto con {len(manifest):,} archivos ya cargados")
+
+    if mark_only:
+        mark_loaded(engine, files, manifest)
+        return
+
+    if verify:
+        print("Verificando el hash de todos los archivos ya cargados...")
+    else:
+        print("Verificando el hash de los archivos ya cargados que cambiaron de tamaño o fecha...")
+    changed, touched = changed_files(files, manifest, verify)
+    if touched:
+        update_stats(engine, touched)
+    new_files = [f for f in files if f not in manifest]
+    print(f"✓ {len(new_files):,} archivos nuevos por cargar")
+    if not new_files:
+        if changed:
+            report_changed(changed)
+        return
+    undated = etl.undated_files(new_files)
+    etl.report_undated(undated, allow_undated)
+
+    print("Leyendo locationPoints.csv...")
+    locations, _ = etl.load_locations()
+
+    loaded_files = 0
+    loaded_rows = 0
+    failed = []
+    with Pool(etl.WORKERS, initializer=etl.init_worker, initargs=(locations, loader.SOURCE_COLUMNS)) as pool:
+        with tqdm(total=len(new_files)) as progress:
+            for batch in etl.batches(new_files, etl.BATCH_SIZE):
+                for path, sha256, size, mtime_ns, df in pool.imap(prepare_file, batch):
+                    progress.update(1)
+                    try:
+                        loader.ensure_partitions(engine, df)
+                        loaded_rows += loader.copy_rows(engine, df, MANIFEST_INSERT_SQL, (path, sha256, len(df), size, mtime_ns))
+                        loaded_files += 1
+                    except Exception as e:
+                        # Otro proceso ya lo cargó (llave primaria del manifiesto) o falló el COPY:
+                        # la transacción completa se revirtió, no quedan filas duplicadas
+                        print(f"ERROR cargando {path}: {e}")
+                        failed.append(path)
+
+    print("\n========== RESUMEN ==========")
+    print(f"Archivos nuevos cargados: {loaded_files:,}")
+    print(f"Registros agregados: {loaded_rows:,}")
+    if failed:
+        print(f"Archivos con error (se reintentarán en la próxima ejecución): {len(failed):,}")
+    if undated:
+        print(f"Archivos sin fecha (captured_at vacío, partición DEFAULT): {len(undated):,}")
+    print("=============================")
+    if changed:
+        report_changed(changed)
+
+
+if __name__ == "__main__":
+    main()
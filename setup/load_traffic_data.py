@@ -1,58 +1,271 @@
 import os
+import re
+import sys
 import subprocess
 import glob
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from multiprocessing import Pool
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from tqdm import tqdm
 import boto3
 
 BUCKET = "amg-traffic-data"
-S3_KEY = "unificado/amg_traffic_2024_2025.csv"
+S3_KEY = "unificado/amg_traffic_2024_2025.parquet"
+LOCATIONS_FILE = "AMGtraffic2025/locationPoints.csv"
+OUT_FILE = "amg_unificado.parquet"
 
-print("Clonando repositorios...")
-if not os.path.exists("AMGtraffic2025"):
-    subprocess.run(["git", "clone", "https://github.com/ralejandrobm/AMGtraffic2025.git"])
+# Salida CSV anterior, solo con --csv (para herramientas que aún no leen Parquet)
+CSV_S3_KEY = "unificado/amg_traffic_2024_2025.csv"
+CSV_OUT_FILE = "amg_unificado.csv"
 
-if not os.path.exists("AMGTraffic2024"):
-    subprocess.run(["git", "clone", "https://github.com/ralejandrobm/AMGTraffic2024.git"])
+# Filas por row group: cada uno es un bloque de COPY en upload_s3_to_aurora.py (CHUNK_ROWS)
+ROW_GROUP_ROWS = 100_000
+PARQUET_COMPRESSION = "zstd"
 
-print("Leyendo CSVs 2025...")
-files_2025 = glob.glob("AMGtraffic2025/historico/*.csv")
+# Tipos de las columnas del archivo unificado; las demás columnas de locationPoints.csv van como texto
+FLOAT_COLUMNS = [
+    "exponential_color_weighting",
+    "linear_color_weighting",
+    "diffuse_logic_traffic",
+    "Coordx",
+    "Coordy",
+]
+COLUMN_TYPES = {
+    "id": pa.string(),
+    # Cinco valores distintos: con diccionario se guarda un índice de un byte por fila
+    "predominant_color": pa.dictionary(pa.int8(), pa.string()),
+    "captured_at": pa.timestamp("us"),
+    **{c: pa.float64() for c in FLOAT_COLUMNS},
+}
 
-print("Leyendo CSVs 2024...")
-files_2024 = glob.glob("AMGTraffic2024/historico/*.csv")
+# Cada worker procesa un archivo a la vez; solo BATCH_SIZE archivos están en memoria simultáneamente
+WORKERS = os.cpu_count() or 2
+BATCH_SIZE = WORKERS * 4
 
-dfs = []
+_locations = None
+_out_columns = None
 
-print("Cargando archivos y concatenando...")
-for f in tqdm(files_2025 + files_2024):
-    df = pd.read_csv(f)
-    dfs.append(df)
+# Hora local del AMG: las preguntas de "hora pico" se refieren a la hora de Guadalajara
+LOCAL_TZ = ZoneInfo("America/Mexico_City")
 
-full_df = pd.concat(dfs, ignore_index=True)
+# Formatos de fecha/hora que aparecen en los nombres de archivo de historico/
+TIMESTAMP_PATTERNS = [
+    (re.compile(r"(\d{4})[-_]?(\d{2})[-_]?(\d{2})[T _-]?(\d{2})[-_:h]?(\d{2})(?:[-_:m]?(\d{2}))?"), "ymd"),
+    (re.compile(r"(\d{2})[-_](\d{2})[-_](\d{4})(?:[T _-](\d{2})[-_:h]?(\d{2})(?:[-_:m]?(\d{2}))?)?"), "dmy"),
+    (re.compile(r"(\d{4})-(\d{2})-(\d{2})"), "ymd"),
+    (re.compile(r"(?<!\d)(1[5-9]\d{8})(?!\d)"), "epoch"),
+]
 
-print("Leyendo locationPoints.csv...")
-loc = pd.read_csv(
-    "AMGtraffic2025/locationPoints.csv",
-    encoding="latin1",
-    on_bad_lines="skip",
-    engine="python"
-)
 
-print("Unificando tablas por id...")
-merged = full_df.merge(loc, on="id", how="left")
+def load_locations():
+    loc = pd.read_csv(
+        LOCATIONS_FILE,
+        encoding="latin1",
+        on_bad_lines="skip",
+        engine="python"
+    )
+    loc = loc.drop_duplicates(subset="id")
+    loc_columns = [c for c in loc.columns if c != "id"]
+    # {columna: {id: valor}} para unir con un .map por columna en cada worker
+    locations = {c: dict(zip(loc["id"], loc[c])) for c in loc_columns}
+    return locations, loc_columns
 
-out_file = "amg_unificado.csv"
-merged.to_csv(out_file, index=False)
 
-print(f"Archivo unificado generado: {out_file}")
+def init_worker(locations, out_columns):
+    global _locations, _out_columns
+    _locations = locations
+    _out_columns = out_columns
 
-print("Subiendo a S3...")
-s3 = boto3.client("s3")
-s3.upload_file(out_file, BUCKET, S3_KEY)
 
-print(f"✓ Subido a s3://{BUCKET}/{S3_KEY}")
+def snapshot_timestamp(path):
+    """
+    Extrae del nombre del archivo el momento en que se tomó la captura.
+    Regresa un string ISO o None si el nombre no trae fecha reconocible.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    for pattern, kind in TIMESTAMP_PATTERNS:
+        match = pattern.search(name)
+        if not match:
+            continue
+        try:
+            if kind == "epoch":
+                moment = datetime.fromtimestamp(int(match.group(1)), tz=LOCAL_TZ)
+                return moment.replace(tzinfo=None).isoformat(sep=" ")
+            parts = [int(p) if p else 0 for p in match.groups()]
+            if kind == "dmy":
+                day, month, year = parts[:3]
+            else:
+                year, month, day = parts[:3]
+            parts += [0] * (6 - len(parts))
+            return datetime(year, month, day, *parts[3:6]).isoformat(sep=" ")
+        except ValueError:
+            continue
+    return None
 
-print("\n========== RESUMEN ==========")
-print(f"Total registros: {len(merged):,}")
-print(f"Archivo S3: s3://{BUCKET}/{S3_KEY}")
-print("=============================")
+
+def undated_files(files):
+    return [path for path in files if snapshot_timestamp(path) is None]
+
+
+def report_undated(undated, allowed):
+    """
+    Sin fecha, las filas de un archivo van a la partición DEFAULT y no aparecen en las consultas
+    por fecha. Se detiene la carga salvo que se pida explícitamente con --allow-undated.
+    """
+    if not undated:
+        return
+    print(f"{'ADVERTENCIA' if allowed else 'ERROR'}: {len(undated):,} archivos sin fecha reconocible en el nombre:")
+    for path in undated[:20]:
+        print(f"  {path}")
+    if len(undated) > 20:
+        print(f"  ... y {len(undated) - 20:,} más")
+    if not allowed:
+        print("Agrega su formato a TIMESTAMP_PATTERNS, o usa --allow-undated para cargarlos con captured_at vacío")
+        raise SystemExit(1)
+
+
+def transform_file(path):
+    df = pd.read_csv(path)
+    if pd.api.types.is_numeric_dtype(df["id"]):
+        # Mismo formato de id que el concat original (float, p. ej. "4.0")
+        df["id"] = df["id"].astype(float)
+    for column, values in _locations.items():
+        if column not in df.columns:
+            df[column] = df["id"].map(values)
+    df["captured_at"] = snapshot_timestamp(path)
+    return df.reindex(columns=_out_columns)
+
+
+def parquet_schema(out_columns):
+    return pa.schema([(c, COLUMN_TYPES.get(c, pa.string())) for c in out_columns])
+
+
+def process_file(path):
+    """
+    Regresa el archivo ya tipado (números, fecha y texto) para que la carga no tenga que volver a parsearlo.
+    """
+    df = transform_file(path)
+    for column in df.columns:
+        if column in FLOAT_COLUMNS:
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+        elif column == "captured_at":
+            df[column] = pd.to_datetime(df[column], errors="coerce")
+        else:
+            df[column] = df[column].astype("string")
+    return df
+
+
+class UnifiedWriter:
+    """
+    Escribe el archivo unificado en Parquet por row groups de ROW_GROUP_ROWS filas,
+    acumulando solo un row group en memoria. Con `csv_file` escribe además el CSV anterior.
+    """
+
+    def __init__(self, path, out_columns, csv_file=None, row_group_rows=ROW_GROUP_ROWS):
+        self.schema = parquet_schema(out_columns)
+        self.writer = pq.ParquetWriter(path, self.schema, compression=PARQUET_COMPRESSION)
+        self.row_group_rows = row_group_rows
+        self.pending = []
+        self.pending_rows = 0
+        self.csv = None
+        if csv_file:
+            self.csv = open(csv_file, "w", newline="")
+            self.csv.write(",".join(out_columns) + "\n")
+
+    def write(self, df):
+        if self.csv:
+            self.csv.write(df.to_csv(index=False, header=False))
+        self.pending.append(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+        self.pending_rows += len(df)
+        while self.pending_rows >= self.row_group_rows:
+            self._flush(self.row_group_rows)
+
+    def _flush(self, rows):
+        table = pa.concat_tables(self.pending)
+        self.writer.write_table(table.slice(0, rows), row_group_size=rows)
+        rest = table.slice(rows)
+        self.pending = [rest] if rest.num_rows else []
+        self.pending_rows = rest.num_rows
+
+    def close(self):
+        if self.pending_rows:
+            self._flush(self.pending_rows)
+        self.writer.close()
+        if self.csv:
+            self.csv.close()
+
+
+def batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def clone_repositories():
+    print("Clonando repositorios...")
+    if not os.path.exists("AMGtraffic2025"):
+        subprocess.run(["git", "clone", "https://github.com/ralejandrobm/AMGtraffic2025.git"])
+
+    if not os.path.exists("AMGTraffic2024"):
+        subprocess.run(["git", "clone", "https://github.com/ralejandrobm/AMGTraffic2024.git"])
+
+
+def historical_files():
+    print("Leyendo CSVs 2025...")
+    files_2025 = glob.glob("AMGtraffic2025/historico/*.csv")
+
+    print("Leyendo CSVs 2024...")
+    files_2024 = glob.glob("AMGTraffic2024/historico/*.csv")
+
+    return sorted(files_2025) + sorted(files_2024)
+
+
+def main():
+    write_csv = "--csv" in sys.argv
+    allow_undated = "--allow-undated" in sys.argv
+    clone_repositories()
+    files = historical_files()
+
+    undated = undated_files(files)
+    report_undated(undated, allow_undated)
+
+    print("Leyendo locationPoints.csv...")
+    locations, loc_columns = load_locations()
+
+    data_columns = list(pd.read_csv(files[0], nrows=0).columns)
+    out_columns = data_columns + [c for c in loc_columns if c not in data_columns] + ["captured_at"]
+
+    print(f"Procesando archivos en streaming ({WORKERS} procesos, lotes de {BATCH_SIZE})...")
+    total_rows = 0
+    out = UnifiedWriter(OUT_FILE, out_columns, csv_file=CSV_OUT_FILE if write_csv else None)
+    with Pool(WORKERS, initializer=init_worker, initargs=(locations, out_columns)) as pool:
+        with tqdm(total=len(files)) as progress:
+            for batch in batches(files, BATCH_SIZE):
+                for df in pool.imap(process_file, batch):
+                    out.write(df)
+                    total_rows += len(df)
+                    progress.update(1)
+    out.close()
+
+    print(f"Archivo unificado generado: {OUT_FILE} ({os.path.getsize(OUT_FILE) / 1e6:,.1f} MB)")
+
+    print("Subiendo a S3...")
+    s3 = boto3.client("s3")
+    s3.upload_file(OUT_FILE, BUCKET, S3_KEY)
+    print(f"✓ Subido a s3://{BUCKET}/{S3_KEY}")
+    if write_csv:
+        print(f"Archivo CSV generado: {CSV_OUT_FILE} ({os.path.getsize(CSV_OUT_FILE) / 1e6:,.1f} MB)")
+        s3.upload_file(CSV_OUT_FILE, BUCKET, CSV_S3_KEY)
+        print(f"✓ Subido a s3://{BUCKET}/{CSV_S3_KEY}")
+
+    print("\n========== RESUMEN ==========")
+    print(f"Total registros: {total_rows:,}")
+    print(f"Archivos sin fecha (captured_at vacío, partición DEFAULT): {len(undated):,}")
+    print(f"Archivo S3: s3://{BUCKET}/{S3_KEY}")
+    print("=============================")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import os
+import sys
+
+import pandas as pd
+from psycopg2.extras import execute_values
+from sqlalchemy import text
+
+# La rejilla de grid_cell se define una sola vez, en AgentAPI/rejilla.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AgentAPI"))
+from rejilla import GRID_SIZE, GRID_ORIGIN_LON, GRID_ORIGIN_LAT, GRID_COLUMNS  # noqa: E402
+
+# Tablas resumen que el agente consulta en lugar de escanear traffic_data completa.
+# Guardan conteos y sumas (no promedios) para que la carga incremental pueda actualizarlas
+# sumando los deltas de cada archivo, en la misma transacción que su COPY.
+# El orden importa: la tabla por color (5 filas que todos los archivos actualizan) va al final
+# para retener sus candados el menor tiempo posible antes del commit.
+ROLLUPS = {
+    "traffic_rollup_sensor": ["id", "predominant_color"],
+    "traffic_rollup_grid": ["grid_cell", "predominant_color"],
+    "traffic_rollup_hour": ["bucket", "predominant_color"],
+    "traffic_rollup_color": ["predominant_color"],
+}
+
+KEY_TYPES = {
+    "predominant_color": "TEXT",
+    "id": "TEXT",
+    "grid_cell": "INTEGER",
+    "bucket": "TIMESTAMP",
+}
+
+MEASURES = ["rows", "exponential_rows", "sum_exponential", "linear_rows", "sum_linear"]
+
+# Color para filas sin predominant_color (las llaves primarias no admiten NULL)
+UNKNOWN_COLOR = "desconocido"
+
+CREATE_VIEWS_SQL = f"""
+CREATE OR REPLACE VIEW traffic_por_color AS
+SELECT predominant_color,
+       rows AS cantidad,
+       sum_exponential / NULLIF(exponential_rows, 0) AS avg_exponential_color_weighting,
+       sum_linear / NULLIF(linear_rows, 0) AS avg_linear_color_weighting
+FROM traffic_rollup_color;
+
+CREATE OR REPLACE VIEW traffic_por_sensor AS
+SELECT id, predominant_color, coordx, coordy, grid_cell,
+       rows AS cantidad,
+       sum_exponential / NULLIF(exponential_rows, 0) AS avg_exponential_color_weighting,
+       sum_linear / NULLIF(linear_rows, 0) AS avg_linear_color_weighting
+FROM traffic_rollup_sensor;
+
+CREATE OR REPLACE VIEW traffic_por_celda AS
+SELECT grid_cell, predominant_color,
+       ({GRID_ORIGIN_LON} + (grid_cell % {GRID_COLUMNS} + 0.5) * {GRID_SIZE})::float AS coordx,
+       ({GRID_ORIGIN_LAT} + (grid_cell / {GRID_COLUMNS} + 0.5) * {GRID_SIZE})::float AS coordy,
+       rows AS cantidad,
+       sum_exponential / NULLIF(exponential_rows, 0) AS avg_exponential_color_weighting,
+       sum_linear / NULLIF(linear_rows, 0) AS avg_linear_color_weighting
+FROM traffic_rollup_grid;
+
+CREATE OR REPLACE VIEW traffic_por_hora AS
+SELECT bucket, EXTRACT(HOUR FROM bucket)::integer AS hora, EXTRACT(ISODOW FROM bucket)::integer AS dia_semana,
+       predominant_color,
+       rows AS cantidad,
+       sum_exponential / NULLIF(exponential_rows, 0) AS avg_exponential_color_weighting,
+       sum_linear / NULLIF(linear_rows, 0) AS avg_linear_color_weighting
+FROM traffic_rollup_hour;
+"""
+
+VIEWS = ["traffic_por_color", "traffic_por_sensor", "traffic_por_celda", "traffic_por_hora"]
+
+
+def create_rollup_tables(engine):
+    with engine.connect() as conn:
+        for table, keys in ROLLUPS.items():
+            extra = "coordx FLOAT, coordy FLOAT, grid_cell INTEGER," if table == "traffic_rollup_sensor" else ""
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    {", ".join(f"{k} {KEY_TYPES[k]} NOT NULL" for k in keys)},
+                    {extra}
+                    rows BIGINT NOT NULL,
+                    exponential_rows BIGINT NOT NULL,
+                    sum_exponential DOUBLE PRECISION NOT NULL,
+                    linear_rows BIGINT NOT NULL,
+                    sum_linear DOUBLE PRECISION NOT NULL,
+                    PRIMARY KEY ({", ".join(keys)})
+                )
+            """))
+        conn.execute(text(CREATE_VIEWS_SQL))
+        conn.commit()
+
+
+def _deltas(df, keys):
+    grouped = df.groupby(keys, sort=True)
+    deltas = pd.DataFrame({
+        "rows": grouped.size(),
+        "exponential_rows": grouped["exponential_color_weighting"].count(),
+        "sum_exponential": grouped["exponential_color_weighting"].sum(),
+        "linear_rows": grouped["linear_color_weighting"].count(),
+        "sum_linear": grouped["linear_color_weighting"].sum(),
+    })
+    return deltas.reset_index()
+
+
+def _sql_values(frame):
+    # Tipos nativos de Python (psycopg2 no adapta enteros de numpy) y NULL en lugar de NaN/NaT
+    frame = frame.astype(object).where(frame.notna(), None)
+    return list(frame.itertuples(index=False, name=None))
+
+
+def upsert_rollups(cursor, df):
+    """
+    Suma a las tablas resumen los conteos del bloque recién insertado.
+    Las filas se ordenan por llave para que los workers en paralelo tomen
+    los candados siempre en el mismo orden y no haya deadlocks.
+    """
+    df = df.assign(
+        predominant_color=df["predominant_color"].fillna(UNKNOWN_COLOR),
+        bucket=df["captured_at"].dt.floor("h"),
+    )
+    for table, keys in ROLLUPS.items():
+        deltas = _deltas(df.dropna(subset=keys), keys)
+        if deltas.empty:
+            continue
+        columns = keys + MEASURES
+        if table == "traffic_rollup_sensor":
+            locations = df.dropna(subset=["id"]).groupby("id")[["Coordx", "Coordy", "grid_cell"]].first()
+            deltas = deltas.join(locations, on="id")
+            columns = columns + ["Coordx", "Coordy", "grid_cell"]
+        values = _sql_values(deltas[columns])
+        updates = ", ".join(f"{m} = {table}.{m} + EXCLUDED.{m}" for m in MEASURES)
+        if table == "traffic_rollup_sensor":
+            updates += ", coordx = COALESCE(traffic_rollup_sensor.coordx, EXCLUDED.coordx)"
+            updates += ", coordy = COALESCE(traffic_rollup_sensor.coordy, EXCLUDED.coordy)"
+            updates += ", grid_cell = COALESCE(traffic_rollup_sensor.grid_cell, EXCLUDED.grid_cell)"
+        execute_values(
+            cursor,
+            f"INSERT INTO {table} ({', '.join(c.lower() for c in columns)}) VALUES %s "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}",
+            values,
+            page_size=1000
+        )
+
+
+def rebuild_rollups(engine):
+    """
+    Reconstruye las tablas resumen desde traffic_data (una sola pasada por tabla).
+    La carga completa la usa al terminar, y sirve para datos cargados antes de que existieran los resúmenes.
+    """
+    create_rollup_tables(engine)
+    measures_sql = """
+        COUNT(*), COUNT(exponential_color_weighting), COALESCE(SUM(exponential_color_weighting), 0),
+        COUNT(linear_color_weighting), COALESCE(SUM(linear_color_weighting), 0)
+    """
+    color = f"COALESCE(predominant_color, '{UNKNOWN_COLOR}')"
+    with engine.begin() as conn:
+        for table in ROLLUPS:
+            conn.execute(text(f"TRUNCATE {table}"))
+        conn.execute(text(f"""
+            INSERT INTO traffic_rollup_color
+            SELECT {color}, {measures_sql} FROM traffic_data GROUP BY 1
+        """))
+        conn.execute(text(f"""
+            INSERT INTO traffic_rollup_sensor
+            SELECT id, {color}, MAX(coordx), MAX(coordy), MAX(grid_cell), {measures_sql}
+            FROM traffic_data WHERE id IS NOT NULL GROUP BY 1, 2
+        """))
+        conn.execute(text(f"""
+            INSERT INTO traffic_rollup_grid
+            SELECT grid_cell, {color}, {measures_sql}
+            FROM traffic_data WHERE grid_cell IS NOT NULL GROUP BY 1, 2
+        """))
+        conn.execute(text(f"""
+            INSERT INTO traffic_rollup_hour
+            SELECT date_trunc('hour', captured_at), {color}, {measures_sql}
+            FROM traffic_data WHERE captured_at IS NOT NULL GROUP BY 1, 2
+        """))
+
+
+if __name__ == "__main__":
+    import upload_s3_to_aurora as loader
+
+    print("Reconstruyendo tablas resumen desde traffic_data...")
+    rebuild_rollups(loader.get_engine(pool_size=1))
+    print("✓ Tablas resumen listas")
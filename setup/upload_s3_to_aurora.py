@@ -1,37 +1,63 @@
 import os
+import sys
+import time
 import boto3
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from sqlalchemy import create_engine, text
 from tqdm import tqdm
 from io import StringIO
 
+import rollups
+# rollups agrega AgentAPI/ al path
+from rejilla import GRID_SIZE, GRID_ORIGIN_LON, GRID_ORIGIN_LAT, GRID_COLUMNS
+
 BUCKET = "amg-traffic-data"
-S3_KEY = "unificado/amg_traffic_2024_2025.csv"
+# Archivo unificado en Parquet que genera load_traffic_data.py; con --csv se carga el CSV anterior
+S3_KEY = "unificado/amg_traffic_2024_2025.parquet"
+CSV_S3_KEY = "unificado/amg_traffic_2024_2025.csv"
 AURORA_HOST = "amg-traffic-cluster.cluster-clss68yoix1c.us-east-2.rds.amazonaws.com"
 AURORA_DB = "postgres"
 DB_USER = "root"
 DB_PASS = "rootroot"
 DB_PORT = 5432
 
-print(f"Descargando archivo desde s3://{BUCKET}/{S3_KEY}...")
-s3 = boto3.client("s3")
-
-local_file = "temp_s3_download.csv"
-s3.download_file(BUCKET, S3_KEY, local_file)
-print(f"✓ Archivo descargado: {local_file}")
+# Filas por bloque y workers de COPY en paralelo (cada uno con su propia conexión)
+CHUNK_ROWS = 100_000
+WORKERS = 4
+LOCAL_FILE = "temp_s3_download.parquet"
+CSV_LOCAL_FILE = "temp_s3_download.csv"
 
-print("Leyendo CSV...")
-df = pd.read_csv(local_file)
-print(f"✓ Cargados {len(df):,} registros")
+# Columnas que trae el archivo unificado del ETL
+SOURCE_COLUMNS = [
+    "id",
+    "predominant_color",
+    "exponential_color_weighting",
+    "linear_color_weighting",
+    "diffuse_logic_traffic",
+    "Coordx",
+    "Coordy",
+    "captured_at",
+]
 
-print("Conectando a Aurora...")
-engine = create_engine(
-    f"postgresql://{DB_USER}:{DB_PASS}@{AURORA_HOST}:{DB_PORT}/{AURORA_DB}?sslmode=require"
-)
+# Columnas que se insertan: las del archivo más las calculadas al cargar
+COLUMNS = SOURCE_COLUMNS + ["grid_cell"]
 
-print("Creando tabla traffic_data si no existe...")
+COLS_FLOAT = [
+    "exponential_color_weighting",
+    "linear_color_weighting",
+    "diffuse_logic_traffic",
+    "Coordx",
+    "Coordy",
+]
 
-create_table_sql = """
+# Particionada por mes según el momento de la captura; las filas sin fecha van a la partición DEFAULT.
+# Las particiones mensuales se crean antes de los COPY en paralelo: con Parquet todas al inicio, a partir
+# de las estadísticas de captured_at de los row groups; si un bloque trae un mes nuevo (CSV, o Parquet sin
+# estadísticas) se espera a que terminen los COPY en curso antes de crearla (ver load_chunks).
+CREATE_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS traffic_data (
     id TEXT,
     predominant_color TEXT,
@@ -39,80 +65,367 @@ CREATE TABLE IF NOT EXISTS traffic_data (
     linear_color_weighting FLOAT,
     diffuse_logic_traffic FLOAT,
     Coordx FLOAT,
-    Coordy FLOAT
+    Coordy FLOAT,
+    captured_at TIMESTAMP,
+    grid_cell INTEGER
+) PARTITION BY RANGE (captured_at);
+
+CREATE TABLE IF NOT EXISTS traffic_data_default PARTITION OF traffic_data DEFAULT;
+
+CREATE INDEX IF NOT EXISTS traffic_data_captured_at_brin ON traffic_data USING BRIN (captured_at);
+"""
+
+# Rejilla de celdas de 0.01° (el radio de búsqueda que usa el agente), con origen al suroeste del AMG:
+# grid_cell = fila * GRID_COLUMNS + columna. Las constantes se importan de AgentAPI/rejilla.py, la misma
+# definición con la que la app calcula las celdas que consulta.
+GRID_CELL_SQL = (
+    f"(floor((coordy - {GRID_ORIGIN_LAT}) / {GRID_SIZE}) * {GRID_COLUMNS}"
+    f" + floor((coordx - {GRID_ORIGIN_LON}) / {GRID_SIZE}))::integer"
+)
+
+# Se crean después de la carga masiva para no frenar el COPY
+CREATE_INDEXES_SQL = """
+CREATE INDEX IF NOT EXISTS traffic_data_coords_idx ON traffic_data (coordx, coordy);
+CREATE INDEX IF NOT EXISTS traffic_data_grid_cell_idx ON traffic_data (grid_cell);
+"""
+
+# Un registro por bloque cargado, escrito en la misma transacción que su COPY
+CREATE_CHECKPOINTS_SQL = """
+CREATE TABLE IF NOT EXISTS load_checkpoints (
+    source TEXT NOT NULL,
+    chunk INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    loaded_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (source, chunk)
 );
 """
 
-with engine.connect() as conn:
-    conn.execute(text(create_table_sql))
-    conn.commit()
+COPY_SQL = f"""
+COPY traffic_data (
+    {", ".join(COLUMNS)}
+)
+FROM STDIN WITH CSV;
+"""
 
-print("✓ Tabla lista")
 
-print("Normalizando columnas numéricas...")
+def get_engine(pool_size=WORKERS):
+    return create_engine(
+        f"postgresql://{DB_USER}:{DB_PASS}@{AURORA_HOST}:{DB_PORT}/{AURORA_DB}?sslmode=require",
+        pool_size=pool_size,
+        max_overflow=0
+    )
 
-cols_float = [
-    "exponential_color_weighting",
-    "linear_color_weighting",
-    "diffuse_logic_traffic",
-    "Coordx",
-    "Coordy",
-]
 
-for c in cols_float:
-    df[c] = pd.to_numeric(df[c], errors="coerce")
+def create_tables(engine):
+    with engine.connect() as conn:
+        existing = conn.execute(text("""
+            SELECT c.relkind FROM pg_class c
+            WHERE c.relname = 'traffic_data' AND pg_table_is_visible(c.oid)
+        """)).scalar()
+        if existing == "r":
+            print("ADVERTENCIA: traffic_data existe sin particiones ni columna captured_at.")
+            print("Renómbrala o elimínala y vuelve a cargar para usar el esquema particionado por mes.")
+            raise SystemExit(1)
+        conn.execute(text(CREATE_TABLE_SQL))
+        conn.execute(text(CREATE_CHECKPOINTS_SQL))
+        has_grid_cell = conn.execute(text("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'traffic_data' AND column_name = 'grid_cell'
+        """)).scalar()
+        if not has_grid_cell:
+            print("Agregando y calculando grid_cell para las filas existentes...")
+            conn.execute(text("ALTER TABLE traffic_data ADD COLUMN grid_cell INTEGER"))
+            conn.execute(text(f"UPDATE traffic_data SET grid_cell = {GRID_CELL_SQL}"))
+        conn.commit()
+    rollups.create_rollup_tables(engine)
 
-print("✓ Columnas numéricas normalizadas (errores → NULL)")
 
+def create_indexes(engine):
+    with engine.connect() as conn:
+        conn.execute(text(CREATE_INDEXES_SQL))
+        conn.execute(text("ANALYZE traffic_data"))
+        conn.commit()
 
-print("Insertando datos con método COPY (ultra rápido)...")
 
-csv_buffer = StringIO()
-df.to_csv(csv_buffer, index=False, header=False)
-csv_buffer.seek(0)
+def grid_cells(lon, lat):
+    row = np.floor((lat - GRID_ORIGIN_LAT) / GRID_SIZE)
+    column = np.floor((lon - GRID_ORIGIN_LON) / GRID_SIZE)
+    return (row * GRID_COLUMNS + column).astype("Int64")
+
+
+_partitions = set()
 
-copy_sql = """
-COPY traffic_data (
-    id,
-    predominant_color,
-    exponential_color_weighting,
-    linear_color_weighting,
-    diffuse_logic_traffic,
-    Coordx,
-    Coordy
-)
-FROM STDIN WITH CSV;
-"""
 
-conn = engine.raw_connection()
-cursor = conn.cursor()
+def missing_months(df):
+    months = df["captured_at"].dropna().dt.to_period("M").unique()
+    return [m for m in months if m not in _partitions]
+
+
+def ensure_partitions(engine, df):
+    """
+    Crea las particiones mensuales que necesitan las filas del DataFrame.
+    CREATE TABLE ... PARTITION OF toma un lock ACCESS EXCLUSIVE sobre traffic_data:
+    no debe haber COPY en curso en otras conexiones cuando se llama.
+    """
+    create_month_partitions(engine, missing_months(df))
+
+
+def create_month_partitions(engine, months):
+    missing = [m for m in months if m not in _partitions]
+    if not missing:
+        return
+    with engine.connect() as conn:
+        for month in missing:
+            start = month.start_time.strftime("%Y-%m-%d")
+            end = (month + 1).start_time.strftime("%Y-%m-%d")
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS traffic_data_{month.strftime('%Y_%m')} "
+                f"PARTITION OF traffic_data FOR VALUES FROM ('{start}') TO ('{end}')"
+            ))
+        conn.commit()
+    _partitions.update(missing)
+
+
+def parquet_months(local_file):
+    """
+    Meses que abarca captured_at según las estadísticas min/max de cada row group, sin leer
+    los datos. Regresa None si algún row group no tiene estadísticas.
+    """
+    metadata = pq.ParquetFile(local_file).metadata
+    low, high = None, None
+    for index in range(metadata.num_row_groups):
+        row_group = metadata.row_group(index)
+        column = next(
+            (row_group.column(j) for j in range(row_group.num_columns)
+             if row_group.column(j).path_in_schema == "captured_at"),
+            None
+        )
+        stats = column.statistics if column is not None else None
+        if stats is None or not stats.has_min_max:
+            if row_group.num_rows and (stats is None or stats.null_count != row_group.num_rows):
+                return None
+            continue
+        low = stats.min if low is None else min(low, stats.min)
+        high = stats.max if high is None else max(high, stats.max)
+    if low is None:
+        return []
+    return list(pd.period_range(pd.Timestamp(low), pd.Timestamp(high), freq="M"))
+
+
+def completed_chunks(engine, source):
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT chunk FROM load_checkpoints WHERE source = :source"),
+            {"source": source}
+        ).fetchall()
+    return {r[0] for r in rows}
+
+
+def normalize_chunk(df):
+    # Coerción numérica por bloque mientras se lee (errores → NULL); en Parquet ya vienen tipadas
+    for c in COLS_FLOAT:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    df["captured_at"] = pd.to_datetime(df["captured_at"], errors="coerce")
+    if isinstance(df["predominant_color"].dtype, pd.CategoricalDtype):
+        # Las tablas resumen rellenan los colores vacíos con un valor que no está entre las categorías
+        df["predominant_color"] = df["predominant_color"].astype(object)
+    df["grid_cell"] = grid_cells(df["Coordx"], df["Coordy"])
+    return df[COLUMNS]
+
+
+def copy_rows(engine, df, bookkeeping_sql, bookkeeping_params, update_rollups=True):
+    """
+    COPY de un DataFrame en su propia transacción. La instrucción de control (checkpoint
+    o manifiesto) y, con update_rollups, las tablas resumen se confirman junto con las filas, o nada.
+    """
+    csv_buffer = StringIO()
+    df.to_csv(csv_buffer, index=False, header=False)
+    csv_buffer.seek(0)
+
+    conn = engine.raw_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.copy_expert(COPY_SQL, csv_buffer)
+        if update_rollups:
+            rollups.upsert_rollups(cursor, df)
+        cursor.execute(bookkeeping_sql, bookkeeping_params)
+        conn.commit()
+        return len(df)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def copy_chunk(engine, source, index, df):
+    return copy_rows(
+        engine,
+        df,
+        "INSERT INTO load_checkpoints (source, chunk, rows) VALUES (%s, %s, %s)",
+        (source, index, len(df)),
+        # Los workers en paralelo se formarían en las mismas filas resumen (las 5 de color en
+        # cada bloque): la carga completa las reconstruye una sola vez al terminar
+        update_rollups=False
+    )
+
+
+def csv_chunks(local_file, chunk_rows=CHUNK_ROWS, done=()):
+    reader = pd.read_csv(
+        local_file,
+        usecols=SOURCE_COLUMNS,
+        dtype={"id": str, "predominant_color": str},
+        chunksize=chunk_rows
+    )
+    for index, chunk in enumerate(reader):
+        yield index, None if index in done else chunk
+
+
+def parquet_chunks(local_file, done=()):
+    """
+    Un bloque por row group. Los row groups ya cargados se saltan sin leerlos.
+    """
+    parquet = pq.ParquetFile(local_file)
+    for index in range(parquet.num_row_groups):
+        if index in done:
+            yield index, None
+        else:
+            yield index, parquet.read_row_group(index, columns=SOURCE_COLUMNS).to_pandas()
+
+
+def load_csv(engine, local_file, source, workers=WORKERS, chunk_rows=CHUNK_ROWS):
+    """
+    Carga el CSV por bloques con varios COPY en paralelo. Cada bloque se confirma
+    por separado junto con su checkpoint, así que volver a ejecutar reanuda la carga.
+    Regresa (filas cargadas, bloques fallidos).
+    """
+    done = completed_chunks(engine, source)
+    return load_chunks(engine, csv_chunks(local_file, chunk_rows, done), source, done, workers)
+
+
+def load_parquet(engine, local_file, source, workers=WORKERS):
+    """
+    Igual que load_csv, pero leyendo el Parquet de load_traffic_data.py row group por row group:
+    las columnas llegan tipadas y nunca se carga el archivo completo en memoria.
+    """
+    done = completed_chunks(engine, source)
+    months = parquet_months(local_file)
+    if months:
+        print(f"Creando particiones de {months[0]} a {months[-1]}...")
+        create_month_partitions(engine, months)
+    return load_chunks(engine, parquet_chunks(local_file, done), source, done, workers)
+
+
+def load_chunks(engine, chunks, source, done, workers=WORKERS):
+    if done:
+        print(f"✓ Reanudando: {len(done):,} bloques ya cargados")
+
+    loaded_rows = 0
+    failed = []
+    in_flight = {}
+    start = time.time()
+
+    def collect(finished):
+        nonlocal loaded_rows
+        for future in finished:
+            index = in_flight.pop(future)
+            try:
+                loaded_rows += future.result()
+            except Exception as e:
+                print(f"ERROR en COPY del bloque {index}: {e}")
+                failed.append(index)
+        elapsed = time.time() - start
+        progress.set_postfix(rows=f"{loaded_rows:,}", rows_s=f"{loaded_rows / elapsed:,.0f}" if elapsed else "-")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(unit=" bloques") as progress:
+        for index, chunk in chunks:
+            progress.update(1)
+            if chunk is None:
+                continue
+            chunk = normalize_chunk(chunk)
+            if missing_months(chunk) and in_flight:
+                # Mes sin partición: su CREATE TABLE bloquearía traffic_data mientras hay COPY en curso
+                finished, _ = wait(in_flight)
+                collect(finished)
+            ensure_partitions(engine, chunk)
+            future = executor.submit(copy_chunk, engine, source, index, chunk)
+            in_flight[future] = index
+            # Memoria acotada: como máximo 2 bloques por worker esperando
+            if len(in_flight) >= workers * 2:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+        finished, _ = wait(in_flight)
+        collect(finished)
+
+    elapsed = time.time() - start
+    print(f"✓ {loaded_rows:,} registros en {elapsed:,.1f}s ({loaded_rows / max(elapsed, 1e-9):,.0f} filas/s)")
+    return loaded_rows, failed
+
+
+def main():
+    use_csv = "--csv" in sys.argv
+    s3_key = CSV_S3_KEY if use_csv else S3_KEY
+    local_file = CSV_LOCAL_FILE if use_csv else LOCAL_FILE
+
+    s3 = boto3.client("s3")
+    # El ETag identifica la versión del archivo: un archivo nuevo en S3 no reutiliza checkpoints viejos
+    etag = s3.head_object(Bucket=BUCKET, Key=s3_key)["ETag"].strip('"')
+    source = f"s3://{BUCKET}/{s3_key}#{etag}"
+
+    if os.path.exists(local_file):
+        print(f"✓ Usando archivo local existente: {local_file}")
+    else:
+        print(f"Descargando archivo desde s3://{BUCKET}/{s3_key}...")
+        s3.download_file(BUCKET, s3_key, local_file)
+        print(f"✓ Archivo descargado: {local_file}")
+
+    print("Conectando a Aurora...")
+    engine = get_engine()
+
+    print("Creando tabla traffic_data si no existe...")
+    create_tables(engine)
+    print("✓ Tabla lista")
+
+    if use_csv:
+        print(f"Insertando datos con COPY en paralelo ({WORKERS} workers, bloques de {CHUNK_ROWS:,} filas)...")
+        loaded_rows, failed = load_csv(engine, local_file, source)
+    else:
+        print(f"Insertando datos con COPY en paralelo ({WORKERS} workers, un bloque por row group)...")
+        loaded_rows, failed = load_parquet(engine, local_file, source)
+
+    if failed:
+        print(f"ERROR: {len(failed)} bloques fallaron: {sorted(failed)}")
+        print("Vuelve a ejecutar el script para reanudar solo los bloques pendientes")
+        raise SystemExit(1)
 
-try:
-    cursor.copy_expert(copy_sql, csv_buffer)
-    conn.commit()
     print("✓ CARGA COMPLETA A AURORA (COPY METHOD)")
 
-except Exception as e:
-    conn.rollback()
-    print("ERROR en COPY:", e)
+    print("Reconstruyendo tablas resumen desde traffic_data...")
+    rollups.rebuild_rollups(engine)
+    print("✓ Tablas resumen listas")
+
+    print("Creando índices espaciales (coordx, coordy) y grid_cell...")
+    create_indexes(engine)
+    print("✓ Índices listos")
+
+    print("Limpiando archivo temporal...")
+    os.remove(local_file)
+    print("✓ Archivo temporal eliminado")
 
-finally:
-    cursor.close()
-    conn.close()
+    print("\nVerificando primeros registros...")
 
-print("Limpiando archivo temporal...")
-os.remove(local_file)
-print("✓ Archivo temporal eliminado")
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT * FROM traffic_data LIMIT 20")).fetchall()
 
-print("\nVerificando primeros registros...")
+        print(f"✓ Primeros {len(rows)} registros:")
+        for r in rows:
+            print(r)
 
-with engine.connect() as conn:
-    rows = conn.execute(text("SELECT * FROM traffic_data LIMIT 20")).fetchall()
+    print("\n=========== FIN ===========")
+    print(f"Registros cargados: {loaded_rows:,}")
+    print("===========================")
 
-    print(f"✓ Primeros {len(rows)} registros:")
-    for r in rows:
-        print(r)
 
-print("\n=========== FIN ===========")
-print(f"Registros cargados: {len(df):,}")
-print("===========================")
+if __name__ == "__main__":
+    main()